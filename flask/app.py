@@ -13,13 +13,11 @@ from flask import Flask, request, jsonify, current_app
 from flask_cors import CORS
 from gevent.pywsgi import WSGIServer
 from configparser import ConfigParser
-from objects import OllamaQueryHandler
-from sentence_transformers import SentenceTransformer
+from objects import OllamaQueryHandler, OllamaClientPool, IndexingJobManager, FileMetadataDatabase, EmbeddingModelRegistry, QueryEmbeddingCache, SearchResultCache, CrossEncoderReranker, SummaryPrecomputer
 
 from ollama import ResponseError as OllamaResponseError
-from ollama import Client as OllamaClient
 
-from blueprints import fs_bp, ai_bp
+from blueprints import fs_bp, ai_bp, idx_bp
 
 
 # --- Flask init --- #
@@ -33,35 +31,139 @@ config.read('config/config.conf')
 # Add the config vars to the app so they can be accessed in the blueprints
 app.OLLAMA_URL = config['ollama']['OLLAMA_URL']                     # URL for the Ollama model
 app.MODEL_ID = config['ollama']['OLLAMA_MODEL']                     # Ollama model name
-app.EMBEDDING_DIM = int(config['index']['EMBEDDING_DIM'].strip())   # Embedding dim for index
-app.INDEX_BIN_PATH = config['paths']['INDEX_BIN_PATH']              # Faiss index binary
+app.INDEX_BIN_PATH = config['paths']['INDEX_BIN_PATH']              # Faiss index binary (each embedding model's index is saved next to it)
 app.METADATA_DB_PATH = config['paths']['METADATA_DB_PATH']          # SQLite DB with file metadata
 app.K = int(config['index']['K'].strip())                           # Pick top K matched files for querying 
+app.STORAGE_DTYPE = config['index']['STORAGE_DTYPE'].strip()        # Precision of the embeddings stored in the DB
+app.INDEX_TYPE = config['index']['INDEX_TYPE'].strip()              # Faiss index type (flat, fp16, sq8 or sq4)
+app.LEXICAL_CANDIDATES = int(config['search']['LEXICAL_CANDIDATES'])        # Full text search candidates fused with the vector search (0 disables)
+app.RRF_K = int(config['search']['RRF_K'])                                  # Reciprocal rank fusion constant
+app.PREFILTER_MIN_FILES = int(config['search']['PREFILTER_MIN_FILES'])      # Index size from which the full text search prefilters the vector search
+app.BATCH_MAX_QUERIES = int(config['search']['BATCH_MAX_QUERIES'])          # Max queries per /search-files/batch request
+app.BATCH_MAX_RANKED_QUERIES = int(config['search']['BATCH_MAX_RANKED_QUERIES'])    # Max queries of a /search-files/batch request ranked by Ollama (more are retrieval only)
+app.PASSAGE_CANDIDATES = int(config['search']['PASSAGE_CANDIDATES'])        # Nearest passages searched per query
+app.PASSAGES_PER_FILE = int(config['search']['PASSAGES_PER_FILE'])          # Best passages returned per file (and sent to the LLM)
+app.MAX_K = int(config['search']['MAX_K'])                                  # Max files ranked when K grows for close scores
+app.MAX_DISTANCE = float(config['search']['MAX_DISTANCE'])                  # Hits further than this from the query are dropped (0 disables)
+app.RELATIVE_MARGIN = float(config['search']['RELATIVE_MARGIN'])            # Hits further than this beyond the nearest hit are dropped (0 disables)
+app.EXPAND_MARGIN = float(config['search']['EXPAND_MARGIN'])                # K grows while the next hit is within this of the K-th (0 disables)
+app.SKIP_RERANK_MARGIN = float(config['search']['SKIP_RERANK_MARGIN'])      # Reranking is skipped if the top hit leads by this (0 disables)
+app.RERANK_MODE = config['search']['RERANK_MODE'].strip()                   # How the hits are ranked (none, cross-encoder, llm or cross-encoder+llm)
+app.SUMMARY_MAX_LENGTH = int(config['summaries']['MAX_LENGTH'])             # Default max tokens of a /summarize-document summary
+app.SUMMARY_OVERLAP = int(config['summaries']['OVERLAP'])                   # Default overlap (tokens) of the chunks that are summarized
 
 # Init a db connection to the file metadata db and add to the app
 app.db_conn = sql.connect(config['paths']['METADATA_DB_PATH'])
 app.db_cursor = app.db_conn.cursor()
 
-# Init an ollama query handler and add to the app
+# Init the file metadata db wrapper (creates any missing tables) and add to the app
+app.file_metadata_db = FileMetadataDatabase(config['paths']['METADATA_DB_PATH'])
+
+# Init an ollama query handler (on a pool of keep-alive connections with deadlines, retries and per model concurrency limits)
+# and add to the app
 app.ollama_query_handler = OllamaQueryHandler(
-    OllamaClient(host=config['ollama']['OLLAMA_URL']),
-    app.MODEL_ID
+    OllamaClientPool(
+        config['ollama']['OLLAMA_URL'],
+        timeout_seconds=float(config['ollama']['TIMEOUT_SECONDS']),
+        max_concurrency=int(config['ollama']['MAX_CONCURRENCY']),
+        max_retries=int(config['ollama']['MAX_RETRIES']),
+        backoff_seconds=float(config['ollama']['BACKOFF_SECONDS']),
+        max_workers=int(config['ollama']['POOL_WORKERS'])
+    ),
+    app.MODEL_ID,
+    summary_workers=int(config['ollama']['SUMMARY_WORKERS']),
+    summary_fan_in=int(config['ollama']['SUMMARY_FAN_IN']),
+    context_tokens=int(config['ollama']['CONTEXT_TOKENS']),
+    confidence_output=config['ollama']['CONFIDENCE_OUTPUT'].strip(),
+    keep_alive=config['ollama']['KEEP_ALIVE'].strip()
+)
+
+# Init the registry of embedding models and add to the app. Models are used through the shared embedding service if enabled (see 
+# scripts/embedding_service.py), else loaded in this process (with the configured inference backend)
+app.embedding_models = EmbeddingModelRegistry.from_config(config)
+
+# Init the cache of query embeddings (so repeated searches skip the model) and add to the app
+app.query_embedding_cache = QueryEmbeddingCache(
+    max_size=int(config['search']['QUERY_CACHE_SIZE']),
+    ttl_seconds=float(config['search']['QUERY_CACHE_TTL_SECONDS'])
 )
 
-# Init a sentence transformer model and add to the app
-app.sentence_transformer_model = SentenceTransformer('all-MiniLM-L6-v2')  
+# Init the cache of /search-files results (invalidated by index publishes and file changes) and add to the app
+app.search_result_cache = SearchResultCache(max_size=int(config['search']['RESULT_CACHE_SIZE']))
+
+# Init the cross-encoder that reranks the search hits (only loaded if the rerank mode uses it) and add to the app
+if app.RERANK_MODE not in CrossEncoderReranker.MODES: 
+    print(f'\033[91mERROR in app.py: \033[0minvalid [search] RERANK_MODE "{app.RERANK_MODE}". Must be one of {CrossEncoderReranker.MODES}.')
+    quit()
+app.reranker = CrossEncoderReranker(
+    model_name=config['search']['RERANK_MODEL'].strip(),
+    max_chars=int(config['search']['RERANK_MAX_CHARS']),
+    num_threads=int(config['embedding']['NUM_THREADS'])
+) if app.RERANK_MODE.startswith('cross-encoder') else None
+
+# Check what the Ollama model generates when it ranks the hits
+if app.ollama_query_handler.confidence_output not in OllamaQueryHandler.CONFIDENCE_OUTPUTS: 
+    print(f'\033[91mERROR in app.py: \033[0minvalid [ollama] CONFIDENCE_OUTPUT "{app.ollama_query_handler.confidence_output}". Must be one of {OllamaQueryHandler.CONFIDENCE_OUTPUTS}.')
+    quit()
+
+# Init the background summarizer (precomputes the summaries of the most opened and newest documents while the machine is idle) 
+# and add to the app 
+app.summary_precomputer = SummaryPrecomputer(
+    app.ollama_query_handler,
+    app.METADATA_DB_PATH,
+    max_length=app.SUMMARY_MAX_LENGTH,
+    overlap=app.SUMMARY_OVERLAP,
+    idle_seconds=float(config['summaries']['IDLE_SECONDS']),
+    check_seconds=float(config['summaries']['CHECK_SECONDS']),
+    max_load=float(config['summaries']['MAX_LOAD']),
+    prune_days=float(config['summaries']['PRUNE_DAYS'])
+)
+
+# Init a manager for background indexing jobs (shares the embedding models) and add to the app
+app.indexing_job_manager = IndexingJobManager(
+    app.METADATA_DB_PATH,
+    app.INDEX_BIN_PATH,
+    app.embedding_models,
+    max_workers=int(config['jobs']['MAX_WORKERS']),
+    crawl_weights={
+        'recency_half_life_days': float(config['crawl']['RECENCY_HALF_LIFE_DAYS']),
+        'search_weight': float(config['crawl']['SEARCH_WEIGHT']),
+        'pin_weight': float(config['crawl']['PIN_WEIGHT'])
+    },
+    index_options={
+        'storage_dtype': app.STORAGE_DTYPE,
+        'index_type': app.INDEX_TYPE
+    }
+)
+
+
+# --- Load the active embedding model --- # 
+try: 
+    active_model_id, active_model = app.embedding_models.active(app.file_metadata_db)
+    print(f'\n\033[93mNOTICE: \033[0mactive embedding model: "{active_model_id}" ({active_model.name}, {active_model.get_sentence_embedding_dimension()} dims).')
+
+# Connection error means that the embedding service is not running
+except ConnectionError as e: 
+    print(f'\033[91mERROR in app.py: \033[0merror connecting to the embedding service. Is it running (expecting socket: "{config["embedding"]["SERVICE_SOCKET"]}")?')
+    print(e) 
+    quit()
+    
+# Key error means that the DB's active model was removed from the registry
+except KeyError as e: 
+    print(f'\033[91mERROR in app.py: \033[0mthe DB\'s active embedding model is not configured. Add it back to "[models]" in config.conf.')
+    print(e) 
+    quit()
 
 
 # --- Test the ollama client --- # 
 print('\n\033[93mNOTICE: \033[0mtesting Ollama client with question: "What is the capital of France?"')
 
 try: 
-    response = app.ollama_query_handler.generate(
-        model=app.MODEL_ID, 
+    response:str = app.ollama_query_handler.generate(
         prompt='What is the capital of France?'
     )
 
-    print('\033[93mNOTICE: \033[0mOllama response:', response['response'])
+    print('\033[93mNOTICE: \033[0mOllama response:', response)
 
 # Handle exceptions
 # Ollama response error most likely means the proper model is not pulled
@@ -82,8 +184,18 @@ except Exception as e:
     print(e) 
     quit()
 
-# Ollama test complete
+# Ollama test complete (the test loaded the model, so its timings show the cold start)
 print('\033[92mSUCCESS: \033[0mOllama client connected successfully.')
+print(f'\033[93mNOTICE: \033[0mOllama model load took {app.ollama_query_handler.timings[-1]["load_ms"]} ms (time to first token: {app.ollama_query_handler.timings[-1]["ttft_ms"]} ms).')
+
+# Keep the model loaded between sparse requests (if enabled)
+if float(config['ollama']['KEEP_WARM_SECONDS']) > 0: app.ollama_query_handler.start_keep_warm(float(config['ollama']['KEEP_WARM_SECONDS']))
+
+# Prune the stored summaries of files that are no longer indexed (if enabled; the precomputer also prunes them while idle)
+if app.summary_precomputer.prune_days: app.file_metadata_db.prune_summaries(app.summary_precomputer.prune_days)
+
+# Start precomputing summaries (if enabled)
+if config['summaries'].getboolean('PRECOMPUTE'): app.summary_precomputer.start()
 
 
 # --- Log incoming requests --- #
@@ -91,6 +203,9 @@ print('\033[92mSUCCESS: \033[0mOllama client connected successfully.')
 def before_request(): 
     print(f'\n\033[94mINCOMING REQUEST: \n\n\033[0m\tMethod: {request.method}\n\tPath: {request.path}\n')
     
+    # Postpone the summary precomputation while the app is in use
+    app.summary_precomputer.touch()
+    
 
 # --- Endpoints and Blueprints --- # 
 # Index endpoint 
@@ -100,6 +215,7 @@ def index(): return jsonify({"status": "OK", "model": current_app.MODEL_ID})
 # Blueprints
 app.register_blueprint(fs_bp)     # Filesystem blueprint
 app.register_blueprint(ai_bp)     # AI Assistant blueprint
+app.register_blueprint(idx_bp)    # Indexing jobs blueprint
 
 
 # --- Run --- #
@@ -1,2 +1,3 @@
 from .ai_assistant_bp import ai_bp
-from .filesystem_bp import fs_bp
\ No newline at end of file
+from .filesystem_bp import fs_bp
+from .indexing_bp import idx_bp
\ No newline at end of file
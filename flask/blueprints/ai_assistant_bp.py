@@ -4,15 +4,142 @@ import os
 import json 
 import sqlite3 as sql
 
-from utils import extract_json, read_file, search_files, tokenize_no_stopwords
-from objects import OllamaQueryHandler
+from utils import print_log, read_file, tokenize_no_stopwords, index_version, parse_search_filters, passage_index_path, DIGEST_TOKENS
+from utils import search_files as search_index, search_files_batch, select_hits, top_hit_dominates
+from objects import OllamaQueryHandler, EmbeddingModelRegistry, SearchResultCache
 import faiss 
 
+from ollama import ResponseError as OllamaResponseError
+
 
 # --- Config --- #
 # Init blueprint
 ai_bp:Blueprint = Blueprint('ai_bp', __name__)
 
+# Errors raised when a request to Ollama fails (see OllamaClientPool): it can't be reached, returns an error or misses its deadline
+OLLAMA_ERRORS:tuple[type[Exception], ...] = (requests.RequestException, OllamaResponseError, ConnectionError, TimeoutError)
+
+
+# --- Helpers --- # 
+
+def rank_hits(user_query:str, hits:list[dict]) -> dict: 
+    """Ranks the given search hits (files) for the given query as set by [search] RERANK_MODE and returns the /search-files 
+    response. Nothing is reranked if the top hit is ahead of the rest by a clear margin ([search] SKIP_RERANK_MARGIN): it is 
+    the top match as it is. If Ollama's response can't be used, the hits keep the order they had (see ask_ollama()). Raises 
+    one of OLLAMA_ERRORS if the request to Ollama fails."""
+    
+    # Ranking would not change the top match
+    rerank_mode:str = current_app.RERANK_MODE
+    if rerank_mode == 'none' or top_hit_dominates(hits, current_app.SKIP_RERANK_MARGIN): 
+        return ranking_response(hits, 'retrieval')
+    
+    # Have Ollama rank them (with confidences only, or explained too, as set by [ollama] CONFIDENCE_OUTPUT)
+    if rerank_mode == 'llm': 
+        ollama_response, error = ask_ollama(user_query, hits)
+        return ranking_response(hits, 'llm', ollama_response) if ollama_response else ranking_response(hits, 'retrieval', ranking_error=error)
+        
+    # Have the cross-encoder rank them (scoring all the passages in one batch)
+    hits = current_app.reranker.rerank(user_query, hits, [documents for documents, _ in hit_documents(hits)])
+    if rerank_mode == 'cross-encoder': 
+        return ranking_response(hits, 'cross-encoder')
+    
+    # ...and have Ollama explain the top match only
+    ollama_response, error = ask_ollama(user_query, hits[:1], output='explained')
+    return ranking_response(hits, 'cross-encoder', ollama_response, ranking_error=error)
+
+
+def select_top_hits(hits:list[dict]) -> list[dict]: 
+    """Returns the search hits worth ranking (see utils.select_hits()) according to the [search] thresholds."""
+    return select_hits(hits, current_app.K, current_app.MAX_DISTANCE, current_app.RELATIVE_MARGIN, current_app.EXPAND_MARGIN)
+
+
+def hit_documents(hits:list[dict]) -> list[tuple[list[str], int|None]]: 
+    """Returns the content of each of the given search hits (files) to rank them by: the passages of the file that matched the 
+    query, or the file's stored digest (see utils.file_digest()) if none did, with the digest's token count (None for passages). 
+    The digests are looked up in one query, so the files aren't read; only files indexed before digests existed are."""
+    
+    # Get the digests of the hits without passages
+    digests:dict[int, tuple[str, int]] = current_app.file_metadata_db.get_file_digests([hit['id'] for hit in hits if not hit.get('passages')])
+    
+    # Get the content of each hit 
+    documents:list[tuple[list[str], int|None]] = []
+    for hit in hits: 
+        if hit.get('passages'): documents.append(([passage['text'] for passage in hit['passages']], None))
+        elif hit['id'] in digests: documents.append(([digests[hit['id']][0]], digests[hit['id']][1]))
+        else: documents.append(([read_file(hit['path'])], None))
+    return documents
+
+
+def ask_ollama(user_query:str, hits:list[dict], output:str|None=None) -> tuple[dict, str|None]: 
+    """Has the Ollama model score how well each of the given search hits (files) matches the given query, and returns its 
+    response as { file_path : {"confidence", "context"} } ("context" is None unless [output], which defaults to [ollama] 
+    CONFIDENCE_OUTPUT, is "explained") with None, or an empty response and the reason if it can't be used (it doesn't follow 
+    the schema or has no results). Raises one of OLLAMA_ERRORS if the request to Ollama fails."""
+    
+    # Get the content of each of the files as a dict of { filename : file_content } (it is trimmed to its share of the prompt, 
+    # unless it is a digest that is known to be short enough). The hits are best first, so the better ones get bigger shares
+    documents:list[tuple[list[str], int|None]] = hit_documents(hits)
+    documents_dict:dict[str,str] = {hit['path'] : '\n...\n'.join(texts) for hit, (texts, _) in zip(hits, documents)}
+    token_counts:dict[str,int] = {hit['path'] : token_count for hit, (_, token_count) in zip(hits, documents) if token_count is not None}
+    
+    # Get the OllamaQueryHandler from the current app
+    ollama_query_handler:OllamaQueryHandler = current_app.ollama_query_handler
+
+    # Get the confidences (the response is constrained to a JSON schema, so it is parsed as it is)
+    try: 
+        ollama_response:dict = ollama_query_handler.get_confidence(
+            user_query,
+            documents_dict,
+            first_n_toks=DIGEST_TOKENS,
+            token_counts=token_counts,
+            relevance={hit['path'] : 1 / (rank + 1) for rank, hit in enumerate(hits)},
+            output=output
+        )
+    
+    # The response (or the prompt) can't be used: keep the ranking without it 
+    except ValueError as e: 
+        print_log('WARN', 'ask_ollama()', f'Not using the Ollama ranking: {e}')
+        return {}, str(e)
+    
+    # Return the confidences
+    if not ollama_response: return {}, 'Ollama returned no results.'
+    return ollama_response, None
+
+
+def ranking_response(hits:list[dict], ranked_by:str, ollama_response:dict|None=None, ranking_error:str|None=None) -> dict: 
+    """Returns the /search-files response for the given hits, ranked (best first) by "retrieval", "cross-encoder" or "llm". 
+    The top match is the file Ollama is most confident in if it ranked the hits, else the first hit (with Ollama's confidence 
+    and context if it scored it; the context of a top match ranked with scores only is given by /explain-match). The 
+    [ranking_error] is why Ollama's response wasn't used, if it wasn't."""
+    
+    # Get the top match 
+    ollama_response = ollama_response or {}
+    top_match:str = hits[0]['path']
+    if ranked_by == 'llm' and ollama_response: 
+        top_match = max(ollama_response, key=lambda k: int(ollama_response[k]["confidence"]))
+    explanation:dict = ollama_response.get(top_match) or {}
+
+    # Return the response json 
+    return {
+        'faiss_top_files': [hit['path'] for hit in hits],
+        'faiss_hits': hits,
+        'ollama_response': ollama_response,
+        'top_match': {
+            'file_path': top_match,
+            'confidence': explanation.get('confidence'),
+            'context': explanation.get('context')
+        },
+        'llm_ranked': ranked_by == 'llm',
+        'ranked_by': ranked_by,
+        'ranking_error': ranking_error
+    }
+
+
+def read_passage_index(index_bin_path:str) -> faiss.IndexIDMap|None: 
+    """Reads the passage index that goes with the given Faiss index, or returns None if there is none (yet)."""
+    path:str = passage_index_path(index_bin_path)
+    return faiss.read_index(path) if os.path.exists(path) else None
+
 
 # --- Endpoints --- # 
 
@@ -146,13 +273,30 @@ def search_files():
         The request body should look like: 
         
         { 
-            "query": "<some query>"
+            "query": "<some query>",
+            "filters": {    <optional, only search the files that match all the given filters>
+                "path_prefix": "<only files under this dir>",
+                "extensions": ["pdf", ...],
+                "min_size": <bytes>,
+                "max_size": <bytes>,
+                "modified_after": "<ISO date/datetime, or seconds since the epoch>",
+                "modified_before": "<ISO date/datetime, or seconds since the epoch>"
+            }
         }
         
     RETURNS: 
-        200 | success | JSON | a JSON obj with three keys: 'faiss_top_files', 'ollama_response', and 'top_match'.
-        400 | bad request | -- | if the user fails to supply a required parameter or the request body is malformed.
+        200 | success | JSON | a JSON obj with four keys: 'faiss_top_files' (the paths of the top files), 'faiss_hits' (the 
+                               "id", "path", "name", "size", "sha256", "distance", hybrid "score" and best matching "passages" (with 
+                               their "start"/"end" offsets into the file's text) of each top file, plus its "rerank_score" if the 
+                               cross-encoder ranked them), 'ollama_response', 'top_match', 'ranked_by' ("retrieval", 
+                               "cross-encoder" or "llm", see RERANK_MODE; "retrieval" if the top hit led by a clear margin) 
+                               'llm_ranked' (whether Ollama picked the top match) and 'ranking_error' (why Ollama's 
+                               response wasn't used, e.g. it didn't follow the schema; then the hits keep their order). 
+                               There are K top files, fewer if the others are too far from the query or more (up to MAX_K) if 
+                               their distances are too close to call (see "[search]" in config.conf).
+        400 | bad request | -- | if the user fails to supply a required parameter, a filter is invalid or the request body is malformed.
         500 | internal server error | -- | if some other error occurs when processing the request.
+        503 | service unavailable | -- | if the index is a scalar quantized index that isn't trained yet (no files were indexed).
 
     """
 
@@ -173,73 +317,269 @@ def search_files():
         return jsonify({
             "error": f"Missing 'query'). Given: {request_json}"
         }), 400
+        
+    # Validate the filters 
+    try: 
+        filters:dict = parse_search_filters(request_json.get('filters') or {})
+    except ValueError as e: 
+        return jsonify({'error': str(e)}), 400
 
     # Use Faiss index to get the top 3 documents that match the query
-    # Load the Faiss index
-    index:faiss.IndexFlatL2 = faiss.read_index(current_app.INDEX_BIN_PATH)
-
-    # Get the top 3 documents
-    top_files:list[str] = search_files(
-        user_query, 
-        current_app.sentence_transformer_model,
-        current_app.EMBEDDING_DIM,
-        index,
-        current_app.db_cursor,
-        top_k=current_app.K
-    )
-
-    # Convert the file names to absolute paths 
-    top_filepaths:list[str] = current_app.db_cursor.execute(
-        f"""
-            SELECT file_path 
-            FROM file_metadata 
-            WHERE file_name IN ({','.join(['%s' for _ in top_files])})
-        """,
-        top_files
-    )
-
-    # Read each of the files into a dict of { filename : file_content }
-    documents_dict:dict[str,str] = {
-        filepath : read_file(filepath) for filepath in top_filepaths
-    }
+    # Get the active embedding model (switches over when a migration cuts over to a new model) and load its Faiss index
+    model_id, model = current_app.embedding_models.active(current_app.file_metadata_db)
+    index_bin_path:str = EmbeddingModelRegistry.index_path(current_app.INDEX_BIN_PATH, model_id)
+    
+    # Return the cached result if the same query was answered from the same index (and none of its files changed since)
+    search_result_cache:SearchResultCache = current_app.search_result_cache
+    cache_key:tuple = SearchResultCache.key(user_query, current_app.K, index_version(index_bin_path), model_id, filters)
+    cached_result:dict|None = search_result_cache.get(cache_key, current_app.file_metadata_db)
+    if cached_result is not None: 
+        current_app.file_metadata_db.record_search_hits(cached_result['faiss_top_files'])
+        return jsonify(cached_result)
+    
+    # Load the index
+    index:faiss.IndexIDMap = faiss.read_index(index_bin_path)
 
+    # Get the top 3 documents (with their paths, in one DB round trip)
+    try: 
+        hits:list[dict] = search_index(
+            user_query, 
+            model,
+            model.get_sentence_embedding_dimension(),
+            index,
+            current_app.db_cursor,
+            top_k=max(current_app.K, current_app.MAX_K),
+            query_cache=current_app.query_embedding_cache,
+            model_id=model_id,
+            lexical_candidates=current_app.LEXICAL_CANDIDATES,
+            rrf_k=current_app.RRF_K,
+            prefilter_min_files=current_app.PREFILTER_MIN_FILES,
+            filters=filters,
+            passage_index=read_passage_index(index_bin_path),
+            passage_candidates=current_app.PASSAGE_CANDIDATES,
+            passages_per_file=current_app.PASSAGES_PER_FILE
+        )
+        
+    # Value error means the index isn't trained yet
+    except ValueError as e: 
+        return jsonify({'error': str(e)}), 503
+    
+    # Keep only the hits worth ranking (top K, fewer if the others are too far from the query, more if they are too close to call)
+    hits = select_top_hits(hits)
+    top_filepaths:list[str] = [hit['path'] for hit in hits]
+    
+    # Nothing to rank if no files match
+    if not hits: 
+        return jsonify({'faiss_top_files': [], 'faiss_hits': [], 'ollama_response': {}, 'top_match': None, 'llm_ranked': False, 'ranked_by': 'retrieval', 'ranking_error': None})
+    
+    # Record the hits so the crawler prioritizes the dirs that are searched the most
+    current_app.file_metadata_db.record_search_hits(top_filepaths)
+    
     # Submit api req to ollama model
     try:
+        response_json:dict = rank_hits(user_query, hits)
         
-        # Get the OllamaQueryHandler from the current app
-        ollama_query_handler:OllamaQueryHandler = current_app.ollama_query_handler
-
-        # Call the generate() method 
-        ollama_raw_response:str = ollama_query_handler.get_confidence(
-            user_query,
-            documents_dict
+        # Cache (dropped when any of the files change from the hashes they were indexed with, and not if Ollama's ranking 
+        # couldn't be used, so it is tried again) and return it
+        if not response_json['ranking_error']: search_result_cache.put(cache_key, response_json, {hit['path']: hit['sha256'] for hit in hits})
+        return jsonify(response_json)
+    
+    # Handle errors
+    except OLLAMA_ERRORS as e:
+        return jsonify({"error": f"Request to OLLAMA failed: {str(e)}"}), 500
+    
+    
+@ai_bp.route("/search-files/batch", methods=["POST"])
+def search_files_batch_endpoint():
+    """Endpoint to run many searches at once (e.g. for tagging runs or dedupe checks). The queries are embedded in one batch, 
+    the index is searched for all of them in one call and all the hits are looked up in one DB query. Batch searches are 
+    vector searches (no full text search) and are not recorded as search hits for the crawler. Each query ranked by Ollama is 
+    one more request to the model, so batches of more than [search] BATCH_MAX_RANKED_QUERIES queries are retrieval only.
+    
+    REQ BODY: 
+        The request body should look like: 
+        
+        { 
+            "queries": ["<some query>", ...],
+            "filters": {...},               <optional, same as /search-files; applied to every query>
+            "retrieval_only": <bool, optional, skip the Ollama ranking; defaults to false>
+        }
+        
+    RETURNS: 
+        200 | success | JSON | {"results": [...], "retrieval_only": <bool>} with one result per query, in order, and whether the 
+                               batch was retrieval only (asked for, or forced by the size of the batch). Retrieval only, each 
+                               result has the 'query', 'faiss_top_files' and 'faiss_hits'; otherwise it is the /search-files 
+                               response plus the 'query' (or the 'query' and an 'error' if the request to Ollama failed for it).
+        400 | bad request | -- | if no queries (or too many) are given, a filter is invalid or the request body is malformed.
+        503 | service unavailable | -- | if the index is a scalar quantized index that isn't trained yet (no files were indexed).
+    """
+    
+    # Get the given request body
+    request_json:dict = request.get_json(silent=True) or {}
+    queries:list[str] = request_json.get('queries') or []
+    retrieval_only:bool = bool(request_json.get('retrieval_only', False))
+    
+    # Check the queries 
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q.strip() for q in queries): 
+        return jsonify({'error': "Not provided a list of (non-empty) 'queries'."}), 400
+    if len(queries) > current_app.BATCH_MAX_QUERIES: 
+        return jsonify({'error': f'Too many queries ({len(queries)}). At most {current_app.BATCH_MAX_QUERIES} per batch.'}), 400
+    
+    # Too many queries to rank them all with Ollama
+    if not retrieval_only and len(queries) > current_app.BATCH_MAX_RANKED_QUERIES: 
+        print_log('WARN', 'search_files_batch_endpoint()', f'{len(queries)} queries is more than {current_app.BATCH_MAX_RANKED_QUERIES} to rank; running retrieval only.')
+        retrieval_only = True
+    
+    # Validate the filters 
+    try: 
+        filters:dict = parse_search_filters(request_json.get('filters') or {})
+    except ValueError as e: 
+        return jsonify({'error': str(e)}), 400
+    
+    # Get the active embedding model and its index
+    model_id, model = current_app.embedding_models.active(current_app.file_metadata_db)
+    index_bin_path:str = EmbeddingModelRegistry.index_path(current_app.INDEX_BIN_PATH, model_id)
+    
+    # Get the cached results of the full searches (retrieval alone is cheap, so it isn't cached)
+    search_result_cache:SearchResultCache = current_app.search_result_cache
+    cache_keys:list[tuple] = [SearchResultCache.key(query, current_app.K, index_version(index_bin_path), model_id, filters) for query in queries]
+    results:list[dict|None] = [None] * len(queries)
+    if not retrieval_only: 
+        for i, cache_key in enumerate(cache_keys): 
+            cached_result:dict|None = search_result_cache.get(cache_key, current_app.file_metadata_db)
+            if cached_result is not None: results[i] = {'query': queries[i], **cached_result}
+            
+    # Every result was cached
+    pending:list[int] = [i for i, result in enumerate(results) if result is None]
+    if not pending: return jsonify({'results': results, 'retrieval_only': retrieval_only})
+    
+    # Search for the rest at once (a value error means the index isn't trained yet)
+    try: 
+        all_hits:list[list[dict]] = search_files_batch(
+            [queries[i] for i in pending],
+            model,
+            model.get_sentence_embedding_dimension(),
+            faiss.read_index(index_bin_path),
+            current_app.db_cursor,
+            top_k=max(current_app.K, current_app.MAX_K),
+            query_cache=current_app.query_embedding_cache,
+            model_id=model_id,
+            filters=filters,
+            passage_index=read_passage_index(index_bin_path),
+            passage_candidates=current_app.PASSAGE_CANDIDATES,
+            passages_per_file=current_app.PASSAGES_PER_FILE
         )
+    except ValueError as e: 
+        return jsonify({'error': str(e)}), 503
+    
+    # Build each result
+    for i, hits in zip(pending, all_hits): 
+        
+        # Retrieval only (or nothing to rank)
+        hits = select_top_hits(hits)
+        if retrieval_only or not hits: 
+            results[i] = {'query': queries[i], 'faiss_top_files': [hit['path'] for hit in hits], 'faiss_hits': hits}
+            if not retrieval_only: results[i].update({'ollama_response': {}, 'top_match': None, 'llm_ranked': False, 'ranked_by': 'retrieval', 'ranking_error': None})
+            continue
+        
+        # Rank (as set by RERANK_MODE, unless the top hit dominates) and cache the result
+        try: 
+            response_json:dict = rank_hits(queries[i], hits)
+            if not response_json['ranking_error']: search_result_cache.put(cache_keys[i], response_json, {hit['path']: hit['sha256'] for hit in hits})
+            results[i] = {'query': queries[i], **response_json}
+        except OLLAMA_ERRORS as e: 
+            results[i] = {'query': queries[i], 'error': f'Request to OLLAMA failed: {str(e)}'}
+            
+    # Return the results
+    return jsonify({'results': results, 'retrieval_only': retrieval_only})
+    
 
-        # Extract the json from the response's response 
-        ollama_result_json:dict = extract_json(ollama_raw_response)
+@ai_bp.route('/search-cache', methods=['GET'])
+def search_cache_stats(): 
+    """Returns the size and hit/miss counters of the query embedding cache and of the search result cache."""
+    return jsonify({
+        'query_embeddings': current_app.query_embedding_cache.stats(),
+        'results': current_app.search_result_cache.stats()
+    })
+    
 
-        # Get the top match according to ollama
-        top_match:str = max(ollama_result_json, key=lambda k: int(ollama_result_json[k]["confidence"]))
+@ai_bp.route('/ollama-stats', methods=['GET'])
+def ollama_stats(): 
+    """Returns the keep alive and the time to first token of the latest Ollama requests (see OllamaQueryHandler.stats()), and 
+    the request counters of the Ollama client (see OllamaClientPool.stats())."""
+    ollama_client = current_app.ollama_query_handler.ollama_client
+    return jsonify({
+        'model': current_app.ollama_query_handler.stats(),
+        'client': ollama_client.stats() if hasattr(ollama_client, 'stats') else None
+    })
+    
 
-        # Return the response json 
-        return jsonify({
-            'faiss_top_files': top_filepaths,
-            'ollama_response': ollama_result_json,
-            'top_match': {
-                'file_path': top_match,
-                'confidence': ollama_result_json[top_match]['confidence'],
-                'context': ollama_result_json[top_match]['context']
-            }
-        })
+@ai_bp.route('/explain-match', methods=['POST'])
+def explain_match(): 
+    """Has the Ollama model explain why the given file matches the given query (e.g. the top match of a /search-files ranked 
+    with confidences only, see [ollama] CONFIDENCE_OUTPUT), so the explanation is only generated when it is shown. The file's 
+    stored digest is explained if it has one (see utils.file_digest()), else its text.
     
-    # Handle errors
-    except requests.RequestException as e:
+    REQ BODY: 
+        { 
+            "query": "<the search query>",
+            "filepath": "<absolute path of the file>"
+        }
+        
+    RETURNS: 
+        200 | success | JSON | the 'file_path' and the 'context' (1-2 sentences about why the file matches the query).
+        400 | bad request | -- | if no query or filepath is given or the file type is not supported.
+        404 | not found | -- | if the file does not exist.
+        500 | internal server error | -- | if the request to Ollama fails.
+    """
+    
+    # Get the given request body
+    request_json:dict = request.get_json(silent=True) or {}
+    user_query:str = request_json.get('query', '')
+    abs_filepath:str = request_json.get('filepath', '')
+    
+    # Check the request
+    if not user_query or not abs_filepath: 
+        return jsonify({'error': "Not provided a 'query' and a 'filepath'."}), 400
+    if not os.path.exists(abs_filepath): 
+        return jsonify({'error': f'The given filepath "{abs_filepath}" does not exist.'}), 404
+    
+    # Get the file's digest (or its text if it has none)
+    entry:dict|None = current_app.file_metadata_db.check_file_exists(abs_filepath)
+    digests:dict[int, tuple[str, int]] = current_app.file_metadata_db.get_file_digests([entry['id']]) if entry else {}
+    try: 
+        text:str = digests[entry['id']][0] if entry and entry['id'] in digests else read_file(abs_filepath)
+    except ValueError: 
+        return jsonify({'error': f'Given file "{abs_filepath}" is not a supported file type. Accepted types are: PDF, TXT, DOCX.'}), 400
+    
+    # Have Ollama explain it
+    try: 
+        context:str = current_app.ollama_query_handler.explain_match(user_query, abs_filepath, text, first_n_toks=DIGEST_TOKENS)
+    except OLLAMA_ERRORS as e: 
         return jsonify({"error": f"Request to OLLAMA failed: {str(e)}"}), 500
     
+    # Return the explanation
+    return jsonify({'file_path': abs_filepath, 'context': context})
+
 
 @ai_bp.route('/summarize-document', methods=['POST']) 
 def summarize_document(): 
-    """Passes the given document to the ollama model to summarize."""
+    """Passes the given document to the ollama model to summarize. Summaries are stored, so a document that was summarized (or 
+    precomputed, see SummaryPrecomputer) with the same settings before, and hasn't changed since, is served from the DB.
+    
+    REQ BODY: 
+        { 
+            "filepath": "<absolute path of the document>",
+            "max_length": <int, optional, max tokens of the summary; defaults to [summaries] MAX_LENGTH>,
+            "overlap": <int, optional, overlap (tokens) of the chunks; defaults to [summaries] OVERLAP>
+        }
+        
+    RETURNS: 
+        200 | success | JSON | the 'summary', the 'file_path' and 'cached' (whether the summary was stored already).
+        400 | bad request | -- | if no filepath is given, the file type is not supported, or the max_length (at least 1) or overlap 
+                                 (at least 0 and less than OllamaQueryHandler.SUMMARY_CHUNK_TOKENS) is invalid.
+        404 | not found | -- | if the file does not exist.
+    """
 
     # Get the given request body
     request_json:dict = request.get_json()
@@ -259,18 +599,30 @@ def summarize_document():
             'error': f'The given filepath "{abs_filepath}" does not exist.'
         }), 404
         
-    # Get the other details from the request as provided
-    max_length:int = request_json.get('max_length', 500)
-    overlap:int = request_json.get('overlap', 100)
+    # Get the other details from the request as provided, and check them
+    max_length:int|None = request_json.get('max_length', current_app.SUMMARY_MAX_LENGTH)
+    overlap:int|None = request_json.get('overlap', current_app.SUMMARY_OVERLAP)
+    if not isinstance(max_length, int) or isinstance(max_length, bool) or max_length < 1: 
+        return jsonify({
+            'error': f"Invalid 'max_length' {max_length!r}. Must be an integer of at least 1."
+        }), 400
+    if not isinstance(overlap, int) or isinstance(overlap, bool) or not 0 <= overlap < OllamaQueryHandler.SUMMARY_CHUNK_TOKENS: 
+        return jsonify({
+            'error': f"Invalid 'overlap' {overlap!r}. Must be an integer from 0 to {OllamaQueryHandler.SUMMARY_CHUNK_TOKENS - 1}."
+        }), 400
     
     # Get the OllamaQueryHandler from the current app
     ollama_query_handler:OllamaQueryHandler = current_app.ollama_query_handler
     
-    # Summarize the given text
+    # Record the open, so the summaries of the most opened documents are precomputed
+    current_app.file_metadata_db.record_file_open(abs_filepath)
+    
+    # Summarize the given text (or get its stored summary)
     try: 
-        summary:str = ollama_query_handler.recursive_summarize_text(
-            read_file(abs_filepath),
-            max_summary_len=max_length,
+        summary, cached = ollama_query_handler.summarize_file(
+            abs_filepath,
+            current_app.file_metadata_db,
+            max_length=max_length,
             overlap=overlap
         )
         
@@ -284,7 +636,8 @@ def summarize_document():
     return jsonify({
         'status': 200,
         'summary': summary,
-        'file_path': abs_filepath
+        'file_path': abs_filepath,
+        'cached': cached
     })
     
     
@@ -0,0 +1,186 @@
+from flask import Blueprint, jsonify, request, current_app 
+import os 
+
+from objects import IndexingJobManager, IndexingJob, FileMetadataDatabase
+
+
+# --- Config --- #
+# Init blueprint
+idx_bp:Blueprint = Blueprint('idx_bp', __name__)
+
+
+# --- Endpoints --- # 
+
+@idx_bp.route('/indexing-jobs', methods=['POST'])
+def start_indexing_job(): 
+    """Starts a background job that indexes the given root directory. 
+    
+    REQ BODY: 
+        The request body should look like: 
+        
+        { 
+            "root": "<absolute path of the dir to index>",
+            "overwrite": <bool, optional, defaults to false>,
+            "max_files": <int, optional, max files to index in this job; 0 (default) means no limit>,
+            "max_seconds": <number, optional, max time to index for in this job; 0 (default) means no limit>
+        }
+        
+        If a job runs out of budget, the next job for the same root resumes where it stopped.
+        
+    RETURNS: 
+        202 | accepted | JSON | the new job (see GET /indexing-jobs/<job_id>).
+        400 | bad request | -- | if the root is not given, overwrite isn't a bool, or max_files (integer) or max_seconds (number) 
+                                  is negative or of the wrong type.
+        404 | not found | -- | if the given root is not a directory.
+    """
+    
+    # Get the given request body
+    request_json:dict = request.get_json(silent=True) or {}
+    root:str = request_json.get('root', '')
+    
+    # Check that a root was given 
+    if not root: 
+        return jsonify({'error': 'Not provided a root.'}), 400
+        
+    # Check that the root is a dir
+    if not os.path.isdir(root): 
+        return jsonify({'error': f'The given root "{root}" is not a directory.'}), 404
+    
+    # Get the other details from the request as provided, and check them
+    overwrite:bool = request_json.get('overwrite', False)
+    max_files:int = request_json.get('max_files', 0)
+    max_seconds:float = request_json.get('max_seconds', 0)
+    if not isinstance(overwrite, bool): 
+        return jsonify({
+            'error': f"Invalid 'overwrite' {overwrite!r}. Must be true or false."
+        }), 400
+    if not isinstance(max_files, int) or isinstance(max_files, bool) or max_files < 0: 
+        return jsonify({
+            'error': f"Invalid 'max_files' {max_files!r}. Must be an integer of at least 0."
+        }), 400
+    if not isinstance(max_seconds, (int, float)) or isinstance(max_seconds, bool) or not 0 <= max_seconds < float('inf'): 
+        return jsonify({
+            'error': f"Invalid 'max_seconds' {max_seconds!r}. Must be a number of at least 0."
+        }), 400
+    
+    # Start the job 
+    job_manager:IndexingJobManager = current_app.indexing_job_manager
+    job:IndexingJob = job_manager.start_job(root, overwrite=overwrite, max_files=max_files, max_seconds=float(max_seconds))
+    
+    # Return the job 
+    return jsonify(job.to_dict()), 202
+    
+
+@idx_bp.route('/indexing-jobs', methods=['GET'])
+def list_indexing_jobs(): 
+    """Lists all the indexing jobs (newest first) with their progress."""
+    
+    job_manager:IndexingJobManager = current_app.indexing_job_manager
+    return jsonify({'jobs': [job.to_dict() for job in job_manager.list_jobs()]})
+
+
+@idx_bp.route('/indexing-jobs/<job_id>', methods=['GET'])
+def get_indexing_job(job_id:str): 
+    """Returns the given job with its live progress.
+    
+    RETURNS: 
+        200 | success | JSON | the job's status, counters, files/sec, bytes/sec, queue depths and ETA (seconds).
+        404 | not found | -- | if there is no job with the given id.
+    """
+    
+    # Get the job 
+    job:IndexingJob = current_app.indexing_job_manager.get_job(job_id)
+    
+    # Check the job exists 
+    if job is None: 
+        return jsonify({'error': f'No indexing job with id "{job_id}".'}), 404
+    
+    # Return the job
+    return jsonify(job.to_dict())
+
+
+@idx_bp.route('/indexing-jobs/<job_id>/<action>', methods=['POST'])
+def control_indexing_job(job_id:str, action:str): 
+    """Pauses, resumes or cancels the given job. The action must be one of: "pause", "resume", "cancel".
+    
+    RETURNS: 
+        200 | success | JSON | the updated job.
+        400 | bad request | -- | if the action is unknown.
+        404 | not found | -- | if there is no job with the given id.
+        409 | conflict | -- | if the job is already finished.
+    """
+    
+    # Get the job 
+    job:IndexingJob = current_app.indexing_job_manager.get_job(job_id)
+    
+    # Check the job exists 
+    if job is None: 
+        return jsonify({'error': f'No indexing job with id "{job_id}".'}), 404
+    
+    # Check the job isn't finished
+    if job.done: 
+        return jsonify({'error': f'Indexing job "{job_id}" is already {job.status}.'}), 409
+    
+    # Act according to the action
+    match action: 
+        case 'pause': job.pause()
+        case 'resume': job.resume()
+        case 'cancel': job.cancel()
+        case _: return jsonify({'error': f'Unknown action: {action}'}), 400
+        
+    # Return the updated job
+    return jsonify(job.to_dict())
+
+
+@idx_bp.route('/pinned-paths', methods=['GET'])
+def list_pinned_paths(): 
+    """Lists the pinned directories (these are crawled first)."""
+    
+    file_metadata_db:FileMetadataDatabase = current_app.file_metadata_db
+    return jsonify({'pinned_paths': file_metadata_db.get_pinned_paths()})
+
+
+@idx_bp.route('/pinned-paths', methods=['POST', 'DELETE'])
+def update_pinned_paths(): 
+    """Pins (POST) or unpins (DELETE) the given directory.
+    
+    REQ BODY: 
+        The request body should look like: 
+        
+        { 
+            "path": "<absolute path of the dir>"
+        }
+        
+    RETURNS: 
+        200 | success | JSON | the updated list of pinned directories.
+        400 | bad request | -- | if the path is not given.
+    """
+    
+    # Get the path from the request body
+    path:str = (request.get_json(silent=True) or {}).get('path', '')
+    
+    # Check that a path was given 
+    if not path: 
+        return jsonify({'error': 'Not provided a path.'}), 400
+    
+    # Pin or unpin the path 
+    file_metadata_db:FileMetadataDatabase = current_app.file_metadata_db
+    if request.method == 'POST': file_metadata_db.pin_path(path)
+    else: file_metadata_db.unpin_path(path)
+    
+    # Return the updated list 
+    return jsonify({'pinned_paths': file_metadata_db.get_pinned_paths()})
+
+
+@idx_bp.route('/embedding-models', methods=['GET'])
+def list_embedding_models(): 
+    """Lists the configured embedding models ("[models]" in config.conf) and the models known to the DB, with their status ("active", 
+    "migrating" or "retired"), the number of files embedded by each and the progress of a running migration (see 
+    scripts/migrate_embeddings.py)."""
+    
+    file_metadata_db:FileMetadataDatabase = current_app.file_metadata_db
+    return jsonify({
+        'configured': current_app.embedding_models.models,
+        'default': current_app.embedding_models.default_model_id,
+        'models': file_metadata_db.get_embedding_models()
+    })
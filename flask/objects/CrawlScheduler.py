@@ -0,0 +1,192 @@
+import os
+import math
+import time
+import heapq
+import itertools
+
+from typing import Iterator
+from .FileMetadataDatabase import FileMetadataDatabase
+from utils import normalize_path, SUPPORTED_EXTENSIONS
+
+
+class CrawlScheduler:
+
+    root:str|None                           # The dir that the crawl starts at (None for a scheduler that is only used for scoring)
+    file_metadata_db:FileMetadataDatabase   # DB wrapper (pinned dirs, search hits and the saved frontier)
+    recency_half_life_days:float            # Age (days) at which a dir's recency score halves
+    search_weight:float                     # Weight of log(1 + search hits) in a dir's score
+    pin_weight:float                        # Score bonus for pinned dirs (and the dirs leading to / under them)
+    max_files:int                           # Max files to yield per run (0 means no limit)
+    max_seconds:float                       # Max time (seconds) per run (0 means no limit)
+    frontier:list[tuple[float, int, str]]   # Heap of (-score, seq, dir_path) to crawl next
+    files_crawled:int                       # Files yielded so far in this run
+
+    _pinned:list[str]                       # Normalized pinned dirs
+    _search_hits:dict[str, int]             # Search hits per (normalized) dir
+    _seq:itertools.count                    # Tie breaker so the heap never compares paths
+    _started:float|None                     # Time the current run started
+    _current:tuple[float, int, str]|None    # Heap entry of the dir whose files are being yielded
+    _queued:set[str]                        # Dirs pushed in this run (so no dir is queued twice)
+    _files_done:dict[str, int]              # Files (newest first) of the dirs stopped part way through that were already yielded
+
+
+    def __init__(self, root:str|None, file_metadata_db:FileMetadataDatabase, recency_half_life_days:float=30, search_weight:float=1.0,
+                 pin_weight:float=10.0, max_files:int=0, max_seconds:float=0, resume:bool=True):
+        self.root = root
+        self.file_metadata_db = file_metadata_db
+        self.recency_half_life_days = recency_half_life_days
+        self.search_weight = search_weight
+        self.pin_weight = pin_weight
+        self.max_files = max_files
+        self.max_seconds = max_seconds
+        self.frontier = []
+        self.files_crawled = 0
+
+        self._pinned = file_metadata_db.get_pinned_paths()
+        self._search_hits = file_metadata_db.get_search_hits()
+        self._seq = itertools.count()
+        self._started = None
+        self._current = None
+        self._queued = set()
+        self._files_done = {}
+
+        # Nothing to crawl if only scoring
+        if root is None: return
+
+        # Resume from where the last (budgeted) run stopped, or start from the root
+        saved:list[tuple[float, str, int]] = file_metadata_db.load_crawl_frontier(root) if resume else []
+        if saved:
+            for score, dir_path, files_done in saved: 
+                heapq.heappush(self.frontier, (-score, next(self._seq), dir_path))
+                self._queued.add(dir_path)
+                if files_done: self._files_done[dir_path] = files_done
+        else:
+            self.push(root)
+
+
+    def score(self, dir_path:str, mtime:float) -> float:
+        """Scores the given dir: recently modified, frequently searched and pinned dirs are crawled first.
+
+            Parameters:
+                dir_path (str): the dir to score.
+                mtime (float): the dir's modification time (epoch seconds).
+
+            Returns:
+                float: the score (higher is crawled sooner).
+        """
+
+        # Normalize the path so it matches the stored paths
+        dir_path = normalize_path(dir_path)
+
+        # Recency: 1 for a dir modified just now, halving every [self.recency_half_life_days]
+        age_days:float = max(time.time() - mtime, 0) / 86400
+        recency:float = 0.5 ** (age_days / self.recency_half_life_days)
+
+        # Search frequency (hits are counted for a dir and all its parents, so the crawl is led towards frequently searched dirs)
+        searched:float = self.search_weight * math.log1p(self._search_hits.get(dir_path, 0))
+
+        # Pinned: the dir is pinned, is under a pinned dir, or leads to a pinned dir
+        pinned:float = self.pin_weight if any(
+            p == dir_path or p.startswith(dir_path + '/') or dir_path.startswith(p + '/')
+            for p in self._pinned
+        ) else 0.0
+
+        # Return the total
+        return recency + searched + pinned
+
+
+    def push(self, dir_path:str, mtime:float|None=None) -> None:
+        """Adds the given dir to the frontier (unless it was already queued in this run)."""
+
+        # Skip dirs that were already queued
+        if dir_path in self._queued: return
+        self._queued.add(dir_path)
+
+        # Get the mtime if not given
+        if mtime is None:
+            try: mtime = os.path.getmtime(dir_path)
+            except OSError: return
+
+        # Add to the heap (negated since heapq is a min-heap)
+        heapq.heappush(self.frontier, (-self.score(dir_path, mtime), next(self._seq), dir_path))
+
+
+    def budget_exhausted(self) -> bool:
+        """Returns True if this run has used up its file or time budget."""
+        if self.max_files and self.files_crawled >= self.max_files: return True
+        if self.max_seconds and self._started is not None and time.time() - self._started >= self.max_seconds: return True
+        return False
+
+
+    def crawl(self) -> Iterator[str]:
+        """Yields the supported files under [self.root], highest scoring dirs first (and most recently modified files first within
+        a dir), until the frontier is empty or the budget is used up.
+
+            Returns:
+                Iterator[str]: the paths of the files to index.
+        """
+
+        # Start the clock for the time budget
+        self._started = time.time()
+
+        # Crawl the best dir until none are left (or the budget is used up)
+        while self.frontier:
+            if self.budget_exhausted(): return
+
+            # Pop the best dir
+            self._current = heapq.heappop(self.frontier)
+            neg_score, _, dir_path = self._current
+
+            # List the dir
+            try:
+                entries:list[os.DirEntry] = list(os.scandir(dir_path))
+            except OSError:
+                continue
+
+            # Collect the child dirs and the supported files
+            dirs:list[tuple[float, str]] = []
+            files:list[tuple[float, str]] = []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False): dirs.append((entry.stat().st_mtime, entry.path))
+                    elif entry.name.endswith(SUPPORTED_EXTENSIONS): files.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue
+
+            # Yield the files, newest first, after the ones that an earlier run already yielded
+            files_done:int = self._files_done.get(dir_path, 0)
+            for _, filepath in sorted(files, reverse=True)[files_done:]:
+
+                # Out of budget: put the dir back so the next run lists it again, resumes after the files done and only then 
+                # queues its child dirs (so they aren't crawled twice)
+                if self.budget_exhausted():
+                    heapq.heappush(self.frontier, self._current)
+                    self._current = None
+                    return
+
+                # Yield the file
+                self.files_crawled += 1
+                yield filepath
+
+                # Count the file as done once the next one is asked for (so a file whose crawl was stopped isn't skipped)
+                files_done += 1
+                self._files_done[dir_path] = files_done
+
+            # Done with this dir: queue its child dirs
+            self._files_done.pop(dir_path, None)
+            for mtime, child_path in dirs: self.push(child_path, mtime)
+            self._current = None
+
+
+    def save(self) -> None:
+        """Saves the remaining frontier so that the next run resumes from it (an empty frontier means the crawl finished). If the
+        crawl was stopped part way through a dir, that dir is saved too, with the number of its files that were done."""
+
+        # Include the dir that was being crawled (if any)
+        entries:list[tuple[float, int, str]] = self.frontier + ([self._current] if self._current else [])
+
+        # Save
+        self.file_metadata_db.save_crawl_frontier(
+            self.root,
+            [(-neg_score, dir_path, self._files_done.get(dir_path, 0)) for neg_score, _, dir_path in entries]
+        )
@@ -0,0 +1,142 @@
+import os
+import uuid
+import time
+import socket
+import threading
+
+from .WorkQueue import WorkQueue
+from .FilesystemIndexer import FilesystemIndexer
+from .CrawlScheduler import CrawlScheduler
+from utils import print_log, SUPPORTED_EXTENSIONS
+
+
+class CrawlWorker: 
+
+    worker_id:str                   # Unique id of this worker (host, pid and a random suffix)
+    work_queue:WorkQueue            # Shared queue of directory and file tasks
+    indexer:FilesystemIndexer       # Indexer used to write the file entries (incl. embeddings) to the DB
+    scheduler:CrawlScheduler        # Used to score the queued dirs/files so the most valuable ones are claimed first
+    batch_size:int                  # Number of tasks claimed at a time
+    heartbeat_interval:float        # Time (seconds) between lease heartbeats
+    
+    
+    def __init__(self, work_queue:WorkQueue, indexer:FilesystemIndexer, batch_size:int=8): 
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.work_queue = work_queue
+        self.indexer = indexer
+        self.scheduler = CrawlScheduler(None, indexer.file_metadata_db)
+        self.batch_size = batch_size
+        
+        # Heartbeat well within the lease so a slow file doesn't lose its lease
+        self.heartbeat_interval = work_queue.lease_seconds / 3
+        
+        
+    def run(self, stop_when_drained:bool=True, poll_interval:float=1.0, verbose:bool=False) -> int: 
+        """Claims and processes tasks until the queue is drained (or forever if [stop_when_drained] is False). Directory tasks queue
+        their child dirs and supported files; file tasks write the file's metadata and embedding to the DB. The Faiss index is NOT
+        updated by workers - it is published from the DB once the crawl is done (see FilesystemIndexer.rebuild_index()).
+        
+            Parameters: 
+                stop_when_drained (bool, optional): stop once there are no pending or leased tasks left. Defaults to True.
+                poll_interval (float, optional): time (seconds) to wait when there is nothing to claim. Defaults to 1.0.
+                verbose (bool, optional): optionally print logs.
+                
+            Returns: 
+                int: the number of tasks this worker completed.
+        """
+        
+        # Start heartbeating (on its own thread and connection, since SQLite connections can't be shared between threads)
+        stop_event:threading.Event = threading.Event()
+        heartbeat_thread:threading.Thread = threading.Thread(target=self._heartbeat, args=(stop_event,), daemon=True)
+        heartbeat_thread.start()
+        
+        # Init the counter
+        completed:int = 0
+        
+        try: 
+            while True: 
+                
+                # Claim a batch of tasks
+                tasks:list[tuple[int, str, str]] = self.work_queue.claim(self.worker_id, limit=self.batch_size)
+                
+                # Nothing to claim: stop if the queue is drained (other workers may still queue more tasks), else wait
+                if not tasks: 
+                    if stop_when_drained and self.work_queue.is_drained(): break
+                    time.sleep(poll_interval)
+                    continue
+                
+                # Embed with the new model if a migration cut over since the last batch
+                self.indexer.refresh_model()
+                
+                # Process each task
+                for task_id, task_type, path in tasks: 
+                    try: 
+                        self.process_task(task_type, path, verbose=verbose)
+                        if self.work_queue.complete(task_id, self.worker_id): completed += 1
+                        
+                    # Release the task so it can be retried
+                    except Exception as e: 
+                        print_log('ERROR', 'CrawlWorker.run()', f'Task {task_id} ({task_type} "{path}") failed. Caught exception: {e.__class__} - {e}')
+                        self.work_queue.fail(task_id, self.worker_id, str(e))
+                        
+        # Stop heartbeating
+        finally: 
+            stop_event.set()
+            heartbeat_thread.join()
+            
+        # Info print
+        if verbose: print_log('SUCCESS', 'CrawlWorker.run()', f'Worker {self.worker_id} completed {completed} task(s).')
+            
+        # Return the number of completed tasks
+        return completed
+        
+        
+    def process_task(self, task_type:str, path:str, verbose:bool=False) -> None: 
+        """Processes a single task: lists a directory and queues its children, or indexes a file into the DB."""
+        
+        # Act according to the task type
+        match task_type: 
+            
+            # Directory: queue the child dirs and the supported files (files inherit the dir's score)
+            case 'directory': 
+                
+                # Score the dir 
+                dir_score:float = self.scheduler.score(path, os.path.getmtime(path))
+                
+                # Collect the child tasks
+                tasks:list[tuple[str, str, float]] = []
+                for entry in os.scandir(path): 
+                    try: 
+                        if entry.is_dir(follow_symlinks=False): 
+                            tasks.append(('directory', entry.path, self.scheduler.score(entry.path, entry.stat().st_mtime)))
+                        elif entry.name.endswith(SUPPORTED_EXTENSIONS): 
+                            tasks.append(('file', entry.path, dir_score))
+                    except OSError: 
+                        continue
+                    
+                # Queue them
+                self.work_queue.enqueue(tasks)
+                
+            # File: write the entry (incl. the embedding) to the DB
+            case 'file': 
+                self.indexer.update_file_entry(path, verbose=verbose)
+                
+            # Unknown
+            case _: 
+                raise ValueError(f'Unknown task type "{task_type}".')
+            
+            
+    def _heartbeat(self, stop_event:threading.Event) -> None: 
+        """Extends this worker's leases every [self.heartbeat_interval] seconds until the given event is set."""
+        
+        # Open a separate connection for this thread
+        work_queue:WorkQueue = WorkQueue(
+            self.work_queue.db_path, 
+            lease_seconds=self.work_queue.lease_seconds, 
+            max_attempts=self.work_queue.max_attempts,
+            create_tables_script=self.work_queue.create_tables_script
+        )
+        
+        # Heartbeat until stopped
+        while not stop_event.wait(self.heartbeat_interval): 
+            work_queue.heartbeat(self.worker_id)
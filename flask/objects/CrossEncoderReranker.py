@@ -0,0 +1,78 @@
+import torch
+import numpy as np
+
+from sentence_transformers import CrossEncoder
+
+
+class CrossEncoderReranker:
+    """Reranks search hits with a small cross-encoder run on the CPU: every (query, passage) pair of the hits is scored in one
+    batch, and each hit is scored by its best passage. Much faster than having the LLM rank the hits, so the LLM can be kept for
+    explaining the top match (see "RERANK_MODE" in config.conf)."""
+
+    # Supported rerank modes ([search] RERANK_MODE):
+    #   "none"              - the hits are kept in retrieval order
+    #   "cross-encoder"     - the cross-encoder reranks the hits
+    #   "llm"               - the Ollama model ranks the hits
+    #   "cross-encoder+llm" - the cross-encoder reranks the hits and the Ollama model only explains the top one
+    MODES:tuple[str, ...] = ('none', 'cross-encoder', 'llm', 'cross-encoder+llm')
+
+    model_name:str              # Name of the cross-encoder (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2)
+    max_chars:int               # Max chars of each passage that are scored (the model truncates to its max length anyway)
+    batch_size:int              # Pairs scored per forward pass
+    model:CrossEncoder          # The loaded model
+
+
+    def __init__(self, model_name:str='cross-encoder/ms-marco-MiniLM-L-6-v2', max_chars:int=2000, batch_size:int=32, num_threads:int=0):
+        self.model_name = model_name
+        self.max_chars = max_chars
+        self.batch_size = batch_size
+
+        # Set the number of threads used by torch and load the model
+        if num_threads: torch.set_num_threads(num_threads)
+        self.model = CrossEncoder(model_name, device='cpu')
+
+
+    def score(self, query:str, documents:list[list[str]]) -> list[float]:
+        """
+        Scores how well each of the given documents matches the given query, in one batch.
+
+            Parameters:
+                query (str): the search query.
+                documents (list[list[str]]): the passages of each document (e.g. the passages of a file that matched the query).
+
+            Returns:
+                list[float]: the score of each document (the score of its best passage; higher is better, -inf if it has no text).
+        """
+
+        # Pair the query with every passage of every document
+        pairs:list[tuple[str, str]] = []
+        owners:list[int] = []
+        for i, passages in enumerate(documents):
+            for passage in passages:
+                if not passage.strip(): continue
+                pairs.append((query, passage[:self.max_chars]))
+                owners.append(i)
+
+        # Score all the pairs at once
+        scores:list[float] = [float('-inf')] * len(documents)
+        if not pairs: return scores
+        pair_scores:np.ndarray = np.asarray(self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False), dtype=np.float32).reshape(-1)
+
+        # Keep the best passage score of each document
+        for owner, pair_score in zip(owners, pair_scores):
+            scores[owner] = max(scores[owner], float(pair_score))
+        return scores
+
+
+    def rerank(self, query:str, hits:list[dict], documents:list[list[str]]) -> list[dict]:
+        """Returns the given search hits sorted by how well their documents (the passages of each hit, in the same order) match
+        the given query, best first. Each hit gets a "rerank_score" (None if it has no text); ties keep the retrieval order."""
+
+        # Score the hits
+        scores:list[float] = self.score(query, documents)
+        for hit, score in zip(hits, scores):
+            hit['rerank_score'] = score if score != float('-inf') else None
+
+        # Sort them (stable, so ties keep their retrieval order)
+        order:list[int] = sorted(range(len(hits)), key=lambda i: -scores[i])
+        return [hits[i] for i in order]
@@ -0,0 +1,104 @@
+import os
+import torch
+import numpy as np
+
+from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+
+class EmbeddingBackend:
+
+    # Supported backends:
+    #   "torch"      - the model as published (fp32 PyTorch)
+    #   "torch-int8" - PyTorch with the Linear layers dynamically quantized to int8
+    #   "onnx"       - the model exported to ONNX and run with onnxruntime
+    #   "onnx-int8"  - the ONNX export, dynamically quantized to int8
+    BACKENDS:tuple[str, ...] = ('torch', 'torch-int8', 'onnx', 'onnx-int8')
+
+    model_name:str              # Name of the sentence transformer (e.g. all-MiniLM-L6-v2)
+    backend:str                 # One of BACKENDS
+    num_threads:int             # Number of CPU threads used for inference (0 means the library default)
+    cache_dir:str               # Dir that the ONNX exports are saved in (so they are only exported once)
+    model:SentenceTransformer   # The loaded model
+
+
+    def __init__(self, model_name:str='all-MiniLM-L6-v2', backend:str='torch', num_threads:int=0, cache_dir:str='index/models'):
+
+        # Check that a valid backend is given
+        if backend not in EmbeddingBackend.BACKENDS:
+            raise AttributeError(f'Given backend "{backend}" is not valid. Must be one of {EmbeddingBackend.BACKENDS}.')
+
+        self.model_name = model_name
+        self.backend = backend
+        self.num_threads = num_threads
+        self.cache_dir = cache_dir
+
+        # Set the number of threads used by torch (also used for tokenization/pooling by the ONNX backends)
+        if num_threads: torch.set_num_threads(num_threads)
+
+        # Load the model
+        match backend:
+            case 'torch': self.model = SentenceTransformer(model_name, device='cpu')
+            case 'torch-int8': self.model = self._load_torch_int8()
+            case 'onnx': self.model = self._load_onnx(quantized=False)
+            case 'onnx-int8': self.model = self._load_onnx(quantized=True)
+
+
+    @property
+    def name(self) -> str:
+        """Unique name of this model + backend combination (e.g. "all-MiniLM-L6-v2/onnx-int8")."""
+        return f'{self.model_name}/{self.backend}'
+
+
+    def encode(self, sentences:str|list[str], batch_size:int=32, **kwargs) -> np.ndarray:
+        """Embeds the given sentence(s). Same as SentenceTransformer.encode(): a single string gives a 1D array and a list of strings
+        gives a 2D array (one row per string)."""
+        return self.model.encode(sentences, batch_size=batch_size, **kwargs)
+
+
+    def get_sentence_embedding_dimension(self) -> int:
+        """Returns the number of dimensions of the embeddings."""
+        return self.model.get_sentence_embedding_dimension()
+
+
+    def _load_torch_int8(self) -> SentenceTransformer:
+        """Loads the PyTorch model and dynamically quantizes its Linear layers to int8 (weights are quantized ahead of time,
+        activations on the fly)."""
+
+        # Load the full precision model
+        model:SentenceTransformer = SentenceTransformer(self.model_name, device='cpu')
+
+        # Quantize the Linear layers in place
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+        # Return the model
+        return model
+
+
+    def _load_onnx(self, quantized:bool) -> SentenceTransformer:
+        """Loads the ONNX export of the model from [self.cache_dir], exporting (and optionally quantizing) it first if needed."""
+
+        # Path of the local copy of the model, and the file name of the ONNX model to load from it
+        local_path:str = os.path.join(self.cache_dir, self.model_name.replace('/', '__'))
+        file_name:str = 'onnx/model_qint8_avx2.onnx' if quantized else 'onnx/model.onnx'
+
+        # Export the model (once)
+        if not os.path.exists(os.path.join(local_path, file_name)):
+
+            # Export to ONNX and save locally
+            model:SentenceTransformer = SentenceTransformer(self.model_name, device='cpu', backend='onnx')
+            model.save(local_path)
+
+            # Quantize the export (saved next to it as "onnx/model_qint8_avx2.onnx")
+            if quantized: export_dynamic_quantized_onnx_model(model, 'avx2', local_path)
+
+        # Set the number of threads used by onnxruntime
+        model_kwargs:dict = {'file_name': file_name, 'provider': 'CPUExecutionProvider'}
+        if self.num_threads:
+            import onnxruntime
+            session_options:onnxruntime.SessionOptions = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = self.num_threads
+            session_options.inter_op_num_threads = 1
+            model_kwargs['session_options'] = session_options
+
+        # Load the model
+        return SentenceTransformer(local_path, device='cpu', backend='onnx', model_kwargs=model_kwargs)
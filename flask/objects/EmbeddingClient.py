@@ -0,0 +1,114 @@
+import socket
+import threading
+import numpy as np
+
+from utils import send_message, recv_message
+
+
+class EmbeddingClient:
+    """Thin client for one of the models on the embedding service (see EmbeddingService and scripts/embedding_service.py). Has the 
+    same interface as EmbeddingBackend, so it can be passed anywhere a model is expected without loading a copy of the model in 
+    this process."""
+
+    socket_path:str                 # Path of the service's Unix socket
+    model_id:str                    # Id of the model to use (see EmbeddingModelRegistry)
+    timeout:float                   # Max time (seconds) to wait for a response
+    _local:threading.local          # Each thread keeps its own connection (a connection carries one request at a time)
+    _info:dict|None                 # The service's model info (fetched once)
+
+
+    def __init__(self, socket_path:str, model_id:str, timeout:float=120):
+        self.socket_path = socket_path
+        self.model_id = model_id
+        self.timeout = timeout
+        self._local = threading.local()
+        self._info = None
+
+
+    @property
+    def name(self) -> str:
+        """Name of the model + backend served (e.g. "all-MiniLM-L6-v2/onnx-int8")."""
+        return self.info()['model']
+
+
+    def info(self) -> dict:
+        """Returns the service's model info (model name and embedding dim). Raises a ConnectionError if the service is not running."""
+        if self._info is None: self._info, _ = self._request({'op': 'info', 'model_id': self.model_id})
+        return self._info
+
+
+    def stats(self) -> dict:
+        """Returns the service's current batching stats."""
+        header, _ = self._request({'op': 'stats'})
+        return header
+
+
+    def encode(self, sentences:str|list[str], batch_size:int=32, **kwargs) -> np.ndarray:
+        """Embeds the given sentence(s) on the service. Same as EmbeddingBackend.encode(): a single string gives a 1D array and a list
+        of strings gives a 2D array (one row per string). The batch size and other kwargs are ignored (the service batches requests)."""
+
+        # Wrap a single sentence
+        single:bool = isinstance(sentences, str)
+        texts:list[str] = [sentences] if single else list(sentences)
+
+        # Embed
+        header, payload = self._request({'op': 'encode', 'model_id': self.model_id, 'texts': texts})
+        embeddings:np.ndarray = np.frombuffer(payload, dtype=np.float32).reshape(header['shape']).copy()
+
+        # Return the embedding(s)
+        return embeddings[0] if single else embeddings
+
+
+    def get_sentence_embedding_dimension(self) -> int:
+        """Returns the number of dimensions of the embeddings."""
+        return self.info()['dim']
+
+
+    def close(self) -> None:
+        """Closes this thread's connection (it is reopened on the next request)."""
+        sock:socket.socket|None = getattr(self._local, 'sock', None)
+        if sock is not None: sock.close()
+        self._local.sock = None
+
+
+    def _connect(self) -> socket.socket:
+        """Returns this thread's connection to the service, connecting if needed."""
+        if getattr(self._local, 'sock', None) is None:
+            sock:socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                sock.close()
+                raise ConnectionError(f'Could not connect to the embedding service at "{self.socket_path}". Is it running (scripts/embedding_service.py)?') from e
+            self._local.sock = sock
+        return self._local.sock
+
+
+    def _request(self, request:dict) -> tuple[dict, bytes]:
+        """Sends the given request and returns the response. Reconnects and retries once if the connection was dropped (e.g. the
+        service was restarted). Raises a RuntimeError if the service returns an error."""
+
+        # Send the request (retrying once on a fresh connection)
+        for attempt in range(2):
+            sock:socket.socket = self._connect()
+            try:
+                send_message(sock, request)
+                response:tuple[dict, bytes]|None = recv_message(sock)
+                if response is None: raise ConnectionError('Connection closed by the embedding service.')
+                break
+
+            # Don't retry a request that timed out (the service is busy, not gone)
+            except TimeoutError:
+                self.close()
+                raise
+            except OSError:
+                self.close()
+                if attempt: raise
+
+        # Raise errors from the service
+        header, payload = response
+        if 'error' in header: raise RuntimeError(f'Embedding service error: {header["error"]}')
+
+        # Return the response
+        return header, payload
@@ -0,0 +1,182 @@
+import os
+import faiss
+import threading
+import numpy as np
+
+from .EmbeddingBackend import EmbeddingBackend
+from .EmbeddingClient import EmbeddingClient
+from .EmbeddingModelRegistry import EmbeddingModelRegistry
+from .FileMetadataDatabase import FileMetadataDatabase
+from utils import print_log, read_file, embedding_to_blob, blob_to_embedding, new_faiss_index, passage_index_path
+
+
+class EmbeddingMigration: 
+    """Moves the corpus to a new embedding model: re-embeds every file and its passages with the new model in batches (staged in 
+    the "model_embeddings" and "model_passage_embeddings" tables) while the active model's vectors and indexes keep serving searches, 
+    then builds the new model's file and passage indexes and cuts over to them in one transaction. A stopped migration resumes from 
+    the files it already re-embedded."""
+    
+    file_metadata_db:FileMetadataDatabase       # DB wrapper
+    index_bin_path:str                          # Configured path of the Faiss index binary file (each model's index is saved next to it)
+    model_registry:EmbeddingModelRegistry       # The configured embedding models
+    target_model_id:str                         # Id of the model to migrate to
+    batch_size:int                              # Files re-embedded per batch
+    storage_dtype:str                           # Precision of the embeddings stored in the DB (one of EMBEDDING_DTYPES)
+    index_type:str                              # Type of the new Faiss index (one of INDEX_TYPES)
+    
+    
+    def __init__(self, metadata_db_path:str, index_bin_path:str, model_registry:EmbeddingModelRegistry, target_model_id:str|None=None, 
+                 batch_size:int=32, storage_dtype:str='float32', index_type:str='flat'): 
+        self.file_metadata_db = FileMetadataDatabase(metadata_db_path)
+        self.index_bin_path = index_bin_path
+        self.model_registry = model_registry
+        self.target_model_id = target_model_id or model_registry.default_model_id
+        self.batch_size = batch_size
+        self.storage_dtype = storage_dtype
+        self.index_type = index_type
+        
+        
+    def run(self, stop_event:threading.Event|None=None, verbose:bool=False) -> bool: 
+        """Runs the migration until it cuts over, or until the given stop event is set.
+        
+            Parameters: 
+                stop_event (threading.Event, optional): event used to stop the migration between batches. Defaults to None.
+                verbose (bool, optional): optionally print logs.
+                
+            Returns: 
+                bool: True if the target model is now the active model, False if the migration was stopped first.
+        """
+        
+        # Nothing to do if the target is already active
+        active:dict|None = self.file_metadata_db.get_active_model()
+        if active is not None and active['model_id'] == self.target_model_id: 
+            print_log('INFO', 'EmbeddingMigration.run()', f'"{self.target_model_id}" is already the active model.')
+            return True
+        
+        # Load the target model and register it as migrating
+        model:EmbeddingBackend|EmbeddingClient = self.model_registry.get(self.target_model_id)
+        dim:int = model.get_sentence_embedding_dimension()
+        self.file_metadata_db.register_migrating_model(self.target_model_id, self.model_registry.models[self.target_model_id], dim)
+        
+        # Info print
+        print_log('INFO', 'EmbeddingMigration.run()', f'Migrating from "{active["model_id"] if active else None}" to "{self.target_model_id}".')
+        
+        # Re-embed in batches while the active model keeps serving
+        while True: 
+            
+            # Stop between batches if asked to (the staged embeddings are kept, so the next run resumes)
+            if stop_event is not None and stop_event.is_set(): 
+                print_log('WARN', 'EmbeddingMigration.run()', 'Migration stopped; run it again to resume.')
+                return False
+            
+            # Get the next batch (the last few files are re-embedded during the cut-over, together with any new files)
+            rows:list[tuple[int, str]] = self.file_metadata_db.get_entries_missing_embedding(self.target_model_id, self.batch_size)
+            if len(rows) < self.batch_size: break
+            
+            # Re-embed and stage it
+            self.file_metadata_db.stage_embeddings(self.target_model_id, self.embed(model, rows, verbose=verbose), self.embed_passages(model, rows))
+            
+            # Info print
+            if verbose: 
+                staged:int = next(m['staged'] for m in self.file_metadata_db.get_embedding_models() if m['model_id'] == self.target_model_id)
+                print_log('INFO', 'EmbeddingMigration.run()', f'Re-embedded {staged}/{self.file_metadata_db.count_file_entries()} file(s).')
+                
+        # Cut over
+        self.cut_over(model, dim, verbose=verbose)
+        return True
+    
+    
+    def embed(self, model:EmbeddingBackend|EmbeddingClient, rows:list[tuple[int, str]], verbose:bool=False) -> list[tuple[int, bytes|None]]: 
+        """Embeds the given (file id, file path) entries with the given model, from their text in the full text index (the text 
+        they were indexed with), or read from the file if it isn't in it.
+        
+            Returns: 
+                list[tuple[int, bytes|None]]: the (file id, embedding blob) of each entry; the blob is None if the file has no stored 
+                text and couldn't be read (it then stays on the previous model, see FileMetadataDatabase.activate_model()).
+        """
+        
+        # Get the texts 
+        file_ids:list[int] = []
+        texts:list[str] = []
+        for file_id, file_path in rows: 
+            try: 
+                text:str|None = self.file_metadata_db.get_file_text(file_id)
+                texts.append(text if text is not None else read_file(file_path))
+                file_ids.append(file_id)
+            except Exception as e: 
+                if verbose: print_log('WARN', 'EmbeddingMigration.embed()', f'Could not read "{file_path}" (it will be re-embedded when it is indexed again): {e}')
+                
+        # Embed them in one batch
+        embeddings:np.ndarray = model.encode(texts, batch_size=self.batch_size) if texts else np.zeros((0, 0))
+        blobs:dict[int, bytes] = {file_id: embedding_to_blob(embedding, self.storage_dtype) for file_id, embedding in zip(file_ids, embeddings)}
+        
+        # Return the blobs (None for unreadable files)
+        return [(file_id, blobs.get(file_id)) for file_id, _ in rows]
+    
+    
+    def embed_passages(self, model:EmbeddingBackend|EmbeddingClient, rows:list[tuple[int, str]]) -> list[tuple[int, int, bytes]]: 
+        """Embeds the stored passages of the given (file id, file path) entries with the given model (from the text in the full 
+        text index, so the passages keep their offsets and hashes).
+        
+            Returns: 
+                list[tuple[int, int, bytes]]: the (file id, passage no, embedding blob) of each passage.
+        """
+        
+        # Get the passages' text
+        passages:list[tuple[int, int, str]] = self.file_metadata_db.get_passage_texts([file_id for file_id, _ in rows])
+        if not passages: return []
+        
+        # Embed them in one batch
+        embeddings:np.ndarray = model.encode([text for _, _, text in passages], batch_size=self.batch_size)
+        return [(file_id, passage_no, embedding_to_blob(embedding, self.storage_dtype)) for (file_id, passage_no, _), embedding in zip(passages, embeddings)]
+    
+    
+    def cut_over(self, model:EmbeddingBackend|EmbeddingClient, dim:int, verbose:bool=False) -> None: 
+        """Holding the DB's write lock (so no file can be added or changed in between): re-embeds the files that are left, writes 
+        the target model's file and passage indexes and makes the target model the active one. Searches switch to the new model and 
+        indexes as soon as the transaction commits."""
+        
+        # Take the write lock
+        self.file_metadata_db.begin_immediate()
+        
+        try: 
+            # Re-embed the files that are left
+            while rows := self.file_metadata_db.get_entries_missing_embedding(self.target_model_id, self.batch_size): 
+                self.file_metadata_db.stage_embeddings(self.target_model_id, self.embed(model, rows, verbose=verbose), self.embed_passages(model, rows), commit=False)
+                
+            # Build the new indexes from the staged embeddings
+            staged:list[tuple[int, bytes]] = self.file_metadata_db.get_staged_embeddings(self.target_model_id)
+            staged_passages:list[tuple[int, bytes]] = self.file_metadata_db.get_staged_passage_embeddings(self.target_model_id)
+            index:faiss.IndexIDMap = self.build_index(staged, dim)
+            passage_index:faiss.IndexIDMap = self.build_index(staged_passages, dim)
+            if not index.is_trained: 
+                raise ValueError(f'Can\'t cut over to a "{self.index_type}" index: it must be trained on embeddings and no file could be re-embedded.')
+                
+            # Write them next to the active model's indexes (which keep serving until the commit), the passage index first (see 
+            # FilesystemIndexer.save_index())
+            index_path:str = EmbeddingModelRegistry.index_path(self.index_bin_path, self.target_model_id)
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            for path, new_index in ((passage_index_path(index_path), passage_index), (index_path, index)): 
+                faiss.write_index(new_index, f'{path}.tmp')
+                os.replace(f'{path}.tmp', path)
+            
+            # Swap the embeddings and the active model (commits)
+            self.file_metadata_db.activate_model(self.target_model_id)
+            
+        # Roll back on any error (the active model keeps serving)
+        except Exception: 
+            self.file_metadata_db.rollback()
+            raise
+        
+        # Info print
+        print_log('SUCCESS', 'EmbeddingMigration.cut_over()', f'Cut over to "{self.target_model_id}" ({len(staged)} embedding(s), {len(staged_passages)} passage(s), index at "{index_path}").')
+        
+        
+    def build_index(self, staged:list[tuple[int, bytes]], dim:int) -> faiss.IndexIDMap: 
+        """Creates a new index (of the configured type) holding the given staged (id, embedding) rows, trained on them if needed."""
+        index:faiss.IndexIDMap = new_faiss_index(dim, self.index_type)
+        if staged: 
+            embeddings:np.ndarray = np.vstack([blob_to_embedding(blob, dim) for _, blob in staged])
+            if not index.is_trained: index.train(embeddings)
+            index.add_with_ids(embeddings, np.array([row_id for row_id, _ in staged], dtype=np.int64))
+        return index
@@ -0,0 +1,109 @@
+import os
+import re
+import threading
+
+from configparser import ConfigParser
+from .EmbeddingBackend import EmbeddingBackend
+from .EmbeddingClient import EmbeddingClient
+from .FileMetadataDatabase import FileMetadataDatabase
+
+
+class EmbeddingModelRegistry:
+    """The configured embedding models ("[models]" in config.conf), keyed by model id. Model ids are "<name>@<version>": every stored
+    vector is tagged with the id of the model that made it, so a model that changes (e.g. new weights) gets a new version and the
+    corpus is re-embedded with it (see EmbeddingMigration). Models are loaded on first use and shared by the callers."""
+
+    models:dict[str, str]           # Model id -> sentence-transformers model name
+    default_model_id:str            # The model a new DB starts with and migrations move to by default ("[embedding] MODEL")
+    backend:str                     # Inference backend of the models loaded in this process (see EmbeddingBackend.BACKENDS)
+    num_threads:int                 # CPU threads of the models loaded in this process
+    cache_dir:str                   # Dir the ONNX exports are saved in
+    service_socket:str|None         # Socket of the shared embedding service; if set, models are used through clients instead of loaded
+
+    _loaded:dict[str, EmbeddingBackend|EmbeddingClient]    # Models (or clients) loaded so far
+    _lock:threading.Lock                                    # Makes sure each model is only loaded once
+
+
+    def __init__(self, models:dict[str, str]|None=None, default_model_id:str|None=None, backend:str='torch', num_threads:int=0,
+                 cache_dir:str='index/models', service_socket:str|None=None):
+        self.models = models or {'all-minilm-l6-v2@1': 'all-MiniLM-L6-v2'}
+        self.default_model_id = default_model_id or next(iter(self.models))
+        self.backend = backend
+        self.num_threads = num_threads
+        self.cache_dir = cache_dir
+        self.service_socket = service_socket
+
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+        # Check that the default model is registered
+        if self.default_model_id not in self.models:
+            raise AttributeError(f'Given default model "{self.default_model_id}" is not one of the registered models {tuple(self.models)}.')
+
+
+    @classmethod
+    def from_config(cls, config:ConfigParser, num_threads:int|None=None, use_service:bool|None=None) -> 'EmbeddingModelRegistry':
+        """Creates the registry from the "[models]" and "[embedding]" sections of the given config (optionally overriding the number of
+        threads, and whether the shared embedding service is used)."""
+
+        # Use the service if enabled in the config (unless overridden)
+        if use_service is None: use_service = config.getboolean('embedding', 'USE_SERVICE')
+
+        # Create the registry
+        return cls(
+            models=dict(config['models']),
+            default_model_id=config['embedding']['MODEL'].strip().lower(),
+            backend=config['embedding']['BACKEND'],
+            num_threads=int(config['embedding']['NUM_THREADS']) if num_threads is None else num_threads,
+            cache_dir=config['embedding']['CACHE_DIR'],
+            service_socket=config['embedding']['SERVICE_SOCKET'] if use_service else None
+        )
+
+
+    def get(self, model_id:str) -> EmbeddingBackend|EmbeddingClient:
+        """Returns the given model, loading it (or creating a client for it on the embedding service) on first use."""
+
+        # Check that the model is registered
+        if model_id not in self.models:
+            raise KeyError(f'Embedding model "{model_id}" is not in the "[models]" registry {tuple(self.models)}.')
+
+        # Load the model once
+        with self._lock:
+            if model_id not in self._loaded:
+                if self.service_socket:
+                    self._loaded[model_id] = EmbeddingClient(self.service_socket, model_id)
+                else:
+                    self._loaded[model_id] = EmbeddingBackend(self.models[model_id], backend=self.backend, num_threads=self.num_threads, cache_dir=self.cache_dir)
+
+        # Return the model
+        return self._loaded[model_id]
+
+
+    def active(self, file_metadata_db:FileMetadataDatabase) -> tuple[str, EmbeddingBackend|EmbeddingClient]:
+        """Returns the id of the given DB's active model (activating the default model for a new DB) and the model itself.
+
+            Parameters:
+                file_metadata_db (FileMetadataDatabase): the DB whose vectors the model has to match.
+
+            Returns:
+                tuple[str, EmbeddingBackend|EmbeddingClient]: the model id and the model.
+        """
+
+        # Get the DB's active model
+        active:dict|None = file_metadata_db.get_active_model()
+        if active is not None: return active['model_id'], self.get(active['model_id'])
+
+        # New DB: start with the default model
+        model:EmbeddingBackend|EmbeddingClient = self.get(self.default_model_id)
+        model_id:str = file_metadata_db.activate_first_model(self.default_model_id, self.models[self.default_model_id], model.get_sentence_embedding_dimension())
+
+        # Return the model (another process may have activated a different model first)
+        return model_id, self.get(model_id)
+
+
+    @staticmethod
+    def index_path(index_bin_path:str, model_id:str) -> str:
+        """Returns the path of the given model's Faiss index, e.g. "index/faiss_index.bin" -> "index/faiss_index.all-minilm-l6-v2@1.bin".
+        Each model has its own index so that a migration can build the new index while the old one keeps serving."""
+        root, ext = os.path.splitext(index_bin_path)
+        return f'{root}.{re.sub(r"[^A-Za-z0-9@._-]", "_", model_id)}{ext}'
@@ -0,0 +1,251 @@
+import os
+import time
+import queue
+import socket
+import threading
+import socketserver
+import numpy as np
+
+from configparser import ConfigParser
+from .EmbeddingModelRegistry import EmbeddingModelRegistry
+from utils import print_log, send_message, recv_message
+
+
+class _PendingRequest:
+
+    model_id:str                    # Model to embed with
+    texts:list[str]                 # Texts to embed
+    embeddings:np.ndarray|None      # Result (one row per text), set by the batcher
+    error:str|None                  # Error message if embedding failed
+    done:threading.Event            # Set by the batcher once the result (or error) is set
+
+
+    def __init__(self, model_id:str, texts:list[str]):
+        self.model_id = model_id
+        self.texts = texts
+        self.embeddings = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """Handles one client connection (on its own thread): reads requests until the client disconnects. Requests are:
+
+        {"op": "info", "model_id": ...}                     -> {"model": ..., "dim": ...}
+        {"op": "encode", "model_id": ..., "texts": [...]}   -> {"shape": [n, dim]} + the float32 embeddings as the payload
+        {"op": "stats"}                                     -> {"requests_served": ..., ...}
+
+    Errors are returned as {"error": ...}.
+    """
+
+    def handle(self) -> None:
+        service:EmbeddingService = self.server.service
+
+        while True:
+
+            # Read the next request (None means the client disconnected)
+            try:
+                message:tuple[dict, bytes]|None = recv_message(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            if message is None: return
+            request, _ = message
+
+            # Handle it
+            try:
+                match request.get('op'):
+                    case 'info':
+                        send_message(self.request, service.info(request['model_id']))
+                    case 'stats':
+                        send_message(self.request, service.stats())
+                    case 'encode':
+                        embeddings:np.ndarray = service.submit(request['model_id'], request['texts'])
+                        send_message(self.request, {'shape': list(embeddings.shape)}, embeddings.tobytes())
+                    case op:
+                        send_message(self.request, {'error': f'Unknown op "{op}".'})
+
+            # Return errors to the client (and keep the connection open)
+            except Exception as e:
+                try: send_message(self.request, {'error': f'{e.__class__.__name__}: {e}'})
+                except OSError: return
+
+
+class EmbeddingService:
+
+    model_registry:EmbeddingModelRegistry       # The models served (each is loaded once, on first use)
+    socket_path:str                             # Path of the Unix socket that clients connect to
+    max_batch_size:int                          # Max texts embedded in one call to the model
+    max_wait_ms:float                           # Max time (ms) the first request of a batch waits for more requests to join it
+    server:socketserver.ThreadingUnixStreamServer   # Accepts client connections (one thread per connection)
+
+    requests_served:int                         # Encode requests handled
+    texts_embedded:int                          # Texts embedded
+    batches_run:int                             # Calls to the model (texts_embedded / batches_run is the mean batch size)
+
+    _queue:queue.Queue[_PendingRequest]         # Requests waiting to be batched
+    _stop_event:threading.Event                 # Set to stop the batcher
+    _stats_lock:threading.Lock                  # Guards the counters
+
+
+    def __init__(self, model_registry:EmbeddingModelRegistry, socket_path:str, max_batch_size:int=64, max_wait_ms:float=5):
+        self.model_registry = model_registry
+        self.socket_path = socket_path
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self.requests_served = 0
+        self.texts_embedded = 0
+        self.batches_run = 0
+
+        self._queue = queue.Queue()
+        self._stop_event = threading.Event()
+        self._stats_lock = threading.Lock()
+
+        # Remove the socket file left behind by a service that didn't shut down cleanly (but never steal a live service's socket)
+        if os.path.exists(socket_path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock: sock.connect(socket_path)
+                raise RuntimeError(f'An embedding service is already running at "{socket_path}".')
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.remove(socket_path)
+
+        # Create the server (threads are daemons so that open client connections don't block shutdown)
+        self.server = socketserver.ThreadingUnixStreamServer(socket_path, _RequestHandler)
+        self.server.daemon_threads = True
+        self.server.service = self
+
+
+    @classmethod
+    def from_config(cls, config:ConfigParser) -> 'EmbeddingService':
+        """Creates the service configured in the "[embedding]" section of the given config, serving the models in "[models]"."""
+        return cls(
+            EmbeddingModelRegistry.from_config(config, use_service=False),
+            config['embedding']['SERVICE_SOCKET'],
+            max_batch_size=int(config['embedding']['MAX_BATCH_SIZE']),
+            max_wait_ms=float(config['embedding']['MAX_WAIT_MS'])
+        )
+
+
+    def serve_forever(self) -> None:
+        """Starts the batcher and serves clients until shutdown() is called."""
+
+        # Start the batcher
+        batcher:threading.Thread = threading.Thread(target=self._batch_loop, name='embedding-batcher', daemon=True)
+        batcher.start()
+
+        # Serve
+        try:
+            self.server.serve_forever()
+        finally:
+            self._stop_event.set()
+            batcher.join()
+            self.server.server_close()
+            if os.path.exists(self.socket_path): os.remove(self.socket_path)
+
+
+    def shutdown(self) -> None:
+        """Stops serve_forever() (call from another thread)."""
+        self.server.shutdown()
+
+
+    def info(self, model_id:str) -> dict:
+        """Returns the name and embedding dim of the given model (loading it if needed)."""
+        model = self.model_registry.get(model_id)
+        return {'model': model.name, 'dim': model.get_sentence_embedding_dimension()}
+
+
+    def stats(self) -> dict:
+        """Returns the batching stats."""
+        with self._stats_lock:
+            return {
+                'requests_served': self.requests_served,
+                'texts_embedded': self.texts_embedded,
+                'batches_run': self.batches_run,
+                'mean_batch_size': self.texts_embedded / self.batches_run if self.batches_run else 0.0,
+                'queued_requests': self._queue.qsize()
+            }
+
+
+    def submit(self, model_id:str, texts:list[str]) -> np.ndarray:
+        """Queues the given texts to be embedded by the given model in the next batch and blocks until they are.
+
+            Parameters:
+                model_id (str): id of the model to embed with (see EmbeddingModelRegistry).
+                texts (list[str]): the texts to embed.
+
+            Returns:
+                np.ndarray: the float32 embeddings, one row per text.
+        """
+
+        # Nothing to embed
+        if not texts: return np.zeros((0, self.model_registry.get(model_id).get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Queue the request and wait for the batcher
+        request:_PendingRequest = _PendingRequest(model_id, texts)
+        self._queue.put(request)
+        request.done.wait()
+
+        # Raise any error from the model
+        if request.error is not None: raise RuntimeError(request.error)
+
+        # Return the embeddings
+        return request.embeddings
+
+
+    def _batch_loop(self) -> None:
+        """Takes requests off the queue and embeds them in batches: once a request arrives, the requests that arrive within
+        [self.max_wait_ms] of it (or until [self.max_batch_size] texts are queued) are embedded with it in one call to the model."""
+
+        while not self._stop_event.is_set():
+
+            # Wait for the first request of the batch
+            try:
+                batch:list[_PendingRequest] = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+
+            # Collect the requests that arrive shortly after it
+            n_texts:int = len(batch[0].texts)
+            deadline:float = time.monotonic() + self.max_wait_ms / 1000
+            while n_texts < self.max_batch_size:
+                remaining:float = deadline - time.monotonic()
+                if remaining <= 0: break
+                try:
+                    request:_PendingRequest = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                n_texts += len(request.texts)
+
+            # Embed the texts of each model in one call and hand each request its rows
+            model_ids:list[str] = list(dict.fromkeys(request.model_id for request in batch))
+            for model_id in model_ids:
+                model_batch:list[_PendingRequest] = [request for request in batch if request.model_id == model_id]
+                self._embed(model_id, model_batch)
+
+            # Update the stats and wake the handlers up
+            with self._stats_lock:
+                self.requests_served += len(batch)
+                self.texts_embedded += n_texts
+                self.batches_run += len(model_ids)
+            for request in batch: request.done.set()
+
+
+    def _embed(self, model_id:str, batch:list[_PendingRequest]) -> None:
+        """Embeds the texts of the given requests with the given model in one call, and sets each request's embeddings (or error)."""
+        try:
+            texts:list[str] = [text for request in batch for text in request.texts]
+            embeddings:np.ndarray = np.asarray(
+                self.model_registry.get(model_id).encode(texts, batch_size=self.max_batch_size), 
+                dtype=np.float32
+            ).reshape(len(texts), -1)
+
+            start:int = 0
+            for request in batch:
+                request.embeddings = embeddings[start:start + len(request.texts)]
+                start += len(request.texts)
+
+        # Fail every request in the batch
+        except Exception as e:
+            print_log('ERROR', 'EmbeddingService._embed()', f'Failed to embed a batch of {len(texts)} text(s) with "{model_id}". Caught exception: {e.__class__} - {e}')
+            for request in batch: request.error = f'{e.__class__.__name__}: {e}'
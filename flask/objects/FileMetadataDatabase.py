@@ -4,40 +4,74 @@ import sqlite3 as sql
 import numpy as np 
 import pandas as pd 
 
-from utils import normalize_path
+from utils import normalize_path, file_extension, file_digest, PASSAGE_ID_BITS
 
 
 class FileMetadataDatabase: 
     
+    # Columns added to tables since they were first created (CREATE TABLE IF NOT EXISTS leaves an existing table as it is, so 
+    # these are added to existing DBs)
+    ADDED_COLUMNS:dict[str, tuple[tuple[str, str], ...]] = {
+        'file_metadata': (('embedding_model', 'TEXT'), ('file_ext', 'TEXT'), ('file_mtime', 'REAL')),
+        'file_passages': (('content_hash', 'TEXT'),),
+        'crawl_frontier': (('files_done', 'INTEGER NOT NULL DEFAULT 0'),)
+    }
+    
+    # Script that creates the tables (found relative to this file, so the DB can be opened from any working dir)
+    CREATE_TABLES_SCRIPT:str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sql', 'metadata_db_tables.sql')
+    
     db_path:str                 # Path to the DB file
     cxn:sql.Connection          # Connection to the db
     cursor:sql.Cursor           # Cursor for the db
     create_tables_script:str    # Path to the sql script to create the tables for the db
     
     
-    def __init__(self, db_path:str, create_tables_script:str='sql/metadata_db_tables.sql'): 
+    def __init__(self, db_path:str, create_tables_script:str=CREATE_TABLES_SCRIPT): 
         self.db_path = db_path
         
-        # If the db already exists, make a cxn and cursor
-        if os.path.exists(db_path): 
-            self.cxn = sql.connect(db_path)
-            self.cursor = self.cxn.cursor()
+        self.create_tables_script = create_tables_script
+        
+        # Create the dir if it doesn't exist
+        if os.path.dirname(db_path): os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        
+        # Connection and cursor (creates the db if it doesn't exist). Several processes/threads may write to the db at once (e.g. 
+        # crawl workers), so wait for locks instead of failing and use WAL so readers don't block the writer
+        self.cxn = sql.connect(db_path, timeout=30)
+        self.cursor = self.cxn.cursor() 
+        self.cursor.execute('PRAGMA journal_mode=WAL')
+        
+        # Add the newer columns to existing tables. Another process may add a column at the same time
+        added_columns:list[str] = []
+        for table, table_columns in FileMetadataDatabase.ADDED_COLUMNS.items(): 
+            columns:list[str] = self.get_table_columns(table)
+            for column, column_type in (table_columns if columns else ()): 
+                if column in columns: continue
+                try: 
+                    self.cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+                    added_columns.append(column)
+                except sql.OperationalError: 
+                    pass
+        
+        # Execute the create tables script (every statement is idempotent, so this also adds any tables that are 
+        # missing from an existing db)
+        with open(create_tables_script, 'r') as file: 
+            self.cursor.executescript(file.read())
             
-        # If the db doesn't exist, create it and create the tables 
-        else: 
-            # Create the dir if it doesn't exist
-            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # Index the columns that search filters are evaluated on (here rather than in the script, since other objects run the 
+        # script too, possibly before the columns are added to an existing DB)
+        for column in ('file_ext', 'file_size', 'file_mtime'): 
+            self.cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_file_metadata_{column} ON file_metadata ({column})')
             
-            # Connection and cursor 
-            self.cxn = sql.connect(db_path)
-            self.cursor = self.cxn.cursor() 
+        # Fill in the extension of the existing files (their modification time is filled in when they are next crawled)
+        if 'file_ext' in added_columns: 
+            self.cursor.execute('SELECT id, file_name FROM file_metadata')
+            self.cursor.executemany(
+                'UPDATE file_metadata SET file_ext = ? WHERE id = ?', 
+                [(file_extension(file_name), row_id) for row_id, file_name in self.cursor.fetchall()]
+            )
             
-            # Execute the create tables script
-            with open(create_tables_script, 'r') as file: 
-                self.cursor.executescript(file.read())
-                
-            # Commit changes
-            self.cxn.commit()
+        # Commit changes
+        self.cxn.commit()
                 
     
     def get_table_columns(self, table_name:str) -> list[str]: 
@@ -53,8 +87,8 @@ class FileMetadataDatabase:
     def check_file_exists(self, filepath:str) -> dict|None: 
         """Checks if the given filepath exists in the DB's "file_metadata" table, and returns that row as a dict if it does.""" 
             
-        # Execute SELECT query for the given filepath
-        self.cursor.execute('SELECT * FROM file_metadata WHERE file_path = ?', (filepath,)) 
+        # Execute SELECT query for the given (normalized) filepath
+        self.cursor.execute('SELECT * FROM file_metadata WHERE file_path = ?', (normalize_path(filepath),)) 
         
         # Check result
         result:tuple = self.cursor.fetchone()
@@ -76,14 +110,58 @@ class FileMetadataDatabase:
         """Deletes the entry for the given filepath from the "file_metadata" table."""
         
         # Execute query
-        self.cursor.execute("DELETE FROM file_metadata WHERE file_path == %s", (filepath,))
+        self.cursor.execute("DELETE FROM file_metadata WHERE file_path = ?", (normalize_path(filepath),))
         
         # Commit changes
         self.cxn.commit()
         
         
-    def new_file_entry(self, filepath:str, filename:str, metadata:dict, file_hash:str, embedding_array:np.ndarray) -> None: 
-        """Creates a new row in the "file_metadata" table with the given information."""
+    def get_file_entries_under(self, dir_path:str) -> list[tuple[int, str]]: 
+        """Returns the (id, file_path) of every entry in the "file_metadata" table that is inside the given directory."""
+        
+        # Normalize the dir path and escape the GLOB wildcards so the dir name is matched literally
+        dir_path = normalize_path(dir_path)
+        escaped:str = ''.join(f'[{c}]' if c in '*?[' else c for c in dir_path)
+        
+        # Execute SELECT query for every path under the dir 
+        self.cursor.execute('SELECT id, file_path FROM file_metadata WHERE file_path GLOB ?', (escaped + '/*',))
+        
+        # Return results 
+        return self.cursor.fetchall()
+    
+    
+    def get_file_hashes(self, filepaths:list[str]) -> dict[str, str]: 
+        """Returns the SHA-256 hash of each of the given files that is in the "file_metadata" table, keyed by the (normalized) 
+        filepath."""
+        
+        # Nothing to look up
+        if not filepaths: return {}
+        
+        # Execute query
+        filepaths = [normalize_path(filepath) for filepath in filepaths]
+        self.cursor.execute(
+            f'SELECT file_path, file_sha256 FROM file_metadata WHERE file_path IN ({",".join("?" for _ in filepaths)})',
+            filepaths
+        )
+        
+        # Return results
+        return dict(self.cursor.fetchall())
+    
+    
+    def get_all_embeddings(self, model_id:str) -> list[tuple[int, bytes]]: 
+        """Returns the (id, embedding) of every entry in the "file_metadata" table that was embedded by the given model."""
+        
+        # Execute query 
+        self.cursor.execute('SELECT id, embedding FROM file_metadata WHERE embedding IS NOT NULL AND embedding_model = ? ORDER BY id', (model_id,))
+        
+        # Return results
+        return self.cursor.fetchall()
+        
+        
+    def new_file_entry(self, filepath:str, filename:str, metadata:dict, file_hash:str, embedding_array:np.ndarray, embedding_model:str|None=None, 
+                       file_text:str|None=None) -> int: 
+        """Creates a new row in the "file_metadata" table with the given information (incl. the id of the model that made the 
+        embedding), adds the file's text (if given) to the full text index, and returns the id of the new row."""
         
         # Normalize the filepath 
         filepath = normalize_path(filepath)
@@ -91,8 +169,8 @@ class FileMetadataDatabase:
         # Execute INSERT query
         self.cursor.execute(
             '''
-                INSERT INTO file_metadata (file_path, file_name, file_size, file_sha256, created, modified, embedding)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO file_metadata (file_path, file_name, file_size, file_sha256, created, modified, embedding, embedding_model, file_ext, file_mtime)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', 
             (
                 filepath,
@@ -101,14 +179,148 @@ class FileMetadataDatabase:
                 file_hash,
                 metadata.get('created', ''),
                 metadata.get('modified', ''),
-                embedding_array.tobytes()
+                embedding_array.tobytes(),
+                embedding_model,
+                file_extension(filename),
+                metadata.get('file_mtime')
             )
         )
+        row_id:int = self.cursor.lastrowid
+        
+        # Index the file's text 
+        if file_text is not None: self.set_file_text(row_id, filename, file_text, commit=False)
+    
+        # Commit changes
+        self.cxn.commit()
+        
+        # Return the id of the new row (used as the id of the embedding in the Faiss index)
+        return row_id
+    
     
+    def set_file_text(self, file_id:int, filename:str, file_text:str, commit:bool=True) -> None: 
+        """Adds (or replaces) the name and text of the file with the given id in the full text index ("file_text" table), and its
+        digest (see utils.file_digest())."""
+        
+        # Execute queries
+        self.cursor.execute('DELETE FROM file_text WHERE rowid = ?', (file_id,))
+        self.cursor.execute('INSERT INTO file_text (rowid, file_name, content) VALUES (?, ?, ?)', (file_id, filename, file_text))
+        self.set_file_digest(file_id, *file_digest(file_text), commit=False)
+        
+        # Commit changes
+        if commit: self.cxn.commit()
+        
+        
+    def set_file_digest(self, file_id:int, digest:str, token_count:int, commit:bool=True) -> None: 
+        """Adds (or replaces) the digest of the file with the given id and its token count."""
+        
+        # Execute query
+        self.cursor.execute('INSERT OR REPLACE INTO file_digests (file_id, digest, token_count) VALUES (?, ?, ?)', (file_id, digest, token_count))
+        
+        # Commit changes
+        if commit: self.cxn.commit()
+        
+        
+    def has_file_digest(self, file_id:int) -> bool: 
+        """Checks if the file with the given id has a digest (files indexed before digests existed don't, until they are crawled
+        again)."""
+        self.cursor.execute('SELECT 1 FROM file_digests WHERE file_id = ?', (file_id,))
+        return self.cursor.fetchone() is not None
+    
+    
+    def get_file_digests(self, file_ids:list[int]) -> dict[int, tuple[str, int]]: 
+        """Returns the (digest, token count) of each of the given files that has a digest, keyed by file id (in one query)."""
+        
+        # Nothing to look up
+        if not file_ids: return {}
+        
+        # Execute query
+        self.cursor.execute(
+            f'SELECT file_id, digest, token_count FROM file_digests WHERE file_id IN ({",".join("?" for _ in file_ids)})',
+            list(file_ids)
+        )
+        
+        # Return results
+        return {file_id: (digest, token_count) for file_id, digest, token_count in self.cursor.fetchall()}
+        
+        
+    def set_file_mtime(self, file_id:int, file_mtime:float) -> None: 
+        """Sets the modification time (seconds since the epoch) of the file with the given id."""
+        
+        # Execute query
+        self.cursor.execute('UPDATE file_metadata SET file_mtime = ? WHERE id = ?', (file_mtime, file_id))
+        
         # Commit changes
         self.cxn.commit()
         
         
+    def has_file_text(self, file_id:int) -> bool: 
+        """Checks if the file with the given id is in the full text index (files indexed before it existed are not, until they
+        are crawled again)."""
+        self.cursor.execute('SELECT 1 FROM file_text WHERE rowid = ?', (file_id,))
+        return self.cursor.fetchone() is not None
+    
+    
+    def get_file_text(self, file_id:int) -> str|None: 
+        """Returns the text of the file with the given id from the full text index, or None if it isn't in it."""
+        self.cursor.execute('SELECT content FROM file_text WHERE rowid = ?', (file_id,))
+        result:tuple|None = self.cursor.fetchone()
+        return result[0] if result else None
+    
+    
+    def set_file_passages(self, file_id:int, passages:list[tuple[int, int]], hashes:list[str], embeddings:np.ndarray, embedding_model:str|None=None, 
+                          commit:bool=True) -> None: 
+        """Replaces the passages of the file with the given id with the given (start, end) offsets into its text, the hashes of 
+        their text and their embeddings (one row per passage, made by the given model)."""
+        
+        # Execute queries
+        self.cursor.execute('DELETE FROM file_passages WHERE file_id = ?', (file_id,))
+        self.cursor.executemany(
+            'INSERT INTO file_passages (file_id, passage_no, start_offset, end_offset, embedding, embedding_model, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)', 
+            [
+                (file_id, passage_no, start, end, embedding.tobytes(), embedding_model, content_hash) 
+                for passage_no, ((start, end), content_hash, embedding) in enumerate(zip(passages, hashes, embeddings))
+            ]
+        )
+        
+        # Commit changes
+        if commit: self.cxn.commit()
+        
+        
+    def has_file_passages(self, file_id:int, embedding_model:str|None) -> bool: 
+        """Checks if the file with the given id has passages embedded by the given model (files indexed before passages existed, 
+        or before a migration to the model, don't until they are crawled again)."""
+        self.cursor.execute('SELECT 1 FROM file_passages WHERE file_id = ? AND embedding_model IS ? LIMIT 1', (file_id, embedding_model))
+        return self.cursor.fetchone() is not None
+    
+    
+    def get_passage_embeddings(self, file_id:int, model_id:str) -> dict[str, bytes]: 
+        """Returns the embeddings of the passages of the file with the given id that were embedded by the given model, keyed by 
+        the hash of their text (passages stored before they were hashed are left out)."""
+        
+        # Execute query
+        self.cursor.execute(
+            'SELECT content_hash, embedding FROM file_passages WHERE file_id = ? AND embedding_model = ? AND content_hash IS NOT NULL', 
+            (file_id, model_id)
+        )
+        
+        # Return results
+        return dict(self.cursor.fetchall())
+    
+    
+    def get_all_passage_embeddings(self, model_id:str) -> list[tuple[int, bytes]]: 
+        """Returns the (passage id, embedding) of every passage that was embedded by the given model, where the passage id is 
+        the id of the passage in the passage index (see utils.passage_id())."""
+        
+        # Execute query 
+        self.cursor.execute(
+            f'SELECT (file_id << {PASSAGE_ID_BITS}) | passage_no, embedding FROM file_passages WHERE embedding_model = ? ORDER BY file_id, passage_no', 
+            (model_id,)
+        )
+        
+        # Return results
+        return self.cursor.fetchall()
+        
+        
     def table_as_df(self, table_name:str) -> pd.DataFrame: 
         """Returns the given table as a DataFrame."""
         
@@ -246,4 +458,432 @@ class FileMetadataDatabase:
         )
         
         # Fetch results and return
-        return [r[0] for r in self.cursor.fetchall()]
\ No newline at end of file
+        return [r[0] for r in self.cursor.fetchall()]    
+    
+    def pin_path(self, path:str) -> None: 
+        """Pins the given directory so that it is crawled first."""
+        
+        # Insert the row (does nothing if already pinned)
+        self.cursor.execute('INSERT OR IGNORE INTO pinned_paths (path) VALUES (?)', (normalize_path(path),))
+        
+        # Commit changes
+        self.cxn.commit()
+        
+        
+    def unpin_path(self, path:str) -> None: 
+        """Unpins the given directory."""
+        
+        # Delete the row
+        self.cursor.execute('DELETE FROM pinned_paths WHERE path = ?', (normalize_path(path),))
+        
+        # Commit changes
+        self.cxn.commit()
+        
+        
+    def get_pinned_paths(self) -> list[str]: 
+        """Returns all the pinned directories."""
+        
+        # Execute query
+        self.cursor.execute('SELECT path FROM pinned_paths')
+        
+        # Return results
+        return [r[0] for r in self.cursor.fetchall()]
+    
+    
+    def record_search_hits(self, filepaths:list[str]) -> None: 
+        """Increments the search hit count of the directory of each of the given (returned) files and of all of its parents."""
+        
+        # Collect each dir once per search, walking up from the file's dir to the root 
+        dirs:set[str] = set()
+        for filepath in filepaths: 
+            parent:str = os.path.dirname(normalize_path(filepath))
+            while parent and parent not in dirs: 
+                dirs.add(parent)
+                new_parent:str = os.path.dirname(parent)
+                if new_parent == parent: break
+                parent = new_parent
+                
+        # Upsert the counts 
+        self.cursor.executemany(
+            '''
+                INSERT INTO search_hits (dir_path, hits, last_hit) VALUES (?, 1, datetime('now'))
+                ON CONFLICT(dir_path) DO UPDATE SET hits = hits + 1, last_hit = excluded.last_hit
+            ''',
+            [(d,) for d in dirs]
+        )
+        
+        # Commit changes
+        self.cxn.commit()
+        
+        
+    def get_search_hits(self) -> dict[str, int]: 
+        """Returns the search hit count of every directory that has been hit, keyed by the directory path."""
+        
+        # Execute query
+        self.cursor.execute('SELECT dir_path, hits FROM search_hits')
+        
+        # Return results
+        return dict(self.cursor.fetchall())
+    
+    
+    def record_file_open(self, filepath:str) -> None: 
+        """Increments the open count of the given file."""
+        
+        # Upsert the count
+        self.cursor.execute(
+            '''
+                INSERT INTO file_opens (file_path, opens, last_opened) VALUES (?, 1, datetime('now'))
+                ON CONFLICT(file_path) DO UPDATE SET opens = opens + 1, last_opened = excluded.last_opened
+            ''',
+            (normalize_path(filepath),)
+        )
+        
+        # Commit changes
+        self.cxn.commit()
+        
+        
+    def get_summary(self, file_sha256:str, model:str, max_length:int, overlap:int) -> str|None: 
+        """Returns the stored summary of the file with the given hash made by the given model with the given settings, or None 
+        if there is none."""
+        self.cursor.execute(
+            'SELECT summary FROM summaries WHERE file_sha256 = ? AND model = ? AND max_length = ? AND overlap = ?', 
+            (file_sha256, model, max_length, overlap)
+        )
+        result:tuple|None = self.cursor.fetchone()
+        return result[0] if result else None
+    
+    
+    def set_summary(self, file_sha256:str, model:str, max_length:int, overlap:int, summary:str) -> None: 
+        """Stores (or replaces) the summary of the file with the given hash made by the given model with the given settings."""
+        
+        # Execute query
+        self.cursor.execute(
+            '''
+                INSERT OR REPLACE INTO summaries (file_sha256, model, max_length, overlap, summary, created) 
+                VALUES (?, ?, ?, ?, ?, datetime('now'))
+            ''',
+            (file_sha256, model, max_length, overlap, summary)
+        )
+        
+        # Commit changes
+        self.cxn.commit()
+        
+        
+    def prune_summaries(self, max_age_days:float) -> int: 
+        """Deletes the stored summaries of file versions that are no longer indexed (old hashes of changed files, deleted files, 
+        and files summarized without being indexed) and the open counts of files that are no longer indexed, once they are older 
+        than [max_age_days] days. Returns the number of summaries deleted."""
+        
+        # Delete the summaries
+        self.cursor.execute(
+            '''
+                DELETE FROM summaries WHERE created < datetime('now', ?) 
+                AND NOT EXISTS (SELECT 1 FROM file_metadata m WHERE m.file_sha256 = summaries.file_sha256)
+            ''',
+            (f'-{max_age_days} days',)
+        )
+        deleted:int = self.cursor.rowcount
+        
+        # Delete the open counts
+        self.cursor.execute(
+            '''
+                DELETE FROM file_opens WHERE last_opened < datetime('now', ?) 
+                AND NOT EXISTS (SELECT 1 FROM file_metadata m WHERE m.file_path = file_opens.file_path)
+            ''',
+            (f'-{max_age_days} days',)
+        )
+        
+        # Commit changes and return the count
+        self.cxn.commit()
+        return deleted
+    
+    
+    def get_unsummarized_files(self, model:str, max_length:int, overlap:int, limit:int, exclude:set[str]|None=None) -> list[tuple[int, str, str]]: 
+        """Returns the (id, file_path, file_sha256) of the indexed files that have no summary by the given model with the given 
+        settings: up to [limit] of the most opened files, then up to [limit] of the most recently indexed ones. Files whose hash is
+        in [exclude] (e.g. ones that failed to summarize) are left out, so they don't take the place of the others."""
+        
+        # Files without a summary (and not excluded), most opened first and most recently indexed first
+        exclude = exclude or set()
+        unsummarized:str = '''
+            SELECT m.id, m.file_path, m.file_sha256 FROM file_metadata m {join} 
+            WHERE NOT EXISTS (
+                SELECT 1 FROM summaries s WHERE s.file_sha256 = m.file_sha256 AND s.model = ? AND s.max_length = ? AND s.overlap = ?
+            )
+            AND m.file_sha256 NOT IN ({excluded})
+            ORDER BY {order} LIMIT ?
+        '''
+        excluded:str = ', '.join('?' * len(exclude))
+        params:tuple = (model, max_length, overlap, *exclude, limit)
+        self.cursor.execute(unsummarized.format(join='JOIN file_opens o ON o.file_path = m.file_path', excluded=excluded, order='o.opens DESC, o.last_opened DESC'), params)
+        files:list[tuple[int, str, str]] = self.cursor.fetchall()
+        self.cursor.execute(unsummarized.format(join='', excluded=excluded, order='m.id DESC'), params)
+        
+        # Return the files (each once)
+        return list({row[0]: row for row in files + self.cursor.fetchall()}.values())
+    
+    
+    def save_crawl_frontier(self, root:str, frontier:list[tuple[float, str, int]]) -> None: 
+        """Replaces the saved crawl frontier for the given root with the given (score, dir_path, files_done) entries."""
+        
+        # Normalize the root 
+        root = normalize_path(root)
+        
+        # Replace the rows 
+        self.cursor.execute('DELETE FROM crawl_frontier WHERE root = ?', (root,))
+        self.cursor.executemany(
+            'INSERT OR REPLACE INTO crawl_frontier (root, dir_path, score, files_done) VALUES (?, ?, ?, ?)',
+            [(root, dir_path, score, files_done) for score, dir_path, files_done in frontier]
+        )
+        
+        # Commit changes
+        self.cxn.commit()
+        
+        
+    def load_crawl_frontier(self, root:str) -> list[tuple[float, str, int]]: 
+        """Returns the saved (score, dir_path, files_done) crawl frontier for the given root (empty if the last crawl finished)."""
+        
+        # Execute query
+        self.cursor.execute('SELECT score, dir_path, files_done FROM crawl_frontier WHERE root = ?', (normalize_path(root),))
+        
+        # Return results
+        return self.cursor.fetchall()
+    
+    
+    def begin_immediate(self) -> None: 
+        """Opens a transaction that holds the DB's write lock until it is committed (e.g. by activate_model()) or rolled back, so 
+        that no other process can write in between."""
+        self.cursor.execute('BEGIN IMMEDIATE')
+        
+        
+    def rollback(self) -> None: 
+        """Rolls back the open transaction."""
+        self.cxn.rollback()
+    
+    
+    def get_active_model(self) -> dict|None: 
+        """Returns the row of the active embedding model (the model whose vectors are searched) as a dict, or None if no model has
+        been activated yet."""
+        
+        # Execute query
+        self.cursor.execute("SELECT * FROM embedding_models WHERE status = 'active'")
+        
+        # Return result
+        result:tuple|None = self.cursor.fetchone()
+        return dict(zip(self.get_table_columns('embedding_models'), result)) if result else None
+    
+    
+    def activate_first_model(self, model_id:str, model_name:str, dim:int) -> str: 
+        """Activates the given model if no model is active yet (i.e. for a new DB, or a DB from before models were tracked, whose 
+        untagged embeddings are tagged with the given model). Returns the id of the active model."""
+        
+        # Check and activate in one transaction, since several processes may start at once
+        self.begin_immediate()
+        try: 
+            self.cursor.execute("SELECT model_id FROM embedding_models WHERE status = 'active'")
+            result:tuple|None = self.cursor.fetchone()
+            
+            # Activate the given model and tag the untagged embeddings with it
+            if result is None: 
+                self.cursor.execute(
+                    '''
+                        INSERT INTO embedding_models (model_id, model_name, dim, status, created, activated) 
+                        VALUES (?, ?, ?, 'active', datetime('now'), datetime('now'))
+                        ON CONFLICT(model_id) DO UPDATE SET status = 'active', activated = excluded.activated
+                    ''',
+                    (model_id, model_name, dim)
+                )
+                self.cursor.execute('UPDATE file_metadata SET embedding_model = ? WHERE embedding_model IS NULL', (model_id,))
+                
+            # Commit changes
+            self.cxn.commit()
+            
+        # Roll back on any error
+        except Exception: 
+            self.cxn.rollback()
+            raise
+            
+        # Return the active model
+        return result[0] if result else model_id
+    
+    
+    def register_migrating_model(self, model_id:str, model_name:str, dim:int) -> None: 
+        """Registers the given model as the target of a migration (does nothing if it is already the active model)."""
+        
+        # Insert (or un-retire) the model 
+        self.cursor.execute(
+            '''
+                INSERT INTO embedding_models (model_id, model_name, dim, status, created) VALUES (?, ?, ?, 'migrating', datetime('now'))
+                ON CONFLICT(model_id) DO UPDATE SET status = 'migrating', model_name = excluded.model_name, dim = excluded.dim
+                WHERE status != 'active'
+            ''',
+            (model_id, model_name, dim)
+        )
+        
+        # Commit changes
+        self.cxn.commit()
+        
+        
+    def get_embedding_models(self) -> list[dict]: 
+        """Returns every registered model, with the number of files embedded by it ("files") and, for a migrating model, the number 
+        of files re-embedded so far ("staged")."""
+        
+        # Execute query
+        self.cursor.execute(
+            '''
+                SELECT e.*, 
+                    (SELECT COUNT(*) FROM file_metadata f WHERE f.embedding_model = e.model_id) AS files,
+                    (SELECT COUNT(*) FROM model_embeddings m JOIN file_metadata f ON f.id = m.file_id WHERE m.model_id = e.model_id) AS staged
+                FROM embedding_models e 
+                ORDER BY e.created
+            '''
+        )
+        
+        # Return results
+        columns:list[str] = [c[0] for c in self.cursor.description]
+        return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+    
+    
+    def get_entries_missing_embedding(self, model_id:str, limit:int) -> list[tuple[int, str]]: 
+        """Returns the (id, file_path) of up to [limit] entries in the "file_metadata" table that have not been re-embedded by the 
+        given (migrating) model yet."""
+        
+        # Execute query 
+        self.cursor.execute(
+            '''
+                SELECT f.id, f.file_path FROM file_metadata f
+                WHERE NOT EXISTS (SELECT 1 FROM model_embeddings m WHERE m.model_id = ? AND m.file_id = f.id)
+                ORDER BY f.id
+                LIMIT ?
+            ''',
+            (model_id, limit)
+        )
+        
+        # Return results
+        return self.cursor.fetchall()
+    
+    
+    def get_passage_texts(self, file_ids:list[int]) -> list[tuple[int, int, str]]: 
+        """Returns the (file id, passage no, text) of every stored passage of the given files (the text is sliced out of the file's
+        text in the full text index; files that aren't in it are left out)."""
+        
+        # Nothing to look up
+        if not file_ids: return []
+        
+        # Execute query
+        self.cursor.execute(
+            f'''
+                SELECT p.file_id, p.passage_no, substr(t.content, p.start_offset + 1, p.end_offset - p.start_offset)
+                FROM file_passages p JOIN file_text t ON t.rowid = p.file_id
+                WHERE p.file_id IN ({','.join('?' for _ in file_ids)})
+                ORDER BY p.file_id, p.passage_no
+            ''',
+            file_ids
+        )
+        
+        # Return results
+        return self.cursor.fetchall()
+    
+    
+    def stage_embeddings(self, model_id:str, embeddings:list[tuple[int, bytes|None]], passage_embeddings:list[tuple[int, int, bytes]]|None=None, 
+                         commit:bool=True) -> None: 
+        """Saves the given (file id, embedding) and (file id, passage no, embedding) made by the given (migrating) model. Pass 
+        commit=False to stage them inside an open transaction (see begin_immediate())."""
+        
+        # Insert the rows
+        self.cursor.executemany(
+            'INSERT OR REPLACE INTO model_embeddings (file_id, model_id, embedding) VALUES (?, ?, ?)',
+            [(file_id, model_id, embedding) for file_id, embedding in embeddings]
+        )
+        self.cursor.executemany(
+            'INSERT OR REPLACE INTO model_passage_embeddings (file_id, passage_no, model_id, embedding) VALUES (?, ?, ?, ?)',
+            [(file_id, passage_no, model_id, embedding) for file_id, passage_no, embedding in passage_embeddings or []]
+        )
+        
+        # Commit changes
+        if commit: self.cxn.commit()
+        
+        
+    def get_staged_embeddings(self, model_id:str) -> list[tuple[int, bytes]]: 
+        """Returns the (file id, embedding) of every embedding staged by the given (migrating) model for a file that is still in 
+        the "file_metadata" table."""
+        
+        # Execute query
+        self.cursor.execute(
+            '''
+                SELECT m.file_id, m.embedding FROM model_embeddings m JOIN file_metadata f ON f.id = m.file_id 
+                WHERE m.model_id = ? AND m.embedding IS NOT NULL 
+                ORDER BY m.file_id
+            ''',
+            (model_id,)
+        )
+        
+        # Return results
+        return self.cursor.fetchall()
+    
+    
+    def get_staged_passage_embeddings(self, model_id:str) -> list[tuple[int, bytes]]: 
+        """Returns the (passage id, embedding) of every passage embedding staged by the given (migrating) model for a passage that 
+        is still in the "file_passages" table, where the passage id is the id of the passage in the passage index (see 
+        utils.passage_id())."""
+        
+        # Execute query
+        self.cursor.execute(
+            f'''
+                SELECT (m.file_id << {PASSAGE_ID_BITS}) | m.passage_no, m.embedding FROM model_passage_embeddings m 
+                JOIN file_passages p ON p.file_id = m.file_id AND p.passage_no = m.passage_no
+                WHERE m.model_id = ?
+                ORDER BY m.file_id, m.passage_no
+            ''',
+            (model_id,)
+        )
+        
+        # Return results
+        return self.cursor.fetchall()
+    
+    
+    def activate_model(self, model_id:str) -> None: 
+        """Cuts over to the given (migrating) model: replaces every file's embedding (and every passage's) with the one staged by 
+        the model, makes the model the active one and retires the previous one, then commits. Files that couldn't be re-embedded 
+        (staged without an embedding) keep their previous model, so they are re-embedded the next time they are indexed. Call 
+        inside a transaction opened with begin_immediate() after every file has been re-embedded, so that the cut-over is atomic."""
+        
+        # Swap in the staged embeddings
+        self.cursor.execute(
+            '''
+                UPDATE file_metadata SET embedding_model = ?, embedding = (
+                    SELECT m.embedding FROM model_embeddings m WHERE m.model_id = ? AND m.file_id = file_metadata.id
+                )
+                WHERE id IN (SELECT file_id FROM model_embeddings WHERE model_id = ? AND embedding IS NOT NULL)
+            ''',
+            (model_id, model_id, model_id)
+        )
+        self.cursor.execute(
+            '''
+                UPDATE file_passages SET embedding_model = ?, embedding = (
+                    SELECT m.embedding FROM model_passage_embeddings m 
+                    WHERE m.model_id = ? AND m.file_id = file_passages.file_id AND m.passage_no = file_passages.passage_no
+                )
+                WHERE EXISTS (
+                    SELECT 1 FROM model_passage_embeddings m 
+                    WHERE m.model_id = ? AND m.file_id = file_passages.file_id AND m.passage_no = file_passages.passage_no
+                )
+            ''',
+            (model_id, model_id, model_id)
+        )
+        
+        # Swap the active model
+        self.cursor.execute("UPDATE embedding_models SET status = 'retired' WHERE status = 'active'")
+        self.cursor.execute("UPDATE embedding_models SET status = 'active', activated = datetime('now') WHERE model_id = ?", (model_id,))
+        
+        # Clear the staged embeddings
+        self.cursor.execute('DELETE FROM model_embeddings WHERE model_id = ?', (model_id,))
+        self.cursor.execute('DELETE FROM model_passage_embeddings WHERE model_id = ?', (model_id,))
+        
+        # Commit changes
+        self.cxn.commit()
+        
+        
+    def count_file_entries(self) -> int: 
+        """Returns the number of entries in the "file_metadata" table."""
+        return self.cursor.execute('SELECT COUNT(*) FROM file_metadata').fetchone()[0]
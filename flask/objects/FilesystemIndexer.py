@@ -3,115 +3,353 @@ import faiss
 import sqlite3 as sql
 import numpy as np 
 
-from sentence_transformers import SentenceTransformer 
+from filelock import FileLock
+from .EmbeddingBackend import EmbeddingBackend
+from .EmbeddingClient import EmbeddingClient
+from .EmbeddingModelRegistry import EmbeddingModelRegistry
 from .FileMetadataDatabase import FileMetadataDatabase
-from utils import print_log, extract_metadata, hash_file_sha256, read_file
+from .IndexingJob import IndexingJob
+from .CrawlScheduler import CrawlScheduler
+from utils import print_log, extract_metadata, hash_file_sha256, read_file, file_digest, SUPPORTED_EXTENSIONS, EMBEDDING_DTYPES, INDEX_TYPES
+from utils import blob_to_embedding, new_faiss_index, faiss_index_type, split_passages, passage_hash, passage_id, passage_id_range, passage_index_path
 
 
 class FilesystemIndexer: 
     
     start_dir:str                            # The top level (TL) dir that this indexer starts at
     file_metadata_db:FileMetadataDatabase    # DB connection wrapper
-    index_bin_path:str                       # Path to the Faiss index binary file 
-    embedding_dim:int                        # Embedding dimensions for the index
-    sentence_transformer:SentenceTransformer # Sentence transformer model for indexing files
+    base_index_bin_path:str                  # Configured path of the Faiss index binary file (each model's index is saved next to it)
+    index_bin_path:str                       # Path to the Faiss index binary file of the active model
+    passage_index_bin_path:str               # Path to the Faiss index of the active model's passages (see utils.split_passages())
+    passage_index:faiss.IndexIDMap|None      # The passage index (loaded with the file index by load_index() and saved with it by save_index())
+    model_registry:EmbeddingModelRegistry    # The configured embedding models
+    model_id:str                             # Id of the active model (the model that the stored embeddings are tagged with)
+    embedding_dim:int                        # Embedding dimensions of the active model
+    sentence_transformer:EmbeddingBackend|EmbeddingClient   # Active sentence transformer model (or embedding service client) for indexing files
+    storage_dtype:str                        # Precision of the embeddings stored in the DB (one of EMBEDDING_DTYPES)
+    index_type:str                           # Type of the Faiss index (one of INDEX_TYPES)
     
     
-    def __init__(self, start_dir:str, metadata_db_path:str, index_bin_path:str, embedding_dim:int): 
+    def __init__(self, start_dir:str, metadata_db_path:str, index_bin_path:str, model_registry:EmbeddingModelRegistry|None=None, 
+                 storage_dtype:str='float32', index_type:str='flat'): 
+        
+        # Check that a valid precision and index type are given
+        if storage_dtype not in EMBEDDING_DTYPES: 
+            raise AttributeError(f'Given storage dtype "{storage_dtype}" is not valid. Must be one of {tuple(EMBEDDING_DTYPES)}.')
+        if index_type not in INDEX_TYPES: 
+            raise AttributeError(f'Given index type "{index_type}" is not valid. Must be one of {INDEX_TYPES}.')
+        
         self.start_dir = start_dir
         self.file_metadata_db = FileMetadataDatabase(metadata_db_path)
-        self.index_bin_path = index_bin_path
-        self.embedding_dim = embedding_dim
-        self.sentence_transformer = SentenceTransformer('all-MiniLM-L6-v2')  
+        self.base_index_bin_path = index_bin_path
+        self.storage_dtype = storage_dtype
+        self.index_type = index_type
+        
+        # Use the given (shared) models if given, otherwise the default registry
+        self.model_registry = model_registry or EmbeddingModelRegistry()
+        
+        # Load the DB's active model 
+        self.model_id = None
+        self.passage_index = None
+        self.refresh_model()
+        
+        
+    def refresh_model(self) -> bool: 
+        """Switches to the DB's active model if it changed (i.e. a migration cut over to a new model since this indexer was created). 
+        Returns True if it changed, in which case any index loaded before must be loaded again (see load_index())."""
+        
+        # Get the active model 
+        model_id, model = self.model_registry.active(self.file_metadata_db)
+        if model_id == self.model_id: return False
+        
+        # Switch to it (and to its index)
+        self.model_id = model_id
+        self.sentence_transformer = model
+        self.embedding_dim = model.get_sentence_embedding_dimension()
+        self.index_bin_path = EmbeddingModelRegistry.index_path(self.base_index_bin_path, model_id)
+        self.passage_index_bin_path = passage_index_path(self.index_bin_path)
+        return True
         
     
-    def index_filesystem(self, overwrite:bool=False, verbose:bool=False) -> None: 
-        """Indexes the filesystem starting at [self.start_dir] and recursively traverses child directories. 
+    def index_filesystem(self, overwrite:bool=False, verbose:bool=False, job:IndexingJob|None=None, scheduler:CrawlScheduler|None=None) -> None: 
+        """Indexes the filesystem starting at [self.start_dir] and recursively traverses child directories. The directories are crawled
+        in priority order (see CrawlScheduler), so recently modified, frequently searched and pinned directories are indexed first. 
         
             Parameters: 
                 overwrite (bool, optional): "True" means that if the index & DB exist already then they will be overwritten from scratch; "False" means that only changed files
                     will be updated (i.e. where the stored hash does not match the computed hash). If the index does not exist, then it will be created in either case. Defaults to False. 
                 verbose (bool, optional): "True" means print debug info; "False" means silent run and print only fatal errors. Defaults to False. 
+                job (IndexingJob, optional): job to report progress to; the job is checked between files so that it can be paused or
+                    cancelled (files indexed before cancelling are kept). Defaults to None.
+                scheduler (CrawlScheduler, optional): scheduler that decides the crawl order and the file/time budget of this run; if the 
+                    budget runs out, the next run resumes where this one stopped. Defaults to an unbudgeted scheduler for [self.start_dir]. 
                 
             Returns: 
                 None: updates/creates the faiss index and db at [self.index_bin_path] and [self.metadata_db_path] respectively. 
         """
         
-        # ---- Setup ---- #
-        # Create the dirs for the index bin if it doesn't exist
-        os.makedirs(os.path.dirname(self.index_bin_path), exist_ok=True)
-        
-        # Check if overwriting existing data 
-        if overwrite: 
+        # Hold the index lock until the index is saved, so other writers (jobs, the watcher, the crawl workers) don't publish in 
+        # between and have their changes overwritten
+        with self.index_lock(): 
+            self._index_filesystem(overwrite=overwrite, verbose=verbose, job=job, scheduler=scheduler)
             
-            # Info print 
-            if verbose: print_log('WARN', 'index_filesystem()', f'Overwriting existing index at "{self.index_bin_path}".')
             
-            # Delete the existing index 
-            if os.path.exists(self.index_bin_path): os.remove(self.index_bin_path)
-            
-            # Create the index 
-            index:faiss.IndexFlatL2 = faiss.IndexFlatL2(self.embedding_dim)
+    def _index_filesystem(self, overwrite:bool=False, verbose:bool=False, job:IndexingJob|None=None, scheduler:CrawlScheduler|None=None) -> None: 
+        """See index_filesystem() (called with the index lock held)."""
         
-        # If NOT overwriting, then just make the SQL connection and read the existing index
-        else: 
-            
-            # Info print
-            if verbose: print_log('INFO', 'index_filesystem()', f'Reading existing index at "{self.index_bin_path}".')
+        # ---- Setup ---- #
+        # Read the existing index (or create a new one)
+        index:faiss.IndexIDMap = self.load_index(overwrite=overwrite, verbose=verbose)
             
-            # Read the existing index or create it if it doesn't exist
-            if os.path.exists(self.index_bin_path): index:faiss.IndexFlatL2 = faiss.read_index(self.index_bin_path)
-            else: index:faiss.IndexFlatL2 = faiss.IndexFlatL2(self.embedding_dim)
+        # Create the scheduler if not given (a saved frontier from a previous budgeted run is resumed unless overwriting)
+        if scheduler is None: 
+            scheduler = CrawlScheduler(self.start_dir, self.file_metadata_db, resume=not overwrite)
             
         # ---- Indexing ---- #
-        # Iterate over all the child dirs in [self.start_dir] and recursively index each file
+        # Index the files under [self.start_dir] in priority order
         if verbose: 
             print_log('INFO', 'Filesystem.index_filesystem()', f'Starting indexing from "{self.start_dir}". Files: {os.listdir(self.start_dir)}')
         
-        for root, dirs, files in os.walk(self.start_dir):
+        for full_path in scheduler.crawl():
             
-            # Info print 
-            if verbose: print_log('INFO', 'FilesystemIndexer.index_filesystem()', f'Reading {len(files)} from {root}.')
+            # Stop if the job was cancelled (blocks while paused)
+            if job is not None and not job.checkpoint(): break
+
+            # Call self.index file to index the file and save the data
+            self.index_file(
+                full_path, 
+                index,
+                verbose=verbose
+            )
             
-            # Iterate over all the files in this dir
-            for file in files:
-                
-                # Construct the full filepath
-                full_path = os.path.join(root, file)
-
-                # Call self.index file to index the file and save the data
-                self.index_file(
-                    full_path, 
-                    index,
-                    verbose=verbose
-                )
+            # Report progress 
+            if job is not None: job.file_done(full_path)
                 
-        # Save the index
-        faiss.write_index(index, self.index_bin_path)
+        # Save the index and the crawl frontier (empty if the crawl finished)
+        self.save_index(index)
+        scheduler.save()
+        
+        # Info print
+        if verbose and scheduler.frontier: 
+            print_log('INFO', 'FilesystemIndexer.index_filesystem()', f'Budget used up after {scheduler.files_crawled} file(s); {len(scheduler.frontier)} dir(s) left for the next run.')
         print_log('SUCCESS', 'FilesystemIndexer.index_filesystem()', f'FAISS index saved to "{self.index_bin_path}"') 
                 
     
-    def index_file(self, filepath:str, index:faiss.IndexFlatL2, verbose:bool=False) -> None: 
+    def index_lock(self) -> FileLock: 
+        """Returns the lock of the index files (shared by every process and every model's index). Writers hold it from loading 
+        the index (see load_index()) until they save it (see save_index()), so that one writer never overwrites an index that 
+        another published in the meantime."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.base_index_bin_path)), exist_ok=True)
+        return FileLock(f'{self.base_index_bin_path}.lock')
+    
+    
+    def load_index(self, overwrite:bool=False, verbose:bool=False) -> faiss.IndexIDMap:
+        """Reads the Faiss index at [self.index_bin_path], or creates a new one if it does not exist (or if overwriting). The 
+        passage index is loaded into [self.passage_index] the same way.
+
+            The index maps each embedding to the id of its row in the "file_metadata" table, so that single files can be
+            removed/replaced without rebuilding the whole index. Indexes saved in the old sequential format, or of a different
+            type than [self.index_type], are rebuilt from the embeddings stored in the DB.
+
+            Parameters:
+                overwrite (bool, optional): "True" means that the existing index (if any) is deleted and an empty one is created. Defaults to False.
+                verbose (bool, optional): optionally print logs.
+
+            Returns:
+                faiss.IndexIDMap: the loaded (or newly created) index.
+        """
+
+        # Create the dirs for the index bin if it doesn't exist
+        os.makedirs(os.path.dirname(self.index_bin_path), exist_ok=True)
+
+        # Check if overwriting existing data
+        if overwrite:
+
+            # Info print
+            if verbose: print_log('WARN', 'FilesystemIndexer.load_index()', f'Overwriting existing index at "{self.index_bin_path}".')
+
+            # Delete the existing indexes
+            for path in (self.index_bin_path, self.passage_index_bin_path): 
+                if os.path.exists(path): os.remove(path)
+
+            # Create the indexes
+            self.passage_index = new_faiss_index(self.embedding_dim, self.index_type)
+            return new_faiss_index(self.embedding_dim, self.index_type)
+
+        # Load the passage index 
+        self.passage_index = self._read_index(self.passage_index_bin_path, self.rebuild_passage_index, verbose=verbose)
+
+        # Load the index (created from the DB if it doesn't exist, e.g. a DB from before each model had its own index)
+        return self._read_index(self.index_bin_path, self._rebuild_file_index, verbose=verbose)
+
+
+    def _read_index(self, path:str, rebuild, verbose:bool=False) -> faiss.IndexIDMap: 
+        """Reads the Faiss index at the given path, or builds it from the DB with the given function if it doesn't exist, is in the 
+        old (sequential ids) format or the configured index type changed."""
+        
+        # Create the index from the DB if it doesn't exist
+        if not os.path.exists(path):
+            return rebuild()
+
+        # Info print
+        if verbose: print_log('INFO', 'FilesystemIndexer.load_index()', f'Reading existing index at "{path}".')
+
+        # Read the existing index
+        index:faiss.Index = faiss.read_index(path)
+
+        # Rebuild the index from the DB if it is in the old (sequential ids) format or the configured index type changed
+        if faiss_index_type(index) != self.index_type:
+            print_log('WARN', 'FilesystemIndexer.load_index()', f'Index at "{path}" is not an id-mapped "{self.index_type}" index - rebuilding from the DB.')
+            index = rebuild()
+
+        # Return the index
+        return index
+
+
+    def rebuild_index(self) -> faiss.IndexIDMap:
+        """Creates a new index containing every embedding stored in the DB, keyed by the row ids (scalar quantized indexes are
+        trained on those embeddings first). The passage index is rebuilt into [self.passage_index] as well."""
+        self.passage_index = self.rebuild_passage_index()
+        return self._rebuild_file_index()
+
+
+    def _rebuild_file_index(self) -> faiss.IndexIDMap: 
+        """Creates a new index containing every (file) embedding stored in the DB."""
+
+        # Create an empty index
+        index:faiss.IndexIDMap = new_faiss_index(self.embedding_dim, self.index_type)
+
+        # Add the stored embeddings (training the index on them first if needed)
+        self._add_stored_embeddings(index)
+
+        # Return the populated index
+        return index
+
+
+    def rebuild_passage_index(self) -> faiss.IndexIDMap: 
+        """Creates a new passage index containing every passage embedding stored in the DB, keyed by their passage ids."""
+        index:faiss.IndexIDMap = new_faiss_index(self.embedding_dim, self.index_type)
+        self._add_stored_embeddings(index, passages=True)
+        return index
+
+
+    def train_index(self, index:faiss.IndexIDMap) -> None:
+        """Trains the given (empty, untrained) index on every embedding stored in the DB and adds them to it. Does nothing if the
+        index is already trained (flat indexes always are) or the DB has no embeddings yet.
+
+        Scalar quantized indexes can't hold embeddings until they are trained, so until then new embeddings are only written to
+        the DB, and this adds them all once the index is saved. The quantization ranges are then fixed until the index is rebuilt."""
+
+        # Train the index and add the stored embeddings
+        if not index.is_trained: self._add_stored_embeddings(index)
+
+
+    def _add_stored_embeddings(self, index:faiss.IndexIDMap, passages:bool=False) -> None:
+        """Adds every (file or passage) embedding stored in the DB by the active model to the given (empty) index, training it on 
+        them first if needed."""
+
+        # Get the stored embeddings
+        if passages: rows:list[tuple[int, bytes]] = self.file_metadata_db.get_all_passage_embeddings(self.model_id)
+        else: rows:list[tuple[int, bytes]] = self.file_metadata_db.get_all_embeddings(self.model_id)
+        if not rows: return
+
+        # Train on them (if needed) and add them
+        embeddings:np.ndarray = np.vstack([blob_to_embedding(blob, self.embedding_dim) for _, blob in rows])
+        if not index.is_trained: index.train(embeddings)
+        index.add_with_ids(embeddings, np.array([row_id for row_id, _ in rows], dtype=np.int64))
+
+
+    def save_index(self, index:faiss.Index) -> None:
+        """Writes the given index to [self.index_bin_path] (and the passage index, if loaded, to [self.passage_index_bin_path]). 
+        Each index is written to a tmp file first and then moved into place so that readers never see a partially written index;
+        the passage index is published first, so a new version of the index (see utils.index_version()) has its passages. An 
+        untrained (scalar quantized) index is trained first; raises a ValueError if it can't be, since the DB has no embeddings 
+        to train it on (an untrained index can't be searched)."""
+
+        # Train the index if this is the first save since it was created
+        self.train_index(index)
+        if not index.is_trained: 
+            raise ValueError(f'Can\'t save the "{self.index_type}" index: it must be trained on embeddings and the DB has none by "{self.model_id}" yet.')
+
+        # Train the passage index if this is the first save since it was created, and publish it (an empty passage index can 
+        # stay untrained, it isn't searched)
+        if self.passage_index is not None: 
+            if not self.passage_index.is_trained: self._add_stored_embeddings(self.passage_index, passages=True)
+            self._write_index(self.passage_index, self.passage_index_bin_path)
+
+        # Publish the index
+        self._write_index(index, self.index_bin_path)
+
+
+    def _write_index(self, index:faiss.Index, path:str) -> None: 
+        """Atomically replaces the index at the given path with the given index."""
+
+        # Write to a tmp file next to the index
+        tmp_path:str = f'{path}.tmp'
+        faiss.write_index(index, tmp_path)
+
+        # Atomically replace the index
+        os.replace(tmp_path, path)
+
+
+    def index_file(self, filepath:str, index:faiss.IndexIDMap, verbose:bool=False) -> None:
         """Reads the file at the given path, extracts the metadata and other info, hashes the file, and stores the results in the
-        given sql DB using the connection and cursor, and stores the embedding in the given index.
+        given sql DB using the connection and cursor, and stores the embedding in the given index (and the embeddings of its 
+        passages in [self.passage_index], if loaded).
         
             Parameters: 
                 filepath (str): path to the file to index.
-                cxn (sql.Connection): connection to an SQLite DB to store metadata.
-                cursor (sql.Cursor): cursor for the SQLite DB.
-                index (faiss.IndexFlatL2): a Faiss index to store embeddings.
+                index (faiss.IndexIDMap): a Faiss index to store embeddings.
                 verbose (bool, optional): optionally print logs. 
                 
             Returns: 
                 None: saves the metadata in the SQLite DB and the embeddings in the index.
         """
         
+        # Update the DB entry for this file 
+        removed_id, row_id, embedding_array, passages = self.update_file_entry(filepath, verbose=verbose)
+        
+        # Remove the old embedding and passages (if the file changed)
+        if removed_id is not None: 
+            index.remove_ids(np.array([removed_id], dtype=np.int64))
+            if self.passage_index is not None: self.passage_index.remove_ids(passage_id_range(removed_id))
+            
+        # Add the new embedding to the index under the id of the new row (an untrained index gets it from the DB when it is saved)
+        if row_id is not None and index.is_trained: 
+            index.add_with_ids(embedding_array, np.array([row_id], dtype=np.int64))
+            
+        # Replace the file's passages in the passage index
+        if passages is not None and self.passage_index is not None and self.passage_index.is_trained: 
+            file_id, passage_embeddings = passages
+            self.passage_index.remove_ids(passage_id_range(file_id))
+            if len(passage_embeddings): 
+                self.passage_index.add_with_ids(passage_embeddings, np.array([passage_id(file_id, i) for i in range(len(passage_embeddings))], dtype=np.int64))
+            
+            
+    def update_file_entry(self, filepath:str, verbose:bool=False) -> tuple[int|None, int|None, np.ndarray|None, tuple[int, np.ndarray]|None]: 
+        """Reads the file at the given path, extracts the metadata and other info, hashes the file, and stores the results (incl. the
+        embeddings of the file and its passages) in the DB, without touching the indexes. Unchanged files (same hash) are skipped.
+        
+            Parameters: 
+                filepath (str): path to the file to index.
+                verbose (bool, optional): optionally print logs. 
+                
+            Returns: 
+                tuple[int|None, int|None, np.ndarray|None, tuple[int, np.ndarray]|None]: the id of the row that was removed (if the 
+                file changed), the id and embedding (shape (1, embedding_dim)) of the new row (if one was created), and the id of 
+                the file and the embeddings of its passages (one row per passage) if they were (re)embedded.
+        """
+        
+        # Init the return values (and the stored passage embeddings of a changed file)
+        removed_id:int|None = None
+        known_passages:dict[str, bytes] = {}
+        
         # Check the file extension and ignore invalid files
-        if not filepath.endswith(('.pdf', '.docx', '.txt')): 
+        if not filepath.endswith(SUPPORTED_EXTENSIONS):
             
             # Info print and do not index the file
             if verbose: print_log('INFO', 'index_file()', f'Ignoring file (invalid extension) "{filepath}".')
-            return  
+            return None, None, None, None
 
         try:
             # Hash the file 
@@ -123,47 +361,165 @@ class FilesystemIndexer:
             # Handle result
             if existing_entry: 
 
-                # Check if the hashes match
-                if file_hash == existing_entry['file_sha256']: 
+                # Check if the hashes match (and the file was embedded by the active model)
+                if file_hash == existing_entry['file_sha256'] and existing_entry['embedding_model'] == self.model_id: 
+                    
+                    # Add the text of a file indexed before the full text index existed
+                    if not self.file_metadata_db.has_file_text(existing_entry['id']): 
+                        self.file_metadata_db.set_file_text(existing_entry['id'], existing_entry['file_name'], read_file(filepath))
+                        
+                    # Add the digest of a file indexed before digests existed, from its stored text (adding the text adds it too)
+                    if not self.file_metadata_db.has_file_digest(existing_entry['id']): 
+                        self.file_metadata_db.set_file_digest(existing_entry['id'], *file_digest(self.file_metadata_db.get_file_text(existing_entry['id']) or ''))
+                        
+                    # Add the modification time of a file indexed before it was stored
+                    if existing_entry['file_mtime'] is None: 
+                        self.file_metadata_db.set_file_mtime(existing_entry['id'], os.path.getmtime(filepath))
+                        
+                    # Embed the passages of a file indexed before passages existed (or before a migration), from its stored text
+                    passages:tuple[int, np.ndarray]|None = None
+                    if not self.file_metadata_db.has_file_passages(existing_entry['id'], self.model_id): 
+                        _, *file_passages = self.embed_text(self.file_metadata_db.get_file_text(existing_entry['id']) or '', whole_text=False)
+                        passages = (existing_entry['id'], self.store_passages(existing_entry['id'], *file_passages))
                     
                     # Info print and do not index the file
                     if verbose: print_log('INFO', 'FilesystemIndexer.index_file()', f'ignoring "{filepath}" since it already exists with the same hash.')
-                    return  
+                    return None, None, None, passages
 
-                # If hashes do not match, delete the existing entry so we can make a new one
+                # If hashes do not match (or the embedding is from another model), delete the existing entry so we can make a new one
                 else:
                     
                     # Info print 
-                    if verbose: print_log('INFO', 'FilesystemIndexer.index_file()', f'File "{filepath}" already exists in the database but with a different hash - updating DB entry.')
+                    if verbose: print_log('INFO', 'FilesystemIndexer.index_file()', f'File "{filepath}" already exists in the database but with a different hash or model - updating DB entry.')
+                    
+                    # Keep the embeddings of the file's passages (by the active model), so that unchanged passages aren't embedded again
+                    known_passages = self.file_metadata_db.get_passage_embeddings(existing_entry['id'], self.model_id)
                     
                     # Delete existing row
                     self.file_metadata_db.delete_file_entry(filepath)
+                    removed_id = existing_entry['id']
                     
             # Extract the metadata, text, and embedding for this file
             metadata:dict[str, str|int] = extract_metadata(filepath)
             file_text:str = read_file(filepath)
-            embedding:int = self.sentence_transformer.encode(file_text)
+            
+            # Add the size and modification time from the filesystem (used by search filters; the size is missing from the 
+            # metadata if it couldn't be extracted)
+            metadata.setdefault('file_size', os.path.getsize(filepath))
+            metadata['file_mtime'] = os.path.getmtime(filepath)
+            
+            # Embed the text and its new (or changed) passages in one batch
+            embedding, *file_passages = self.embed_text(file_text, known_passages)
+            if verbose and known_passages: 
+                print_log('INFO', 'FilesystemIndexer.index_file()', f'Kept the embeddings of {sum(h in known_passages for h in file_passages[1])} of {len(file_passages[1])} passage(s) of "{filepath}".')
 
             # Check the embedding 
             if embedding is None or len(embedding) != self.embedding_dim:
                 
                 # Info print (warn) and do nothing else 
                 print_log('WARN', 'FilesystemIndexer.index_file()', f'Failed to generate valid embedding for "{filepath}". Skipping.')
-                return 
+                return removed_id, None, None, None
             
-            # Convert the embedding to an array and add to the index
+            # Convert the embedding to an array
             embedding_array:np.ndarray = np.array(embedding, dtype=np.float32).reshape(1, -1)
-            index.add(embedding_array)
 
-            # Insert the metadata for this file into the DB
-            self.file_metadata_db.new_file_entry(
+            # Insert the metadata for this file into the DB (with the embedding in the configured precision)
+            row_id:int = self.file_metadata_db.new_file_entry(
                 filepath,
                 os.path.basename(filepath),
                 metadata,
                 file_hash,
-                embedding
+                embedding_array.astype(EMBEDDING_DTYPES[self.storage_dtype]),
+                self.model_id,
+                file_text=file_text
             )
+            
+            # Store the passages under the new row
+            passage_embeddings:np.ndarray = self.store_passages(row_id, *file_passages)
+
+            # Return the removed and new rows
+            return removed_id, row_id, embedding_array, (row_id, passage_embeddings)
 
         # Handle exceptions
         except Exception as e:
-            print_log('ERROR', 'FilesystemIndexer.index_file()', f"Error processing {filepath}. Caught exception: {e.__class__} - {e}")
\ No newline at end of file
+            print_log('ERROR', 'FilesystemIndexer.index_file()', f"Error processing {filepath}. Caught exception: {e.__class__} - {e}")
+            return removed_id, None, None, None
+        
+        
+    def embed_text(self, file_text:str, known_passages:dict[str, bytes]|None=None, whole_text:bool=True) -> tuple[np.ndarray|None, list[tuple[int, int]], list[str], np.ndarray]: 
+        """Embeds the given file text and its passages (see utils.split_passages()) in one batch. Passages whose hash is in 
+        [known_passages] (e.g. those of the previous version of a changed file) keep their stored embedding, so only new and 
+        changed passages are embedded, and repeated passages are embedded once.
+        
+            Parameters: 
+                file_text (str): the text of the file.
+                known_passages (dict[str, bytes], optional): stored passage embeddings, keyed by the hash of their text. Defaults to None.
+                whole_text (bool, optional): "False" means only the passages are embedded (and None is returned for the text). Defaults to True.
+                
+            Returns: 
+                tuple[np.ndarray|None, list[tuple[int, int]], list[str], np.ndarray]: the embedding of the text, and the (start, end)
+                offsets, hashes and (float32) embeddings of the passages (one row per passage).
+        """
+        
+        # Split the text into passages and hash them 
+        known_passages = known_passages or {}
+        passages:list[tuple[int, int]] = split_passages(file_text)
+        hashes:list[str] = [passage_hash(file_text[start:end]) for start, end in passages]
+        
+        # Embed the text and the passages that aren't known in one batch
+        new_passages:dict[str, str] = {h: file_text[start:end] for h, (start, end) in zip(hashes, passages) if h not in known_passages}
+        texts:list[str] = ([file_text] if whole_text else []) + list(new_passages.values())
+        embeddings:np.ndarray = np.asarray(self.sentence_transformer.encode(texts), dtype=np.float32).reshape(len(texts), -1) if texts else np.zeros((0, self.embedding_dim), dtype=np.float32)
+        new_embeddings:dict[str, np.ndarray] = dict(zip(new_passages, embeddings[1:] if whole_text else embeddings))
+        
+        # Put together the embeddings of the passages
+        passage_embeddings:np.ndarray = np.array(
+            [new_embeddings[h] if h in new_embeddings else blob_to_embedding(known_passages[h], self.embedding_dim) for h in hashes], 
+            dtype=np.float32
+        ).reshape(len(hashes), self.embedding_dim)
+        
+        # Return the embeddings
+        return (embeddings[0] if whole_text else None), passages, hashes, passage_embeddings
+    
+    
+    def store_passages(self, file_id:int, passages:list[tuple[int, int]], hashes:list[str], embeddings:np.ndarray) -> np.ndarray: 
+        """Stores the given passages of the given file (see embed_text()) in the DB, with the embeddings in the configured precision, 
+        and returns the (float32) embeddings."""
+        self.file_metadata_db.set_file_passages(file_id, passages, hashes, embeddings.astype(EMBEDDING_DTYPES[self.storage_dtype]), self.model_id)
+        return embeddings
+
+
+    def remove_path(self, path:str, index:faiss.IndexIDMap, verbose:bool=False) -> int:
+        """Removes the given path from the DB and the index. If the path was a directory, every indexed file under it is removed.
+
+            Parameters:
+                path (str): path to the (deleted) file or directory.
+                index (faiss.IndexIDMap): the Faiss index to remove embeddings from.
+                verbose (bool, optional): optionally print logs.
+
+            Returns:
+                int: the number of files removed.
+        """
+
+        # Collect the entries to remove: the path itself (if it was a file) and anything under it (if it was a directory)
+        entries:list[tuple[int, str]] = self.file_metadata_db.get_file_entries_under(path)
+        existing_entry:dict = self.file_metadata_db.check_file_exists(path)
+        if existing_entry: entries.append((existing_entry['id'], existing_entry['file_path']))
+
+        # Nothing to do if the path was never indexed
+        if not entries: return 0
+
+        # Remove the embeddings (and passages) from the indexes
+        index.remove_ids(np.array([row_id for row_id, _ in entries], dtype=np.int64))
+        if self.passage_index is not None: 
+            for row_id, _ in entries: self.passage_index.remove_ids(passage_id_range(row_id))
+
+        # Remove the rows from the DB
+        for _, filepath in entries:
+            self.file_metadata_db.delete_file_entry(filepath)
+
+        # Info print
+        if verbose: print_log('INFO', 'FilesystemIndexer.remove_path()', f'Removed {len(entries)} file(s) under "{path}".')
+
+        # Return the number of removed files
+        return len(entries)
@@ -0,0 +1,128 @@
+import os
+import threading
+import faiss
+
+from watchfiles import watch, Change, DefaultFilter
+from .FilesystemIndexer import FilesystemIndexer
+from utils import print_log, SUPPORTED_EXTENSIONS
+
+
+class FilesystemWatcher:
+
+    roots:list[str]                 # The dirs being watched (recursively)
+    indexer:FilesystemIndexer       # Indexer used to (re)index and remove the changed paths
+    debounce_ms:int                 # Max time (ms) to group changes into a single batch
+    step_ms:int                     # Time (ms) without new changes before a batch is emitted
+
+
+    def __init__(self, roots:list[str], indexer:FilesystemIndexer, debounce_ms:int=1600, step_ms:int=50):
+        self.roots = roots
+        self.indexer = indexer
+        self.debounce_ms = debounce_ms
+        self.step_ms = step_ms
+
+
+    def watch(self, stop_event:threading.Event|None=None, verbose:bool=False) -> None:
+        """Watches [self.roots] for created, modified, moved and deleted paths and applies each batch of changes to the index.
+        Runs until the given stop event is set (or forever if none is given).
+
+            Parameters:
+                stop_event (threading.Event, optional): event used to stop watching. Defaults to None.
+                verbose (bool, optional): optionally print logs.
+
+            Returns:
+                None: keeps the DB and the index at [self.indexer.index_bin_path] up to date.
+        """
+
+        # Info print
+        print_log('INFO', 'FilesystemWatcher.watch()', f'Watching {self.roots} for changes.')
+
+        # Iterate over the batches of (debounced) changes
+        for changes in watch(
+            *self.roots,
+            watch_filter=DefaultFilter(),
+            debounce=self.debounce_ms,
+            step=self.step_ms,
+            stop_event=stop_event
+        ):
+
+            # Coalesce the raw events and apply them
+            self.apply_changes(self.coalesce(changes), verbose=verbose)
+
+
+    def coalesce(self, changes:set[tuple[Change, str]]) -> dict[str, str]:
+        """Collapses a batch of raw change events into one action per path.
+
+            Events for the same path are reduced to the final state of that path on disk, so e.g. a file that is created and then
+            modified several times is indexed once, and a file that is created and then deleted within the batch is ignored. A move
+            is reported as a delete of the old path and an add of the new path.
+
+            Parameters:
+                changes (set[tuple[Change, str]]): the raw (change, path) events from watchfiles.
+
+            Returns:
+                dict[str, str]: keys are the changed paths and values are the action to take: "index" or "remove".
+        """
+
+        # Init the actions dict
+        actions:dict[str, str] = {}
+
+        # Check the final state of every changed path
+        for _, path in changes:
+
+            # Path is gone: remove it (and anything under it)
+            if not os.path.exists(path): actions[path] = 'remove'
+
+            # Path is a dir (e.g. moved into a watched root): index everything in it
+            elif os.path.isdir(path): actions[path] = 'index'
+
+            # Path is a file: only supported files are indexed
+            elif path.endswith(SUPPORTED_EXTENSIONS): actions[path] = 'index'
+
+        # Return the actions
+        return actions
+
+
+    def apply_changes(self, actions:dict[str, str], verbose:bool=False) -> None:
+        """Applies the given (coalesced) actions to the DB and index, then saves the index. The index is read from disk and saved 
+        with the index lock held (see FilesystemIndexer.index_lock()), so indexes published in the meantime by indexing jobs or 
+        the crawl workers are updated rather than overwritten.
+
+            Parameters:
+                actions (dict[str, str]): the output of self.coalesce().
+                verbose (bool, optional): optionally print logs.
+
+            Returns:
+                None: updates the DB and saves the index at [self.indexer.index_bin_path].
+        """
+
+        # Nothing to do
+        if not actions: return
+
+        # Load the latest index (of the new model, if a migration cut over since the last batch)
+        with self.indexer.index_lock():
+            self.indexer.refresh_model()
+            index:faiss.IndexIDMap = self.indexer.load_index(verbose=verbose)
+
+            # Apply each action
+            for path, action in actions.items():
+
+                # Removed path
+                if action == 'remove':
+                    self.indexer.remove_path(path, index, verbose=verbose)
+
+                # Created/moved-in dir: index every file in it (unchanged files are skipped by hash)
+                elif os.path.isdir(path):
+                    for root, _, files in os.walk(path):
+                        for file in files:
+                            self.indexer.index_file(os.path.join(root, file), index, verbose=verbose)
+
+                # Created/modified file
+                else:
+                    self.indexer.index_file(path, index, verbose=verbose)
+
+            # Save the index so the changes are searchable
+            self.indexer.save_index(index)
+
+        # Info print
+        if verbose: print_log('SUCCESS', 'FilesystemWatcher.apply_changes()', f'Applied {len(actions)} change(s).')
@@ -0,0 +1,214 @@
+import os
+import time
+import uuid
+import threading
+
+from utils import SUPPORTED_EXTENSIONS
+
+
+class IndexingJob:
+
+    id:str                          # Unique id for this job
+    root:str                        # The dir that this job indexes (recursively)
+    overwrite:bool                  # Whether the existing index & DB are overwritten
+    max_files:int                   # Max files to index in this job (0 means no limit; the next job for the root resumes)
+    max_seconds:float               # Max time (seconds) to index for in this job (0 means no limit)
+    status:str                      # One of: "queued", "discovering", "running", "paused", "cancelled", "completed", "failed"
+    error:str|None                  # Error message if the job failed
+    created:float                   # Time the job was created (epoch seconds)
+    started:float|None              # Time the job started running
+    finished:float|None             # Time the job finished (completed, cancelled or failed)
+
+    dirs_pending:int                # Dirs discovered but not yet listed (during discovery)
+    files_total:int                 # Supported files discovered under the root
+    bytes_total:int                 # Total size of the discovered files
+    files_done:int                  # Files processed so far
+    bytes_done:int                  # Bytes processed so far
+
+    _resume_event:threading.Event   # Cleared while the job is paused
+    _cancel_event:threading.Event   # Set when the job is cancelled
+    _lock:threading.Lock            # Guards the counters
+    _paused_seconds:float           # Total time spent paused (excluded from the rates)
+    _paused_at:float|None           # Time the current pause started
+    _active_status:str              # Status to go back to when resumed
+
+
+    def __init__(self, root:str, overwrite:bool=False, max_files:int=0, max_seconds:float=0):
+        self.id = uuid.uuid4().hex
+        self.root = root
+        self.overwrite = overwrite
+        self.max_files = max_files
+        self.max_seconds = max_seconds
+        self.status = 'queued'
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+        self.dirs_pending = 0
+        self.files_total = 0
+        self.bytes_total = 0
+        self.files_done = 0
+        self.bytes_done = 0
+
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._paused_seconds = 0.0
+        self._paused_at = None
+        self._active_status = 'queued'
+
+
+    # ---- Control (called from the request handlers) ---- #
+    def pause(self) -> None:
+        """Pauses the job at the next file boundary."""
+        with self._lock:
+            if self.status in ('queued', 'discovering', 'running'):
+                self._resume_event.clear()
+                self._paused_at = time.time()
+                self.status = 'paused'
+
+
+    def resume(self) -> None:
+        """Resumes a paused job."""
+        with self._lock:
+            if self.status == 'paused':
+                if self.started: self._paused_seconds += time.time() - max(self._paused_at, self.started)
+                self._paused_at = None
+                self.status = self._active_status
+                self._resume_event.set()
+
+
+    def cancel(self) -> None:
+        """Cancels the job at the next file boundary (files indexed so far are kept)."""
+        self._cancel_event.set()
+
+        # Wake the job up if it is paused so that it can exit
+        self._resume_event.set()
+
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('cancelled', 'completed', 'failed')
+
+
+    # ---- Progress (called from the worker) ---- #
+    def checkpoint(self) -> bool:
+        """Blocks while the job is paused. Returns False if the job was cancelled (i.e. the worker should stop), else True."""
+        self._resume_event.wait()
+        return not self.cancelled
+
+
+    def discover(self) -> None:
+        """Walks [self.root] to count the supported files and their total size, so that the progress and ETA can be reported."""
+
+        # Init the queue of dirs to list
+        dirs:list[str] = [self.root]
+
+        # List each dir until none are left
+        while dirs:
+
+            # Stop if cancelled (waits if paused)
+            if not self.checkpoint(): return
+
+            # Update the queue depth
+            self.dirs_pending = len(dirs)
+
+            # List the next dir
+            try:
+                entries:list[os.DirEntry] = list(os.scandir(dirs.pop()))
+            except OSError:
+                continue
+
+            # Queue the child dirs and count the supported files
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False): dirs.append(entry.path)
+                    elif entry.name.endswith(SUPPORTED_EXTENSIONS):
+                        with self._lock:
+                            self.files_total += 1
+                            self.bytes_total += entry.stat().st_size
+                except OSError:
+                    continue
+
+        # Discovery done
+        self.dirs_pending = 0
+
+
+    def file_done(self, filepath:str) -> None:
+        """Records that the given file was processed."""
+
+        # Get the file size (the file may have been deleted in the meantime)
+        try: size:int = os.path.getsize(filepath)
+        except OSError: size:int = 0
+
+        # Update the counters
+        with self._lock:
+            self.files_done += 1
+            self.bytes_done += size
+
+
+    def set_status(self, status:str, error:str|None=None) -> None:
+        """Sets the status of the job, and records the start/finish times."""
+        with self._lock:
+
+            # Keep reporting "paused" until resumed, but remember the status to resume to
+            if status in ('discovering', 'running'):
+                self._active_status = status
+                if self.status == 'paused': status = 'paused'
+
+            self.status = status
+            self.error = error
+            if status in ('discovering', 'running') and self.started is None: self.started = time.time()
+            if self.done: self.finished = time.time()
+
+
+    def to_dict(self) -> dict:
+        """Returns the state and live progress of this job (rates, queue depths and ETA) as a JSON-serializable dict."""
+
+        with self._lock:
+
+            # Time spent actually running (excl. pauses)
+            end:float = self.finished or self._paused_at or time.time()
+            elapsed:float = max((end - self.started) - self._paused_seconds, 1e-9) if self.started else 0.0
+
+            # Rates
+            files_per_sec:float = self.files_done / elapsed if elapsed else 0.0
+            bytes_per_sec:float = self.bytes_done / elapsed if elapsed else 0.0
+
+            # Remaining work and ETA (based on bytes since file sizes vary wildly)
+            files_pending:int = max(self.files_total - self.files_done, 0)
+            bytes_pending:int = max(self.bytes_total - self.bytes_done, 0)
+            eta:float|None = bytes_pending / bytes_per_sec if bytes_per_sec and not self.done else None
+
+            # Return the info
+            return {
+                'id': self.id,
+                'root': self.root,
+                'overwrite': self.overwrite,
+                'max_files': self.max_files,
+                'max_seconds': self.max_seconds,
+                'status': self.status,
+                'error': self.error,
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished,
+                'elapsed_seconds': elapsed,
+                'files_total': self.files_total,
+                'files_done': self.files_done,
+                'bytes_total': self.bytes_total,
+                'bytes_done': self.bytes_done,
+                'files_per_sec': files_per_sec,
+                'bytes_per_sec': bytes_per_sec,
+                'queue_depths': {
+                    'dirs': self.dirs_pending,
+                    'files': files_pending
+                },
+                'eta_seconds': eta
+            }
@@ -0,0 +1,120 @@
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from .EmbeddingModelRegistry import EmbeddingModelRegistry
+from .IndexingJob import IndexingJob
+from .FilesystemIndexer import FilesystemIndexer
+from .CrawlScheduler import CrawlScheduler
+from utils import print_log
+
+
+class IndexingJobManager:
+
+    metadata_db_path:str                        # Path to the SQLite DB with the file metadata
+    index_bin_path:str                          # Path to the Faiss index binary file
+    model_registry:EmbeddingModelRegistry       # Embedding models shared by all the jobs (so each is only loaded once)
+    jobs:dict[str, IndexingJob]                 # All the jobs submitted to this manager, keyed by job id
+    executor:ThreadPoolExecutor                 # Worker pool that runs the jobs (OS threads, outside the request greenlets)
+    index_lock:threading.Lock                   # Held by a job while it updates the index (all jobs share one index file)
+    crawl_weights:dict[str, float]              # Scoring weights passed to each job's CrawlScheduler
+    index_options:dict[str, str]                # Embedding storage precision and index type passed to each job's FilesystemIndexer
+
+
+    def __init__(self, metadata_db_path:str, index_bin_path:str, model_registry:EmbeddingModelRegistry, max_workers:int=2, 
+                 crawl_weights:dict[str, float]|None=None, index_options:dict[str, str]|None=None):
+        self.metadata_db_path = metadata_db_path
+        self.index_bin_path = index_bin_path
+        self.model_registry = model_registry
+        self.jobs = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='indexing-job')
+        self.index_lock = threading.Lock()
+        self.crawl_weights = crawl_weights or {}
+        self.index_options = index_options or {}
+
+
+    def start_job(self, root:str, overwrite:bool=False, max_files:int=0, max_seconds:float=0) -> IndexingJob:
+        """Creates a job to index the given root dir and submits it to the worker pool.
+
+            Parameters:
+                root (str): the dir to index (recursively).
+                overwrite (bool, optional): "True" means the existing index & DB are overwritten. Defaults to False.
+                max_files (int, optional): max files to index in this job (0 means no limit). Defaults to 0.
+                max_seconds (float, optional): max time (seconds) to index for in this job (0 means no limit). Defaults to 0.
+
+            Returns:
+                IndexingJob: the (queued) job.
+        """
+
+        # Create and register the job
+        job:IndexingJob = IndexingJob(root, overwrite=overwrite, max_files=max_files, max_seconds=max_seconds)
+        self.jobs[job.id] = job
+
+        # Submit the job to the pool
+        self.executor.submit(self._run_job, job)
+
+        # Return the job
+        return job
+
+
+    def get_job(self, job_id:str) -> IndexingJob|None:
+        """Returns the job with the given id, or None if there is no such job."""
+        return self.jobs.get(job_id)
+
+
+    def list_jobs(self) -> list[IndexingJob]:
+        """Returns all the jobs, newest first."""
+        return sorted(self.jobs.values(), key=lambda job: job.created, reverse=True)
+
+
+    def _run_job(self, job:IndexingJob) -> None:
+        """Runs the given job on a worker thread: discovers the files under the root (for progress/ETA reporting) and then indexes them."""
+
+        try:
+            # Check the job wasn't cancelled while queued (waits if paused)
+            if not job.checkpoint():
+                job.set_status('cancelled')
+                return
+
+            # Discover the files to index
+            job.set_status('discovering')
+            job.discover()
+            
+            # Check the job wasn't cancelled during discovery
+            if job.cancelled: 
+                job.set_status('cancelled')
+                return
+
+            # Only one job updates the index at a time: jobs load the index, update it and save it, so concurrent jobs
+            # would overwrite each other's changes
+            with self.index_lock:
+
+                # Create an indexer on this thread (SQLite connections can't be shared between threads)
+                job.set_status('running')
+                indexer:FilesystemIndexer = FilesystemIndexer(
+                    job.root,
+                    self.metadata_db_path,
+                    self.index_bin_path,
+                    model_registry=self.model_registry,
+                    **self.index_options
+                )
+
+                # Create a scheduler with the job's budget
+                scheduler:CrawlScheduler = CrawlScheduler(
+                    job.root, 
+                    indexer.file_metadata_db,
+                    max_files=job.max_files, 
+                    max_seconds=job.max_seconds, 
+                    resume=not job.overwrite,
+                    **self.crawl_weights
+                )
+
+                # Index the root
+                indexer.index_filesystem(overwrite=job.overwrite, job=job, scheduler=scheduler)
+
+            # Done
+            job.set_status('cancelled' if job.cancelled else 'completed')
+
+        # Handle exceptions
+        except Exception as e:
+            print_log('ERROR', 'IndexingJobManager._run_job()', f'Job {job.id} ("{job.root}") failed. Caught exception: {e.__class__} - {e}')
+            job.set_status('failed', error=str(e))
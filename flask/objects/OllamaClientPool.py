@@ -0,0 +1,176 @@
+import json
+import time
+import random
+import threading
+import httpx
+
+from concurrent.futures import ThreadPoolExecutor, Future
+from gevent import getcurrent, get_hub, Greenlet
+from gevent import Timeout as GeventTimeout
+from gevent.event import AsyncResult
+from ollama import Client as OllamaClient
+from ollama import ResponseError as OllamaResponseError
+from ollama import GenerateResponse
+
+
+class OllamaClientPool:
+    """Shared client for the Ollama server, used in place of an ollama.Client (see OllamaQueryHandler). Requests run on a pool of
+    native threads over keep-alive connections; a request handler (greenlet) waiting on one yields to the others instead of
+    blocking the server. Each call has a deadline, at most [max_concurrency] requests per model are sent to the server at once,
+    failed requests (connection errors, "busy" and server errors) are retried with exponential backoff, and identical concurrent
+    calls (with the same timeout) are coalesced so they reach the server once."""
+
+    # HTTP statuses that are retried (the server is overloaded or failed); any other error response is returned to the caller
+    RETRY_STATUSES:tuple[int, ...] = (429, 500, 502, 503, 504)
+
+    host:str                                    # URL of the Ollama server
+    timeout_seconds:float                       # Default deadline (seconds) of a call, retries included
+    max_concurrency:int                         # Max requests per model sent to the server at once
+    max_retries:int                             # Max retries of a failed request
+    backoff_seconds:float                       # Wait before the first retry (doubled for each further retry, with jitter)
+    client:OllamaClient                         # The underlying client (one keep-alive connection pool shared by the threads)
+    executor:ThreadPoolExecutor                 # Native threads the requests run on
+    requests:int                                # Calls that were sent to the server
+    coalesced:int                               # Calls served by an identical call that was already in flight
+    retries:int                                 # Requests that were retried
+    timeouts:int                                # Calls that missed their deadline
+
+    _semaphores:dict[str, threading.BoundedSemaphore]   # Per model, limits the requests sent at once
+    _in_flight:dict[str, Future]                # Key of each call in flight -> its result
+    _lock:threading.Lock                        # Guards the semaphores, the calls in flight and the counters
+
+
+    def __init__(self, host:str, timeout_seconds:float=120, max_concurrency:int=2, max_retries:int=2, backoff_seconds:float=0.5,
+                 max_workers:int=8):
+        self.host = host
+        self.timeout_seconds = timeout_seconds
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.client = OllamaClient(
+            host=host,
+            timeout=timeout_seconds,
+            limits=httpx.Limits(max_connections=max_workers, max_keepalive_connections=max_workers)
+        )
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ollama')
+        self.requests = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.timeouts = 0
+
+        self._semaphores = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+
+    def generate(self, model:str='', prompt:str='', timeout_seconds:float|None=None, **kwargs) -> GenerateResponse:
+        """
+        Same as ollama.Client.generate() (not streamed), with a deadline, retries and coalescing (see the class docs).
+
+            Parameters:
+                model (str): the model to run.
+                prompt (str): the prompt.
+                timeout_seconds (float, optional): deadline of the call. Defaults to [self.timeout_seconds].
+                **kwargs: the other arguments of ollama.Client.generate() (e.g. "options", "format", "keep_alive").
+
+            Returns:
+                GenerateResponse: the response. Raises a TimeoutError if the deadline passes, an ollama.ResponseError if the
+                server returns an error and a ConnectionError if it can't be reached (after the retries).
+                
+        A call that joins an identical call in flight shares its request, which runs (and is retried) until the first caller's 
+        deadline. The timeout is part of what makes calls identical, so that deadline is at most as much earlier than the 
+        joining call's own as the time since the first call started.
+        """
+
+        # Join an identical call in flight, or start one
+        timeout_seconds = timeout_seconds or self.timeout_seconds
+        deadline:float = time.monotonic() + timeout_seconds
+        key:str = json.dumps([model, prompt, timeout_seconds, kwargs], sort_keys=True, default=str)
+        with self._lock:
+            future:Future|None = self._in_flight.get(key)
+            started:bool = future is None
+            if started:
+                future = self.executor.submit(self._generate, model, prompt, deadline, kwargs)
+                self._in_flight[key] = future
+            else: self.coalesced += 1
+            
+        # Forget the call once it is done (outside the lock, since a call that is already done runs the callback right away)
+        if started: future.add_done_callback(lambda done: self._forget(key, done))
+
+        # Wait for the result until the deadline
+        try: return OllamaClientPool.wait(future, deadline - time.monotonic())
+        except TimeoutError:
+            with self._lock: self.timeouts += 1
+            raise TimeoutError(f'Request to Ollama ({model}) missed its deadline of {timeout_seconds} s.') from None
+
+
+    def stats(self) -> dict:
+        """Returns the calls in flight and the request/coalesce/retry/timeout counters."""
+        with self._lock:
+            return {
+                'in_flight': len(self._in_flight),
+                'requests': self.requests,
+                'coalesced': self.coalesced,
+                'retries': self.retries,
+                'timeouts': self.timeouts
+            }
+
+
+    def _generate(self, model:str, prompt:str, deadline:float, kwargs:dict) -> GenerateResponse:
+        """Sends the request (on a pool thread) once a slot for the model is free, retrying failures until the deadline."""
+
+        # Get the model's semaphore
+        with self._lock:
+            semaphore:threading.BoundedSemaphore = self._semaphores.setdefault(model, threading.BoundedSemaphore(self.max_concurrency))
+
+        attempt:int = 0
+        while True:
+
+            # Wait for a slot (no point sending the request once the deadline passed)
+            if not semaphore.acquire(timeout=max(0, deadline - time.monotonic())):
+                raise TimeoutError(f'No free slot for the Ollama model "{model}" before the deadline.')
+
+            # Send the request
+            try:
+                with self._lock: self.requests += 1
+                return self.client.generate(model=model, prompt=prompt, stream=False, **kwargs)
+
+            # Retry errors that may pass (unless out of retries or time)
+            except (OllamaResponseError, ConnectionError, httpx.TransportError) as e:
+                if isinstance(e, OllamaResponseError) and e.status_code not in OllamaClientPool.RETRY_STATUSES: raise
+                wait:float = self.backoff_seconds * 2 ** attempt * random.uniform(0.5, 1.5)
+                if attempt >= self.max_retries or time.monotonic() + wait >= deadline: raise
+                with self._lock: self.retries += 1
+            finally:
+                semaphore.release()
+
+            # Back off before the retry
+            time.sleep(wait)
+            attempt += 1
+
+
+    def _forget(self, key:str, future:Future) -> None:
+        """Removes the given finished call from the calls in flight (so later identical calls are sent again)."""
+        with self._lock:
+            if self._in_flight.get(key) is future: del self._in_flight[key]
+
+
+    @staticmethod
+    def wait(future:Future, timeout:float|None=None):
+        """Returns the result of the given future (of any executor), waiting up to [timeout] seconds for it (raises a TimeoutError 
+        after that). In a greenlet, the wait yields to the other greenlets instead of blocking the thread."""
+        
+        # Not in a greenlet (e.g. a worker thread): block
+        if timeout is not None: timeout = max(0, timeout)
+        if not isinstance(getcurrent(), Greenlet): return future.result(timeout=timeout)
+        
+        # In a greenlet: wait on a gevent result, set in the hub by an async watcher (the one gevent primitive that can be signalled
+        # from another thread, and which keeps the hub's loop alive while the request runs)
+        result:AsyncResult = AsyncResult()
+        watcher = get_hub().loop.async_()
+        watcher.start(result.set)
+        future.add_done_callback(lambda done: watcher.send())
+        try: result.get(timeout=timeout)
+        except GeventTimeout: raise TimeoutError from None
+        finally: watcher.close()
+        return future.result(timeout=0)
@@ -1,22 +1,86 @@
 import tiktoken
 import json 
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from ollama import Client as OllamaClient
 from ollama import GenerateResponse
+from .FileMetadataDatabase import FileMetadataDatabase
+from .OllamaClientPool import OllamaClientPool
+from utils import hash_file_sha256, read_file, allocate_tokens, print_log
 
 
 class OllamaQueryHandler: 
 
-    ollama_client:OllamaClient  # Client class instance (from ollama)
+    ollama_client:OllamaClient|OllamaClientPool  # Client class instance (from ollama, or the pool that wraps it)
     model:str                   # The model being used by the server (e.g. llama3.2:3b-instruct-fp16)
+    summary_workers:int         # Max summaries requested from the server at once (see recursive_summarize_text())
+    summary_fan_in:int          # Max summaries summarized together when reducing them (see recursive_summarize_text())
+    context_tokens:int          # Context window (tokens) the model is run with; prompts are packed to fit in it
+    confidence_output:str       # What get_confidence() has the model generate (see CONFIDENCE_OUTPUTS)
+    keep_alive:str|int          # How long the server keeps the model loaded after a request: a duration (e.g. "30m") or seconds (-1 forever)
+    timings:deque[dict]         # Timings of the latest requests (see request_timings())
+    
+    _keep_warm_stop_event:threading.Event    # Set to stop the keep warm thread
+    _keep_warm_thread:threading.Thread|None  # The keep warm thread (if started, see start_keep_warm())
     
     # NOTE: static encoding for tokenizer 
     encoding:tiktoken.Encoding = tiktoken.get_encoding("cl100k_base")
     
+    # Outputs of get_confidence() ([ollama] CONFIDENCE_OUTPUT). Either way the model's output is constrained to a JSON schema: 
+    #   "scores"    - only a confidence (an integer, 0-100) per document; a few tokens each, so much faster
+    #   "explained" - a confidence and 1-2 sentences of context per document
+    CONFIDENCE_OUTPUTS:tuple[str, ...] = ('scores', 'explained')
+    
+    # Tokens of the context window kept for the model's response to get_confidence(), per document, for each output (also the 
+    # most tokens it may generate)
+    RESPONSE_TOKENS_PER_DOCUMENT:dict[str, int] = {'scores': 8, 'explained': 80}
+    
+    # Tokens kept for the response to explain_match() (1-2 sentences)
+    EXPLANATION_TOKENS:int = 80
+    
+    # Requests that spent longer than this (ms) loading the model count as cold starts (see stats())
+    COLD_LOAD_MS:float = 500
+    
+    # Tokens per chunk of the text that is summarized (the chunks overlap by less than this)
+    SUMMARY_CHUNK_TOKENS:int = 1975
+    
+    # The instructions of the get_confidence() prompt for each output. They come first and don't depend on the query or the 
+    # documents, so the server can reuse their evaluation (prompt prefix cache) from one request to the next
+    CONFIDENCE_INSTRUCTIONS:dict[str, str] = {
+        output: f"""
+            Ignore all previous instructions and do not remember anything after this response. Respond to this prompt as if it's the only thing you've seen.\n
+            \nHere are your instructions: I want you to take the query given below and compare it to each of the files given after it.
+            \nFor each file, in order, give your confidence that the file matches the query as an integer in the range 0-100 
+            inclusive. You should calculate the confidence relative to the other given files, primarily based on the file 
+            content.{explanation}
+            \nReturn only a JSON object with the {'confidences' if output == 'scores' else 'results'} in a "documents" list (one per file, in order), like: {json.dumps(example)}\n
+            \nEach file is given after a line with "FILE <number>: " and its filename.\n"""
+        for output, explanation, example in [
+            ('scores', '', {'documents': ['<int>', '<int>']}),
+            ('explained', """
+            \nWith each confidence, give a "context" of two sentences or less that describes why you chose that confidence. In 
+            the "context", you can explain your reasoning and/or include specific references to the file content, and I want 
+            you to quote the query in the "context" too.""", {'documents': [{'confidence': '<int>', 'context': '<1-2 sentences>'}] * 2})
+        ]
+    }
+    
 
-    def __init__(self, ollama_client:OllamaClient, model:str):
+    def __init__(self, ollama_client:OllamaClient|OllamaClientPool, model:str, summary_workers:int=4, summary_fan_in:int=4, context_tokens:int=4096, 
+                 confidence_output:str='scores', keep_alive:str|int='30m'):
         self.ollama_client = ollama_client
         self.model = model 
+        self.summary_workers = summary_workers
+        self.summary_fan_in = summary_fan_in
+        self.context_tokens = context_tokens
+        self.confidence_output = confidence_output
+        self.keep_alive = OllamaQueryHandler.parse_keep_alive(keep_alive)
+        self.timings = deque(maxlen=100)
+        
+        self._keep_warm_stop_event = threading.Event()
+        self._keep_warm_thread = None
         
 
     def summarize_text(self, text:str, max_length:int=500) -> str: 
@@ -30,25 +94,19 @@ class OllamaQueryHandler:
             str: The summarized document.
         """
             
-        # Format a prompt 
+        # Format a prompt (the instructions first, so the server can reuse their evaluation across the chunks)
         formatted_prompt:str = f"""
-            Summarize the following text into less than or equal to {max_length} words, returning only the summary and no extra 
-            context, characters, or words. Additionally, the summary should read like a coherent passage and summarize the main points
-            of the text, avoid things like "the text says", and avoid redundant information: 
+            Summarize the text below, returning only the summary and no extra context, characters, or words. Additionally, the 
+            summary should read like a coherent passage and summarize the main points of the text, avoid things like "the text 
+            says", and avoid redundant information. The summary should be less than or equal to {max_length} words. The text: 
             \n{text}
         """
 
-        # Make req to ollama client
-        response:GenerateResponse = self.ollama_client.generate(
-            model=self.model,
-            prompt=formatted_prompt
-        )
-        
-        # Return the response json 
-        return response.response
+        # Make req to ollama client (with the same options as the other requests, so the model isn't reloaded)
+        return self.generate(formatted_prompt)
 
 
-    def chunk_text(self, text:str, chunk_size:int=1975, overlap:int=100) -> list[str]: 
+    def chunk_text(self, text:str, chunk_size:int=SUMMARY_CHUNK_TOKENS, overlap:int=100) -> list[str]: 
         """
         Breaks input text into chunks of `chunk_size` tokens using a tokenizer.
         
@@ -60,8 +118,13 @@ class OllamaQueryHandler:
         Returns:
             list[str]: A list of text chunks.
         """
+        return self.chunk_tokens(OllamaQueryHandler.tokenize(text), chunk_size=chunk_size, overlap=overlap)
+    
+    
+    def chunk_tokens(self, tokens:list[int], chunk_size:int=SUMMARY_CHUNK_TOKENS, overlap:int=100) -> list[str]: 
+        """Like chunk_text(), for an already tokenized text."""
+        
         # Init vars
-        tokens:list[str] = OllamaQueryHandler.tokenize(text)
         chunks:list[list[str]] = []
         i:int = 0
         
@@ -77,115 +140,379 @@ class OllamaQueryHandler:
         return chunks
     
     
-    def recursive_summarize_text(self, text:str, chunk_size:int=1975, max_summary_len:int=500, overlap:int=100) -> str: 
+    def recursive_summarize_text(self, text:str, chunk_size:int=SUMMARY_CHUNK_TOKENS, max_summary_len:int=500, overlap:int=100, max_workers:int|None=None, 
+                                 fan_in:int|None=None) -> str: 
         """
-        Takes in a long text (> chunk_size) and recursively summarizes until the result is <= max_summary_length. 
+        Takes in a long text (> chunk_size) and summarizes it as a map-reduce tree until the result is <= max_summary_length: the 
+        chunks of the text are summarized concurrently, then their summaries are summarized in groups of [fan_in] (concurrently), 
+        and so on. Each piece is tokenized once, when it is made, so the time taken is about that of the longest path down the 
+        tree rather than the sum of all the calls.
         
         Parameters: 
             text (str): the text to summarize.
             chunk_size (int, optional): size of the chunks to tokenize the original text into. Defaults to 2000.
             max_summary_len (int, optional): maximum size of the returned summary. Defaults to 500. 
             overlap (int, optional): the window of overlap for tokens in each chunk to preserve context. Defaults to 100.
+            max_workers (int, optional): max summaries requested at once. Defaults to the handler's [summary_workers].
+            fan_in (int, optional): max summaries summarized together. Defaults to the handler's [summary_fan_in].
             
         Returns: 
             str: a summary of the input text.
         """
         
-        # Start with summary_text equal to the input text incase the input text is already less than the max summary length
-        summary_text:str = text
+        # Start with the input text as the only piece (as (text, tokens)), incase it is already less than the max summary length
+        max_workers = max_workers or self.summary_workers
+        fan_in = max(2, fan_in or self.summary_fan_in)
+        pieces:list[tuple[str, list[int]]] = [(text, OllamaQueryHandler.tokenize(text))]
+        total_tokens:int = len(pieces[0][1])
     
-        # Recursively summarize until under token limit        
-        while len(OllamaQueryHandler.tokenize(summary_text)) > max_summary_len:
-                        
-            # Split this summary into chunks
-            chunks:list[list[str]] = self.chunk_text(
-                summary_text, 
-                chunk_size=chunk_size, 
-                overlap=overlap
-            )
-            
-            # Summarize each chunk
-            summaries:list[str] = [self.summarize_text(chunk) for chunk in chunks]
-            
-            # Concatenate the summaries with newlines
-            summary_text:str = "\n\n".join(summaries)
+        # Summarize a level of the tree at a time until under token limit
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='summarize') as executor: 
+            while total_tokens > max_summary_len:
+                
+                # Group the pieces: pieces longer than a chunk are split into chunks, the others are packed up to [fan_in] at a 
+                # time (as long as they fit in a chunk)
+                groups:list[str] = []
+                packed:list[tuple[str, list[int]]] = []
+                for piece_text, piece_tokens in pieces: 
+                    if len(piece_tokens) > chunk_size: 
+                        groups.extend(self.chunk_tokens(piece_tokens, chunk_size=chunk_size, overlap=overlap))
+                        continue
+                    if len(packed) == fan_in or sum(len(tokens) for _, tokens in packed) + len(piece_tokens) > chunk_size: 
+                        groups.append('\n\n'.join(t for t, _ in packed))
+                        packed = []
+                    packed.append((piece_text, piece_tokens))
+                if packed: groups.append('\n\n'.join(t for t, _ in packed))
+                
+                # Summarize the groups concurrently (in order; a request handler waiting on them yields to the others) and count 
+                # the tokens of each summary
+                summaries:list[str] = [OllamaClientPool.wait(future) for future in [executor.submit(self.summarize_text, group) for group in groups]]
+                pieces = [(summary, OllamaQueryHandler.tokenize(summary)) for summary in summaries]
+                
+                # Stop if the summaries didn't get any shorter (the model can't summarize them any further)
+                new_total_tokens:int = sum(len(tokens) for _, tokens in pieces)
+                if new_total_tokens >= total_tokens: break
+                total_tokens = new_total_tokens
 
-        # Return the final summary
-        return summary_text
+        # Return the final summary (the remaining summaries concatenated with newlines)
+        return "\n\n".join(piece_text for piece_text, _ in pieces)
         
     
-    def generate(self, prompt:str) -> str: 
+    def summarize_file(self, filepath:str, file_metadata_db:FileMetadataDatabase, max_length:int=500, overlap:int=100) -> tuple[str, bool]: 
+        """
+        Summarizes the file at the given path (see recursive_summarize_text()), using the summary stored in the given DB if the 
+        file was summarized with the same model and settings before (and hasn't changed since). New summaries are stored.
+        
+        Parameters: 
+            filepath (str): path to the file to summarize.
+            file_metadata_db (FileMetadataDatabase): the DB the summaries are stored in.
+            max_length (int, optional): maximum size of the summary. Defaults to 500. 
+            overlap (int, optional): the window of overlap for tokens in each chunk to preserve context. Defaults to 100.
+            
+        Returns: 
+            tuple[str, bool]: the summary, and whether it was stored already.
+        """
+        
+        # Return the stored summary of this version of the file
+        file_hash:str = hash_file_sha256(filepath)
+        summary:str|None = file_metadata_db.get_summary(file_hash, self.model, max_length, overlap)
+        if summary is not None: return summary, True
+        
+        # Get the text of the file: the text stored when it was indexed (if it hasn't changed since), so it isn't extracted again
+        entry:dict|None = file_metadata_db.check_file_exists(filepath)
+        text:str|None = file_metadata_db.get_file_text(entry['id']) if entry and entry['file_sha256'] == file_hash else None
+        if text is None: text = read_file(filepath)
+        
+        # Summarize it and store the summary
+        summary = self.recursive_summarize_text(text, max_summary_len=max_length, overlap=overlap)
+        file_metadata_db.set_summary(file_hash, self.model, max_length, overlap, summary)
+        return summary, False
+        
+    
+    def generate(self, prompt:str, format:dict|None=None, max_tokens:int|None=None) -> str: 
         """
         Submits the given prompt to the ollama client's generate() function.
 
         Parameters: 
             prompt (str): the prompt to submit.
+            format (dict, optional): a JSON schema the response must follow (the model can only generate matching JSON). 
+            Defaults to None (free text).
+            max_tokens (int, optional): max tokens the model may generate. Defaults to None (no limit).
 
         Returns: 
             str: the Ollama model's response as a string. 
         """
-        return self.ollama_client.generate(prompt)['response']
+        options:dict = {'num_ctx': self.context_tokens}
+        if max_tokens: options['num_predict'] = max_tokens
+        response:GenerateResponse = self.ollama_client.generate(model=self.model, prompt=prompt, format=format or '', options=options, keep_alive=self.keep_alive)
+        self.timings.append(OllamaQueryHandler.request_timings(response))
+        return response.response
+    
+    
+    def warm_up(self) -> dict: 
+        """
+        Loads the model on the server (if it isn't loaded) and restarts its keep alive timer, without generating anything. The 
+        model is loaded with the same options as the other requests, so they don't reload it.
+        
+        Returns: 
+            dict: the timings of the request (see request_timings()); "load_ms" is the time it took to load the model.
+        """
+        response:GenerateResponse = self.ollama_client.generate(model=self.model, prompt='', options={'num_ctx': self.context_tokens}, keep_alive=self.keep_alive)
+        return OllamaQueryHandler.request_timings(response)
+    
+    
+    def start_keep_warm(self, interval_seconds:float) -> None: 
+        """Warms the model up now and then every [interval_seconds] in a background (daemon) thread, so the server doesn't evict it 
+        between sparse requests (or after it restarts). The interval should be shorter than [keep_alive]."""
+        if self._keep_warm_thread is not None and self._keep_warm_thread.is_alive(): return
+        self._keep_warm_stop_event.clear()
+        self._keep_warm_thread = threading.Thread(target=self._keep_warm, args=(interval_seconds,), name='ollama-keep-warm', daemon=True)
+        self._keep_warm_thread.start()
+        
+        
+    def stop_keep_warm(self) -> None: 
+        """Stops the keep warm thread."""
+        self._keep_warm_stop_event.set()
+        if self._keep_warm_thread is not None: self._keep_warm_thread.join()
+        
+        
+    def stats(self) -> dict: 
+        """Returns the keep alive and the timings of the latest requests: how many there were, how many were cold starts (spent 
+        over COLD_LOAD_MS loading the model), and their mean and worst time to first token (ms) and prompt tokens evaluated 
+        (tokens reused from the prompt prefix cache aren't)."""
+        timings:list[dict] = [timing for timing in list(self.timings) if timing['ttft_ms'] is not None]
+        ttfts:list[float] = [timing['ttft_ms'] for timing in timings]
+        return {
+            'keep_alive': self.keep_alive,
+            'requests': len(timings),
+            'cold_starts': sum(1 for timing in timings if (timing['load_ms'] or 0) > OllamaQueryHandler.COLD_LOAD_MS),
+            'mean_ttft_ms': sum(ttfts) / len(ttfts) if ttfts else None,
+            'max_ttft_ms': max(ttfts, default=None),
+            'mean_prompt_eval_tokens': sum(timing['prompt_eval_tokens'] or 0 for timing in timings) / len(timings) if timings else None
+        }
+        
+        
+    def _keep_warm(self, interval_seconds:float) -> None: 
+        """Warms the model up every [interval_seconds] until stopped (see start_keep_warm())."""
+        while True: 
+            try: 
+                timings:dict = self.warm_up()
+                if (timings['load_ms'] or 0) > OllamaQueryHandler.COLD_LOAD_MS: 
+                    print_log('INFO', 'OllamaQueryHandler._keep_warm()', f'Loaded the model "{self.model}" in {timings["load_ms"]:.0f} ms.')
+            except Exception as e: 
+                print_log('WARN', 'OllamaQueryHandler._keep_warm()', f'Failed to warm up the model "{self.model}": {e.__class__} - {e}')
+            if self._keep_warm_stop_event.wait(interval_seconds): return
+    
+    
+    @staticmethod
+    def parse_keep_alive(keep_alive:str|int) -> str|int: 
+        """Returns the given keep alive (e.g. from the config) as the server takes it: a number of seconds (e.g. "-1", to keep the 
+        model loaded forever) as an int, since the server only parses strings with a unit (e.g. "30m", "-1m") as durations."""
+        if isinstance(keep_alive, str) and keep_alive.strip().lstrip('-').isdigit(): return int(keep_alive)
+        return keep_alive.strip() if isinstance(keep_alive, str) else keep_alive
+    
+    
+    @staticmethod
+    def request_timings(response:GenerateResponse) -> dict: 
+        """
+        Returns the timings the server reported for a (not streamed) request. The time to first token is the time spent loading 
+        the model plus evaluating the prompt (the first token is generated right after).
+        
+            Parameters: 
+                response (GenerateResponse): the response.
+            
+            Returns: 
+                dict: {"load_ms", "prompt_eval_ms", "prompt_eval_tokens", "ttft_ms", "total_ms"} (None where not reported).
+        """
+        ms = lambda name: getattr(response, name, None) / 1e6 if getattr(response, name, None) is not None else None
+        load_ms, prompt_eval_ms = ms('load_duration'), ms('prompt_eval_duration')
+        return {
+            'load_ms': load_ms,
+            'prompt_eval_ms': prompt_eval_ms,
+            'prompt_eval_tokens': getattr(response, 'prompt_eval_count', None),
+            'ttft_ms': (load_ms or 0) + (prompt_eval_ms or 0) if load_ms is not None or prompt_eval_ms is not None else None,
+            'total_ms': ms('total_duration')
+        }
 
 
-    def get_confidence(self, query:str, documents_dict:dict[str,str], first_n_toks:int=600) -> dict: 
+    def get_confidence(self, query:str, documents_dict:dict[str,str], first_n_toks:int=600, token_counts:dict[str,int]|None=None, 
+                       relevance:dict[str,float]|None=None, output:str|None=None) -> dict[str, dict]: 
         """
-        Prompts the Ollama model to generate a confidence score that the given document text matches the given query. 
+        Prompts the Ollama model to generate a confidence score that the given document text matches the given query. The prompt
+        is packed to fit in the model's context window (see build_confidence_prompt()), and the response is constrained to a JSON 
+        schema (see confidence_schema()), so it always parses.
 
         Parameters: 
             query (str): the user's query to compare to.
             documents_dict (dict[str, str]): keys are the document names (filenames) and the values are the document content (as str).
-            first_n_toks (int, optional): specify how many tokens to take for each document. Defaults to 600. 
+            first_n_toks (int, optional): specify how many tokens to take (at most) for each document. Defaults to 600. 
+            token_counts (dict[str, int], optional): the known token counts of (some of) the documents (e.g. of stored digests, 
+            see utils.file_digest()); documents known to fit are not tokenized again. Defaults to None.
+            relevance (dict[str, float], optional): relevance of each document to the query (1 if not given); the context is 
+            shared out in proportion to it. Defaults to None (shared equally).
+            output (str, optional): "scores" or "explained" (see CONFIDENCE_OUTPUTS). Defaults to the handler's [confidence_output].
         Returns: 
-            dict: a dict with two keys: "context", which is Ollama's arbitrary context as to why the document matches the
-            query, and "confidence", which is an integer (0-100 inclusive) that represents Ollama's confidence that the
-            given document matches the given query.
-        """
-
-        # Format a JSON string to use as an example to pass to the model
-        example_json:str = {
-            filename : {
-                'confidence': '<int, confidence score for this file>',
-                'context': '<1-2 sentences about your reasoning for this file>' 
-            }
-            for filename in list(documents_dict.keys())
-        }
-
-        # Convert the documents dict to contain just the first [first_n_toks] tokens of each document content 
-        trimmed_document_contents:dict[str, str] = {
-            doc_name : self.detokenize(
-                self.tokenize(doc_content)[:first_n_toks]
-            )
-            for doc_name, doc_content in documents_dict.items()
-        }
-
-        # Format a prompt to submit
-        formatted_prompt:str = f"""
-            Ignore all previous instructions and do not remember anything after this response. Respond to this prompt as if it's the only thing you've seen.\n
-            \nHere is the query: "{query}"\n
-            \nHere are your instructions: I want you to take this query and compare it to all the given files.
-            \nReturn a JSON object with keys for each of the filenames, and the values should be a dictionary containing
-            two keys called "confidence" and "context". The "confidence" should be your confidence that the document 
-            matches the given query in the range 0-100 inclusive, and "context" should be two sentences or less that 
-            describe why you chose that confidence score. In the "context", you can explain your reasoning and/or include 
-            specific references to the given document content, and I want you to quote the query in the "context" too. You 
-            should calculate the confidence relative to the other given documents.
-            \nYour response should look exactly like this, with no additional 
-            characters: {json.dumps(example_json)}\n
-            \nYour confidence should be primarily based on the document content. Additionally, I don't want 
-            any additional information, context, explanation, or characters - just return the JSON object.
-            \n\nHere is the information for all files, where the keys are filenames and values are the content of that
-            file after stopwords were removed: \n{trimmed_document_contents}\n
+            dict[str, dict]: { filename : {"confidence", "context"} } for each document, where "confidence" is an integer (0-100 
+            inclusive) that represents Ollama's confidence that the document matches the given query, and "context" is Ollama's 
+            reasoning as to why (None for "scores"). Documents that didn't fit in the prompt are left out. Raises a ValueError 
+            if the response doesn't follow the schema or not even one document fits.
         """
 
-        print(f'\nSubmitting prompt with {len(self.tokenize(formatted_prompt))} tokens...\n')
+        # Pack the prompt
+        output = output or self.confidence_output
+        formatted_prompt, usage = self.build_confidence_prompt(query, documents_dict, first_n_toks, token_counts, relevance, output=output)
+        print_log('INFO', 'OllamaQueryHandler.get_confidence()', f'Submitting prompt with {usage["used"]} of {usage["budget"]} budget tokens ({usage["documents"]}).')
 
-        # Submit the query to ollama 
-        response:str = self.generate(formatted_prompt)
+        # Submit the query to ollama (only JSON that follows the schema can be generated) for the documents in the prompt
+        names:list[str] = list(usage['documents'])
+        response:str = self.generate(
+            formatted_prompt, 
+            format=OllamaQueryHandler.confidence_schema(len(names), output), 
+            max_tokens=OllamaQueryHandler.RESPONSE_TOKENS_PER_DOCUMENT[output] * len(names) + 16
+        )
+        
+        timing:dict = self.timings[-1] if self.timings else {}
+        print_log('INFO', 'OllamaQueryHandler.get_confidence()', f'Time to first token: {timing.get("ttft_ms")} ms ({timing.get("prompt_eval_tokens")} prompt tokens evaluated).')
+        
+        # Parse it (the results are in the order of the documents; confidences are clamped in case the server doesn't enforce
+        # the schema's range)
+        try: 
+            results:list[dict] = [result if output == 'explained' else {'confidence': result, 'context': None} for result in json.loads(response)['documents']]
+            return {name : {'confidence': max(0, min(100, int(result['confidence']))), 'context': result['context']} for name, result in zip(names, results)}
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e: 
+            raise ValueError(f'Ollama returned a response that does not follow the schema: {response!r}') from e
+    
+    
+    def explain_match(self, query:str, filename:str, text:str, first_n_toks:int=600) -> str: 
+        """
+        Has the Ollama model explain (in 1-2 sentences) why the given document matches the given query, e.g. for the top match 
+        of a search ranked with "scores" only.
 
-        print('\033[92mOLLAMA RESPONSE: \n\033[0m', response)
+        Parameters: 
+            query (str): the user's query.
+            filename (str): the document's name (filename).
+            text (str): the document's content.
+            first_n_toks (int, optional): max tokens of the content that are sent. Defaults to 600.
+        Returns: 
+            str: the explanation.
+        """
+        
+        # Cut the document (to what fits in the context window after the instructions and the response) 
+        max_tokens:int = min(first_n_toks, self.context_tokens - OllamaQueryHandler.EXPLANATION_TOKENS - 200)
+        tokens:list[int] = self.tokenize(text)
+        if len(tokens) > max_tokens: text = self.detokenize(tokens[:max(0, max_tokens)])
+        
+        # Format a prompt (the instructions first, so the server can reuse their evaluation) and submit it
+        formatted_prompt:str = f"""
+            In two sentences or less, explain why the file below matches the query below. Quote the query, and refer to 
+            specific parts of the file content. Return only the explanation.
+            \n\nQUERY: "{query}"\n
+            \nFILE: {filename}\n{text}\n
+        """
+        return self.generate(formatted_prompt, max_tokens=OllamaQueryHandler.EXPLANATION_TOKENS).strip()
+    
+    
+    @staticmethod
+    def confidence_schema(count:int, output:str='scores') -> dict: 
+        """Returns the JSON schema of the get_confidence() response for [count] documents: {"documents": [...]} with a confidence
+        (an integer, 0-100) for each document in order, or a {"confidence", "context"} object for each if [output] is "explained"."""
+        confidence:dict = {'type': 'integer', 'minimum': 0, 'maximum': 100}
+        item:dict = confidence if output == 'scores' else {
+            'type': 'object',
+            'properties': {'confidence': confidence, 'context': {'type': 'string'}},
+            'required': ['confidence', 'context']
+        }
+        return {
+            'type': 'object',
+            'properties': {'documents': {'type': 'array', 'items': item, 'minItems': count, 'maxItems': count}},
+            'required': ['documents']
+        }
+    
+    
+    def build_confidence_prompt(self, query:str, documents_dict:dict[str,str], first_n_toks:int=600, token_counts:dict[str,int]|None=None, 
+                                relevance:dict[str,float]|None=None, budget:int|None=None, output:str|None=None) -> tuple[str, dict]: 
+        """
+        Builds the get_confidence() prompt so that it fits in a token budget: what is left of the budget after the instructions 
+        is shared out across the documents in proportion to their relevance (a document never gets more than its length or 
+        [first_n_toks]; what it doesn't need goes to the others), and each document is cut to its share. If the instructions 
+        and the headers of the documents (with their share of the response) don't fit on their own, the least relevant 
+        documents are left out until they do. Each document is tokenized at most once (not at all if its token count is known 
+        and it fits), and the finished prompt is measured, and trimmed if needed, so it is guaranteed to fit. Token counts are 
+        by OllamaQueryHandler.encoding, which approximates the model's own tokenizer.
 
-        return response 
+        Parameters: 
+            query, documents_dict, first_n_toks, token_counts, relevance, output: see get_confidence().
+            budget (int, optional): max tokens of the prompt. Defaults to the context window minus the tokens kept for the 
+            response (RESPONSE_TOKENS_PER_DOCUMENT of the output per document in the prompt).
+        Returns: 
+            tuple[str, dict]: the prompt, and the tokens it used: {"budget", "used", "documents": {filename: tokens}, "dropped": 
+            [filenames left out]}. Raises a ValueError if not even the most relevant document fits.
+        """
+        
+        # Init vars
+        names:list[str] = list(documents_dict)
+        dropped:list[str] = []
+        token_counts = token_counts or {}
+        relevance = relevance or {}
+        output = output or self.confidence_output
+        
+        # Format the prompt without the documents and measure it (with the header of each document), leaving out the least 
+        # relevant document (the last one of equals) until it fits
+        while True: 
+            prompt_budget:int = budget if budget is not None else self.context_tokens - OllamaQueryHandler.RESPONSE_TOKENS_PER_DOCUMENT[output] * len(names)
+            template:str = self._confidence_prompt_template(query, len(names), output)
+            headers:list[str] = [f'\nFILE {i}: {name}\n' for i, name in enumerate(names, start=1)]
+            fixed_tokens:int = len(self.tokenize(template.format(documents=''))) + sum(len(self.tokenize(header)) for header in headers)
+            if fixed_tokens <= prompt_budget: break
+            if len(names) <= 1: 
+                raise ValueError(f'The prompt needs {fixed_tokens} tokens without any document content, more than the budget of {prompt_budget}.')
+            least_relevant:str = min(reversed(names), key=lambda name: relevance.get(name, 1.0))
+            names.remove(least_relevant)
+            dropped.append(least_relevant)
+        budget = prompt_budget
+        if dropped: 
+            print_log('WARN', 'OllamaQueryHandler.build_confidence_prompt()', f'Left out {len(dropped)} document(s) that did not fit in the prompt: {dropped}')
+        
+        # Get the length of each document: its known token count if it fits, else tokenize it (once)
+        tokens:dict[str, list[int]] = {}
+        lengths:list[int] = []
+        for name in names: 
+            if token_counts.get(name, first_n_toks + 1) <= first_n_toks: lengths.append(token_counts[name])
+            else: 
+                tokens[name] = self.tokenize(documents_dict[name])
+                lengths.append(min(len(tokens[name]), first_n_toks))
+        
+        # Share out the rest of the budget and pack the documents, trimming the longest one until the prompt fits 
+        allocation:list[int] = allocate_tokens(lengths, [relevance.get(name, 1.0) for name in names], budget - fixed_tokens)
+        while True: 
+            documents:list[str] = []
+            for name, header, length, allotted in zip(names, headers, lengths, allocation): 
+                if allotted >= length and name not in tokens: 
+                    documents.append(header + documents_dict[name])
+                    continue
+                if name not in tokens: tokens[name] = self.tokenize(documents_dict[name])
+                documents.append(header + self.detokenize(tokens[name][:allotted]))
+            prompt:str = template.format(documents=''.join(documents))
+            used:int = len(self.tokenize(prompt))
+            if used <= budget or not any(allocation): break
+            longest:int = max(range(len(allocation)), key=lambda i: allocation[i])
+            allocation[longest] = max(0, allocation[longest] - (used - budget))
+            
+        # Return the prompt and its token usage
+        return prompt, {'budget': budget, 'used': used, 'documents': dict(zip(names, allocation)), 'dropped': dropped}
+    
     
+    def _confidence_prompt_template(self, query:str, count:int, output:str) -> str: 
+        """Returns the get_confidence() prompt for the given query, number of files and output, with a "{documents}" field for 
+        their content. The (static) instructions come first, then the query and the files."""
+
+        # Format a prompt to submit (escaping the braces of the given text, so only the documents are filled in later)
+        escape = lambda text: text.replace('{', '{{').replace('}', '}}')
+        return escape(OllamaQueryHandler.CONFIDENCE_INSTRUCTIONS[output]) + f"""
+            \nHere is the query: "{escape(query)}"\n
+            \nHere is the content of the {count} files: \n{{documents}}\n
+        """
+        
 
     @classmethod
     def tokenize(cls, text:str) -> list[int]: 
@@ -0,0 +1,139 @@
+import time
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from .EmbeddingBackend import EmbeddingBackend
+from .EmbeddingClient import EmbeddingClient
+from utils import normalize_query
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU cache of query embeddings, keyed by (normalized query, model id), so that repeated searches (retyped or refined
+    queries, searches re-fired by the UI) skip the model entirely. Entries expire after [ttl_seconds]. Shared by the request
+    handlers, so it is thread safe."""
+
+    max_size:int                                            # Max number of cached embeddings (0 disables the cache)
+    ttl_seconds:float                                       # Max age (seconds) of a cached embedding (0 means they never expire)
+    hits:int                                                # Lookups served from the cache
+    misses:int                                              # Lookups that had to run the model
+
+    _entries:OrderedDict[tuple[str, str], tuple[float, np.ndarray]]  # (query, model id) -> (time cached, embedding), least recently used first
+    _lock:threading.Lock                                    # Guards the entries and counters
+
+
+    def __init__(self, max_size:int=1024, ttl_seconds:float=3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def encode(self, query:str, model_id:str, model:EmbeddingBackend|EmbeddingClient) -> np.ndarray:
+        """Returns the embedding of the given query by the given model, from the cache if possible. The normalized query is
+        embedded, so a cached embedding is the same as a freshly computed one.
+
+            Parameters:
+                query (str): the search query.
+                model_id (str): id of the model (see EmbeddingModelRegistry); embeddings of different models are cached separately.
+                model (EmbeddingBackend|EmbeddingClient): the model, used on a miss.
+
+            Returns:
+                np.ndarray: the (read only) float32 embedding of the query.
+        """
+
+        # Look the query up
+        key:tuple[str, str] = (normalize_query(query), model_id)
+        embedding:np.ndarray|None = self.get(key)
+        if embedding is not None: return embedding
+
+        # Miss: embed the query (outside the lock, so other lookups aren't blocked by the model) and cache it
+        embedding = np.asarray(model.encode(key[0]), dtype=np.float32).reshape(-1)
+        embedding.setflags(write=False)
+        self.put(key, embedding)
+
+        # Return the embedding
+        return embedding
+
+
+    def encode_many(self, queries:list[str], model_id:str, model:EmbeddingBackend|EmbeddingClient) -> np.ndarray:
+        """Returns the embeddings of the given queries by the given model (one row per query), like encode(). The queries that
+        aren't cached are embedded in one call to the model."""
+
+        # Look the (distinct) queries up
+        keys:list[tuple[str, str]] = [(normalize_query(query), model_id) for query in queries]
+        embeddings:dict[tuple[str, str], np.ndarray] = {}
+        missing:list[tuple[str, str]] = []
+        for key in dict.fromkeys(keys):
+            embedding:np.ndarray|None = self.get(key)
+            if embedding is None: missing.append(key)
+            else: embeddings[key] = embedding
+
+        # Embed the misses in one batch and cache them
+        if missing:
+            new_embeddings:np.ndarray = np.asarray(model.encode([key[0] for key in missing]), dtype=np.float32).reshape(len(missing), -1)
+            new_embeddings.setflags(write=False)
+            for key, embedding in zip(missing, new_embeddings):
+                embeddings[key] = embedding
+                self.put(key, embedding)
+
+        # Return the embeddings in the order of the queries
+        return np.vstack([embeddings[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+
+    def get(self, key:tuple[str, str]) -> np.ndarray|None:
+        """Returns the cached embedding for the given (normalized query, model id), or None if it isn't cached (or expired).
+        Counts a hit or a miss."""
+
+        with self._lock:
+
+            # Look the key up, dropping it if it expired
+            entry:tuple[float, np.ndarray]|None = self._entries.get(key)
+            if entry is not None and self.ttl_seconds and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+
+            # Miss
+            if entry is None:
+                self.misses += 1
+                return None
+
+            # Hit: mark the entry as most recently used
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+
+    def put(self, key:tuple[str, str], embedding:np.ndarray) -> None:
+        """Caches the given embedding, evicting the least recently used entries if the cache is full."""
+
+        # Nothing to do if the cache is disabled
+        if self.max_size <= 0: return
+
+        # Add the entry and evict the oldest ones
+        with self._lock:
+            self._entries[key] = (time.monotonic(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size: self._entries.popitem(last=False)
+
+
+    def clear(self) -> None:
+        """Empties the cache (the counters are kept)."""
+        with self._lock: self._entries.clear()
+
+
+    def stats(self) -> dict:
+        """Returns the size of the cache and its hit/miss counters."""
+        with self._lock:
+            lookups:int = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,110 @@
+import json
+import threading
+
+from collections import OrderedDict
+from .FileMetadataDatabase import FileMetadataDatabase
+from utils import normalize_query
+
+
+class _CachedResult:
+
+    result:dict                     # The cached response
+    file_hashes:dict[str, str]      # SHA-256 of each file the response was made from (keyed by normalized path)
+
+
+    def __init__(self, result:dict, file_hashes:dict[str, str]):
+        self.result = result
+        self.file_hashes = file_hashes
+
+
+class SearchResultCache:
+    """Bounded LRU cache of /search-files responses, keyed by (normalized query, K, index version, model id, filters). A new index
+    version (see utils.index_version()) gives new keys, so results from an old index are never served; they age out of the
+    cache. A cached result is also dropped as soon as one of the files it was made from changes (its hash in the DB changes)
+    or leaves the index. Shared by the request handlers, so it is thread safe."""
+
+    max_size:int                                    # Max number of cached results (0 disables the cache)
+    hits:int                                        # Lookups served from the cache
+    misses:int                                      # Lookups that had to run the search
+    invalidations:int                               # Cached results dropped because one of their files changed
+
+    _entries:OrderedDict[tuple, _CachedResult]      # Key -> cached result, least recently used first
+    _lock:threading.Lock                            # Guards the entries and counters
+
+
+    def __init__(self, max_size:int=256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def key(query:str, k:int, index_version:str|None, model_id:str, filters:dict|None=None) -> tuple:
+        """Returns the cache key of the given search (filters as parsed by utils.parse_search_filters())."""
+        return (normalize_query(query), k, index_version, model_id, json.dumps(filters, sort_keys=True) if filters else None)
+
+
+    def get(self, key:tuple, file_metadata_db:FileMetadataDatabase) -> dict|None:
+        """Returns the cached result for the given key, or None if it isn't cached or one of its files changed since it was
+        cached (checked against the hashes in the given DB, in one query). Counts a hit or a miss."""
+
+        # Look the key up
+        with self._lock:
+            entry:_CachedResult|None = self._entries.get(key)
+
+        # Check that none of the files changed (outside the lock, so other lookups aren't blocked by the DB)
+        if entry is not None and file_metadata_db.get_file_hashes(list(entry.file_hashes)) != entry.file_hashes:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                    self.invalidations += 1
+            entry = None
+
+        with self._lock:
+
+            # Miss
+            if entry is None:
+                self.misses += 1
+                return None
+
+            # Hit: mark the entry as most recently used (unless it was evicted meanwhile)
+            if key in self._entries: self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.result
+
+
+    def put(self, key:tuple, result:dict, file_hashes:dict[str, str]) -> None:
+        """Caches the given result, made from the files with the given hashes, evicting the least recently used entries if the
+        cache is full."""
+
+        # Nothing to do if the cache is disabled
+        if self.max_size <= 0: return
+
+        # Add the entry and evict the oldest ones
+        with self._lock:
+            self._entries[key] = _CachedResult(result, file_hashes)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size: self._entries.popitem(last=False)
+
+
+    def clear(self) -> None:
+        """Empties the cache (the counters are kept)."""
+        with self._lock: self._entries.clear()
+
+
+    def stats(self) -> dict:
+        """Returns the size of the cache and its hit/miss/invalidation counters."""
+        with self._lock:
+            lookups:int = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,122 @@
+import os
+import time
+import threading
+
+from .OllamaQueryHandler import OllamaQueryHandler
+from .FileMetadataDatabase import FileMetadataDatabase
+from utils import print_log
+
+
+class SummaryPrecomputer:
+    """Summarizes documents in the background while the machine is idle, so that /summarize-document is served from the stored
+    summaries (see OllamaQueryHandler.summarize_file()). The most opened documents are summarized first, then the most recently
+    indexed ones. The machine is idle when the app had no requests for [idle_seconds] and the CPU load is below [max_load]. The 
+    summaries of files that are no longer indexed are pruned after [prune_days] (see FileMetadataDatabase.prune_summaries())."""
+
+    ollama_query_handler:OllamaQueryHandler     # Handler that summarizes the documents
+    metadata_db_path:str                        # Path to the SQLite DB with the file metadata (and the stored summaries)
+    max_length:int                              # Summary settings the summaries are precomputed with (the /summarize-document defaults)
+    overlap:int
+    idle_seconds:float                          # Time (seconds) without requests before the app is idle
+    check_seconds:float                         # Time (seconds) between idle checks
+    max_load:float                              # Max 1 minute load average per CPU for the machine to be idle (0 disables the check)
+    batch_size:int                              # Documents looked up per check (most opened and most recently indexed each)
+    prune_days:float                            # Age (days) after which the summaries of files that are no longer indexed are deleted (0 disables)
+    summarized:int                              # Documents summarized so far
+    last_activity:float                         # Time (time.monotonic()) of the last request
+
+    _skipped:set[str]                           # Hashes of the documents that can't be summarized (failed, missing or changed since indexed)
+    _stop_event:threading.Event                 # Set to stop the background thread
+    _thread:threading.Thread|None               # The background thread (if started)
+
+
+    def __init__(self, ollama_query_handler:OllamaQueryHandler, metadata_db_path:str, max_length:int=500, overlap:int=100,
+                 idle_seconds:float=300, check_seconds:float=60, max_load:float=0.5, batch_size:int=20, prune_days:float=30):
+        self.ollama_query_handler = ollama_query_handler
+        self.metadata_db_path = metadata_db_path
+        self.max_length = max_length
+        self.overlap = overlap
+        self.idle_seconds = idle_seconds
+        self.check_seconds = check_seconds
+        self.max_load = max_load
+        self.batch_size = batch_size
+        self.prune_days = prune_days
+        self.summarized = 0
+        self.last_activity = time.monotonic()
+
+        self._skipped = set()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+
+    def touch(self) -> None:
+        """Records activity (e.g. a request), which postpones the precomputation for [idle_seconds]."""
+        self.last_activity = time.monotonic()
+
+
+    def is_idle(self) -> bool:
+        """Checks if the app had no activity for [idle_seconds] and the machine's CPU load is low (where it can be measured)."""
+        if time.monotonic() - self.last_activity < self.idle_seconds: return False
+        if self.max_load and hasattr(os, 'getloadavg'): return os.getloadavg()[0] / (os.cpu_count() or 1) < self.max_load
+        return True
+
+
+    def start(self) -> None:
+        """Starts precomputing in a background (daemon) thread."""
+        if self._thread is not None and self._thread.is_alive(): return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, name='summary-precompute', daemon=True)
+        self._thread.start()
+
+
+    def stop(self) -> None:
+        """Stops the background thread (after the document being summarized, if any)."""
+        self._stop_event.set()
+        if self._thread is not None: self._thread.join()
+
+
+    def run(self) -> None:
+        """Precomputes summaries whenever the machine is idle, until stopped."""
+
+        # The DB connection is made in this thread (SQLite connections can't be shared between threads)
+        file_metadata_db:FileMetadataDatabase = FileMetadataDatabase(self.metadata_db_path)
+        while not self._stop_event.wait(self.check_seconds):
+            try: self.precompute(file_metadata_db)
+            except Exception as e: print_log('ERROR', 'SummaryPrecomputer.run()', f'Caught exception: {e.__class__} - {e}')
+
+
+    def precompute(self, file_metadata_db:FileMetadataDatabase) -> int:
+        """Summarizes the documents without a summary, one at a time, for as long as the machine stays idle. Returns the number of
+        documents summarized."""
+
+        # Prune the summaries of files that are no longer indexed
+        if self.prune_days and self.is_idle(): 
+            pruned:int = file_metadata_db.prune_summaries(self.prune_days)
+            if pruned: print_log('INFO', 'SummaryPrecomputer.precompute()', f'Pruned {pruned} summaries of files that are no longer indexed.')
+
+        # Summarize each document (checking that the machine is still idle before each one), leaving out the skipped ones
+        summarized:int = 0
+        for _, file_path, file_sha256 in file_metadata_db.get_unsummarized_files(
+            self.ollama_query_handler.model, self.max_length, self.overlap, self.batch_size, exclude=self._skipped
+        ):
+            if self._stop_event.is_set() or not self.is_idle(): break
+            if not os.path.isfile(file_path): 
+                self._skipped.add(file_sha256)
+                continue
+
+            try:
+                self.ollama_query_handler.summarize_file(file_path, file_metadata_db, max_length=self.max_length, overlap=self.overlap)
+                summarized += 1
+            except Exception as e:
+                self._skipped.add(file_sha256)
+                print_log('WARN', 'SummaryPrecomputer.precompute()', f'Failed to summarize "{file_path}": {e.__class__} - {e}')
+                continue
+
+            # A file that changed since it was indexed is summarized under its new hash: skip its row until it is re-indexed
+            if file_metadata_db.get_summary(file_sha256, self.ollama_query_handler.model, self.max_length, self.overlap) is None: 
+                self._skipped.add(file_sha256)
+
+        # Info print and return the count
+        if summarized: print_log('INFO', 'SummaryPrecomputer.precompute()', f'Precomputed the summaries of {summarized} document(s).')
+        self.summarized += summarized
+        return summarized
@@ -0,0 +1,163 @@
+import time
+import sqlite3 as sql
+
+from .FileMetadataDatabase import FileMetadataDatabase
+from utils import normalize_path
+
+
+class WorkQueue:
+
+    db_path:str             # Path to the DB file (the "work_queue" table lives in the file metadata DB)
+    cxn:sql.Connection      # Connection to the db (autocommit, transactions are opened explicitly)
+    lease_seconds:float     # How long a claimed task stays leased without a heartbeat
+    max_attempts:int        # Tasks are marked "failed" after this many claims
+    create_tables_script:str    # Path to the sql script to create the tables for the db
+
+
+    def __init__(self, db_path:str, lease_seconds:float=60, max_attempts:int=3, create_tables_script:str=FileMetadataDatabase.CREATE_TABLES_SCRIPT):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.create_tables_script = create_tables_script
+
+        # Connection (isolation_level=None so that claims can use BEGIN IMMEDIATE to take the write lock up front)
+        self.cxn = sql.connect(db_path, timeout=30, isolation_level=None)
+        self.cxn.execute('PRAGMA journal_mode=WAL')
+
+        # Make sure the tables exist
+        with open(create_tables_script, 'r') as file:
+            self.cxn.executescript(file.read())
+
+
+    def enqueue(self, tasks:list[tuple[str, str, float]]) -> None:
+        """Adds the given (task_type, path, priority) tasks to the queue. Tasks that are already queued are left as they are, and
+        tasks that are done/failed are queued again (so that re-crawling a root picks up changes).
+
+            Parameters:
+                tasks (list[tuple[str, str, float]]): the tasks; task_type must be "directory" or "file".
+
+            Returns:
+                None: inserts/updates the rows in the "work_queue" table.
+        """
+
+        # Nothing to do
+        if not tasks: return
+
+        # Insert the tasks in a single transaction
+        self.cxn.execute('BEGIN IMMEDIATE')
+        try:
+            self.cxn.executemany(
+                '''
+                    INSERT INTO work_queue (task_type, path, priority) VALUES (?, ?, ?)
+                    ON CONFLICT(task_type, path) DO UPDATE SET
+                        status = 'pending', priority = excluded.priority, attempts = 0, lease_owner = NULL, lease_expires = NULL, error = NULL
+                    WHERE status IN ('done', 'failed')
+                ''',
+                [(task_type, normalize_path(path), priority) for task_type, path, priority in tasks]
+            )
+            self.cxn.execute('COMMIT')
+
+        # Roll back on any error
+        except Exception:
+            self.cxn.execute('ROLLBACK')
+            raise
+
+
+    def claim(self, worker_id:str, limit:int=1) -> list[tuple[int, str, str]]:
+        """Claims up to [limit] of the highest priority tasks for the given worker. Pending tasks and tasks whose lease expired
+        (i.e. the worker that claimed them stopped heartbeating) can be claimed; expired tasks that were already claimed
+        [self.max_attempts] times are marked "failed" instead.
+
+            Parameters:
+                worker_id (str): unique id of the claiming worker.
+                limit (int, optional): max number of tasks to claim. Defaults to 1.
+
+            Returns:
+                list[tuple[int, str, str]]: the (id, task_type, path) of each claimed task (empty if there is nothing to claim).
+        """
+
+        # Get the current time
+        now:float = time.time()
+
+        # Take the write lock up front so that no other worker can claim the same tasks
+        self.cxn.execute('BEGIN IMMEDIATE')
+
+        try:
+            # Give up on tasks that keep killing their workers
+            self.cxn.execute(
+                '''
+                    UPDATE work_queue SET status = 'failed', error = 'lease expired too many times', lease_owner = NULL
+                    WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?
+                ''',
+                (now, self.max_attempts)
+            )
+
+            # Select the tasks to claim
+            rows:list[tuple[int, str, str]] = self.cxn.execute(
+                '''
+                    SELECT id, task_type, path FROM work_queue
+                    WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)
+                    ORDER BY priority DESC, id
+                    LIMIT ?
+                ''',
+                (now, limit)
+            ).fetchall()
+
+            # Lease them
+            self.cxn.executemany(
+                '''
+                    UPDATE work_queue SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1
+                    WHERE id = ?
+                ''',
+                [(worker_id, now + self.lease_seconds, row[0]) for row in rows]
+            )
+
+            # Commit changes
+            self.cxn.execute('COMMIT')
+
+        # Roll back on any error
+        except Exception:
+            self.cxn.execute('ROLLBACK')
+            raise
+
+        # Return the claimed tasks
+        return rows
+
+
+    def heartbeat(self, worker_id:str) -> int:
+        """Extends the lease of every task held by the given worker. Returns the number of tasks extended."""
+        return self.cxn.execute(
+            "UPDATE work_queue SET lease_expires = ? WHERE status = 'leased' AND lease_owner = ?",
+            (time.time() + self.lease_seconds, worker_id)
+        ).rowcount
+
+
+    def complete(self, task_id:int, worker_id:str) -> bool:
+        """Marks the given task as done. Returns False if the worker no longer holds the lease (i.e. it expired and the task was
+        claimed by another worker), in which case the other worker's result wins."""
+        return self.cxn.execute(
+            "UPDATE work_queue SET status = 'done', lease_owner = NULL, lease_expires = NULL WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (task_id, worker_id)
+        ).rowcount > 0
+
+
+    def fail(self, task_id:int, worker_id:str, error:str) -> None:
+        """Releases the given task after an error: it is retried by any worker until it has been claimed [self.max_attempts] times."""
+        self.cxn.execute(
+            '''
+                UPDATE work_queue SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    error = ?, lease_owner = NULL, lease_expires = NULL
+                WHERE id = ? AND status = 'leased' AND lease_owner = ?
+            ''',
+            (self.max_attempts, error, task_id, worker_id)
+        )
+
+
+    def counts(self) -> dict[str, int]:
+        """Returns the number of tasks in each status."""
+        return dict(self.cxn.execute('SELECT status, COUNT(*) FROM work_queue GROUP BY status').fetchall())
+
+
+    def is_drained(self) -> bool:
+        """Returns True if there are no pending or leased tasks left."""
+        return self.cxn.execute("SELECT 1 FROM work_queue WHERE status IN ('pending', 'leased') LIMIT 1").fetchone() is None
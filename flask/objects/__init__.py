@@ -1,3 +1,19 @@
+from .OllamaClientPool import OllamaClientPool
 from .OllamaQueryHandler import OllamaQueryHandler
+from .IndexingJob import IndexingJob
+from .EmbeddingBackend import EmbeddingBackend
+from .EmbeddingClient import EmbeddingClient
+from .EmbeddingModelRegistry import EmbeddingModelRegistry
+from .EmbeddingService import EmbeddingService
+from .EmbeddingMigration import EmbeddingMigration
+from .QueryEmbeddingCache import QueryEmbeddingCache
+from .SearchResultCache import SearchResultCache
+from .CrossEncoderReranker import CrossEncoderReranker
+from .SummaryPrecomputer import SummaryPrecomputer
 from .FilesystemIndexer import FilesystemIndexer
-from .FileMetadataDatabase import FileMetadataDatabase
\ No newline at end of file
+from .FileMetadataDatabase import FileMetadataDatabase
+from .FilesystemWatcher import FilesystemWatcher
+from .IndexingJobManager import IndexingJobManager
+from .CrawlScheduler import CrawlScheduler
+from .WorkQueue import WorkQueue
+from .CrawlWorker import CrawlWorker
\ No newline at end of file
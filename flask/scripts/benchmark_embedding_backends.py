@@ -0,0 +1,142 @@
+"""
+benchmark_embedding_backends.py
+
+DESC: compares the embedding backends (see EmbeddingBackend.BACKENDS) against the full precision PyTorch model. For each backend it 
+reports the cosine agreement with the PyTorch embeddings (parity check) and the throughput, and then recommends the fastest backend 
+whose worst-case cosine agreement is within the tolerance. Run from the flask/ dir: 
+
+    python scripts/benchmark_embedding_backends.py [<dir with documents>] [--threads N] [--tolerance 0.99]
+
+The documents in the given dir (defaults to ../test_pdfs) are used as the benchmark texts. Set "[embedding] BACKEND" in 
+config/config.conf to the recommended backend to use it. The ONNX backends need "optimum[onnxruntime]" (in requirements.txt); 
+backends that fail to load are skipped.
+"""
+
+# Modify sys path for util and obj imports 
+import sys
+import os
+
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import time
+import argparse
+import numpy as np
+from configparser import ConfigParser
+from objects import EmbeddingBackend, EmbeddingModelRegistry
+from utils import print_log, read_file, SUPPORTED_EXTENSIONS
+
+
+def load_texts(directory:str) -> list[str]: 
+    """Reads every supported file under the given dir, and splits each into ~paragraph sized texts so that there are enough texts 
+    of realistic lengths to benchmark."""
+    
+    # Init the list of texts
+    texts:list[str] = []
+    
+    # Read each file 
+    for root, _, files in os.walk(directory): 
+        for file in files: 
+            if not file.endswith(SUPPORTED_EXTENSIONS): continue
+            try: 
+                words:list[str] = read_file(os.path.join(root, file)).split()
+            except Exception as e: 
+                print_log('WARN', 'load_texts()', f'Could not read "{file}": {e}')
+                continue
+            
+            # Split into texts of 200 words
+            texts.extend(' '.join(words[i:i+200]) for i in range(0, len(words), 200))
+            
+    # Return the texts
+    return texts
+
+
+def cosine_agreement(reference:np.ndarray, candidate:np.ndarray) -> np.ndarray: 
+    """Returns the cosine similarity between each row of the reference embeddings and the matching row of the candidate embeddings."""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    return np.sum(reference * candidate, axis=1)
+
+
+def benchmark(backend:EmbeddingBackend, texts:list[str], batch_size:int) -> tuple[np.ndarray, float]: 
+    """Embeds the texts with the given backend (after a warm-up batch) and returns the embeddings and the throughput (texts/sec)."""
+    
+    # Warm up (first calls allocate buffers, load kernels, etc.)
+    backend.encode(texts[:batch_size], batch_size=batch_size)
+    
+    # Time the whole set
+    start:float = time.perf_counter()
+    embeddings:np.ndarray = backend.encode(texts, batch_size=batch_size)
+    elapsed:float = time.perf_counter() - start
+    
+    # Return the embeddings and throughput
+    return np.asarray(embeddings, dtype=np.float32), len(texts) / elapsed
+
+
+if __name__ == '__main__': 
+    
+    # ---- Args ---- #
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description='Compare the embedding backends against the PyTorch model.')
+    parser.add_argument('directory', nargs='?', default='../test_pdfs', help='dir with the documents to embed')
+    parser.add_argument('--threads', type=int, default=None, help='CPU threads per backend (defaults to "[embedding] NUM_THREADS")')
+    parser.add_argument('--batch-size', type=int, default=32, help='batch size')
+    parser.add_argument('--tolerance', type=float, default=0.99, help='min cosine agreement with the PyTorch embeddings')
+    args:argparse.Namespace = parser.parse_args()
+    
+    # ---- Config ---- #
+    config:ConfigParser = ConfigParser() 
+    config.read('config/config.conf')
+    model_registry:EmbeddingModelRegistry = EmbeddingModelRegistry.from_config(config, use_service=False)
+    MODEL_NAME:str = model_registry.models[model_registry.default_model_id]
+    CACHE_DIR:str = config['embedding']['CACHE_DIR']
+    NUM_THREADS:int = int(config['embedding']['NUM_THREADS']) if args.threads is None else args.threads
+    
+    # ---- Texts ---- #
+    texts:list[str] = load_texts(args.directory)
+    if not texts: 
+        print_log('ERROR', 'benchmark_embedding_backends.py', f'No readable documents found in "{args.directory}".')
+        quit()
+    print_log('INFO', 'benchmark_embedding_backends.py', f'Benchmarking {len(texts)} texts with {NUM_THREADS or "default"} thread(s).')
+        
+    # ---- Benchmark ---- #
+    # Init the results: { backend : (min cosine, mean cosine, texts/sec) }
+    results:dict[str, tuple[float, float, float]] = {}
+    reference:np.ndarray|None = None
+    
+    # Run each backend (PyTorch first, as the reference)
+    for name in EmbeddingBackend.BACKENDS: 
+        try: 
+            backend:EmbeddingBackend = EmbeddingBackend(MODEL_NAME, backend=name, num_threads=NUM_THREADS, cache_dir=CACHE_DIR)
+            embeddings, throughput = benchmark(backend, texts, args.batch_size)
+        except Exception as e: 
+            print_log('WARN', 'benchmark_embedding_backends.py', f'Skipping backend "{name}": {e.__class__} - {e}')
+            continue
+        
+        # Compare to the reference
+        if reference is None: reference = embeddings
+        agreement:np.ndarray = cosine_agreement(reference, embeddings)
+        results[name] = (float(agreement.min()), float(agreement.mean()), throughput)
+        
+    # ---- Report ---- #
+    # Nothing to report if every backend failed
+    if not results: 
+        print_log('ERROR', 'benchmark_embedding_backends.py', 'No backend could be benchmarked.')
+        quit()
+        
+    # Compare to the reference (PyTorch, unless it failed and another backend was the first to run)
+    reference_name:str = next(iter(results))
+    if reference_name != 'torch': 
+        print_log('WARN', 'benchmark_embedding_backends.py', f'The PyTorch backend failed, so "{reference_name}" is the reference.')
+    print(f'\n{"backend":<12} {"min cos":>9} {"mean cos":>9} {"texts/sec":>10} {"speedup":>8}')
+    for name, (min_cos, mean_cos, throughput) in results.items(): 
+        print(f'{name:<12} {min_cos:>9.4f} {mean_cos:>9.4f} {throughput:>10.1f} {throughput / results[reference_name][2]:>7.2f}x')
+        
+    # Recommend the fastest backend within tolerance 
+    print()
+    within_tolerance:dict[str, tuple[float, float, float]] = {k: v for k, v in results.items() if v[0] >= args.tolerance}
+    if not within_tolerance: 
+        print_log('WARN', 'benchmark_embedding_backends.py', f'No backend is within tolerance (min cos >= {args.tolerance}).')
+        quit()
+    best:str = max(within_tolerance, key=lambda k: within_tolerance[k][2])
+    print_log('SUCCESS', 'benchmark_embedding_backends.py', f'Fastest backend within tolerance (min cos >= {args.tolerance}): "{best}".')
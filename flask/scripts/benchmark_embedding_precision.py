@@ -0,0 +1,121 @@
+"""
+benchmark_embedding_precision.py
+
+DESC: compares the embedding storage precisions and Faiss index types (see EMBEDDING_DTYPES and INDEX_TYPES in 
+utils/indexer_utils.py) against the float32 / flat baseline, using the embeddings in the metadata DB. For each combination it 
+reports the bytes per file (DB blob and index) and the recall@K of the baseline's nearest neighbours. Run from the flask/ dir: 
+
+    python scripts/benchmark_embedding_precision.py [--k 10] [--queries 500]
+
+A random sample of the stored embeddings is used as the queries (each query's own entry is excluded from the results). Set 
+"[index] STORAGE_DTYPE" and "[index] INDEX_TYPE" in config/config.conf to the chosen combination; the index is rebuilt in the 
+new type the next time it is loaded.
+"""
+
+# Modify sys path for util and obj imports 
+import sys
+import os
+
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import argparse
+import faiss
+import numpy as np
+from configparser import ConfigParser
+from objects import FileMetadataDatabase
+from utils import print_log, blob_to_embedding, new_faiss_index, EMBEDDING_DTYPES
+
+
+# Combinations to compare (storage dtype, index type); the first is the baseline
+COMBINATIONS:list[tuple[str, str]] = [
+    ('float32', 'flat'), 
+    ('float16', 'flat'), 
+    ('float16', 'fp16'), 
+    ('float16', 'sq8'), 
+    ('float16', 'sq4')
+]
+
+
+def search(embeddings:np.ndarray, ids:np.ndarray, queries:np.ndarray, query_ids:np.ndarray, storage_dtype:str, index_type:str, 
+           k:int) -> tuple[np.ndarray, int]: 
+    """Builds an index of the given type from the embeddings (round tripped through the given storage precision) and searches it.
+    
+        Returns: 
+            tuple[np.ndarray, int]: the ids of the top [k] results of each query (excl. the query itself), and the size of the 
+            serialized index in bytes.
+    """
+    
+    # Round trip the embeddings through the storage precision (as if read back from the DB)
+    stored:np.ndarray = embeddings.astype(EMBEDDING_DTYPES[storage_dtype]).astype(np.float32)
+    
+    # Build the index
+    index:faiss.IndexIDMap = new_faiss_index(embeddings.shape[1], index_type)
+    if not index.is_trained: index.train(stored)
+    index.add_with_ids(stored, ids)
+    
+    # Search (one extra result, since each query finds itself)
+    _, results = index.search(queries, k + 1)
+    
+    # Drop each query's own id and keep the top [k]
+    top_k:np.ndarray = np.array([[i for i in row if i != query_id][:k] for row, query_id in zip(results, query_ids)])
+    
+    # Return the results and the index size
+    return top_k, faiss.serialize_index(index).size
+
+
+if __name__ == '__main__': 
+    
+    # ---- Args ---- #
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description='Compare embedding precisions and index types against float32.')
+    parser.add_argument('--k', type=int, default=10, help='number of neighbours to compare (recall@K)')
+    parser.add_argument('--queries', type=int, default=500, help='number of stored embeddings to use as queries')
+    args:argparse.Namespace = parser.parse_args()
+    
+    # ---- Config ---- #
+    config:ConfigParser = ConfigParser() 
+    config.read('config/config.conf')
+    METADATA_DB_PATH:str = config['paths']['METADATA_DB_PATH']
+    
+    # ---- Data ---- #
+    # Load the embeddings of the active model
+    file_metadata_db:FileMetadataDatabase = FileMetadataDatabase(METADATA_DB_PATH)
+    active_model:dict|None = file_metadata_db.get_active_model()
+    if active_model is None: 
+        print_log('ERROR', 'benchmark_embedding_precision.py', f'No embedding model is active in "{METADATA_DB_PATH}". Index some files first.')
+        quit()
+    EMBEDDING_DIM:int = active_model['dim']
+    rows:list[tuple[int, bytes]] = file_metadata_db.get_all_embeddings(active_model['model_id'])
+    if len(rows) <= args.k: 
+        print_log('ERROR', 'benchmark_embedding_precision.py', f'Need more than {args.k} embeddings in "{METADATA_DB_PATH}" (found {len(rows)}). Index some files first.')
+        quit()
+    embeddings:np.ndarray = np.vstack([blob_to_embedding(blob, EMBEDDING_DIM) for _, blob in rows])
+    ids:np.ndarray = np.array([row_id for row_id, _ in rows], dtype=np.int64)
+    
+    # Sample the queries
+    sample:np.ndarray = np.random.default_rng(0).choice(len(rows), size=min(args.queries, len(rows)), replace=False)
+    queries:np.ndarray = embeddings[sample]
+    query_ids:np.ndarray = ids[sample]
+    print_log('INFO', 'benchmark_embedding_precision.py', f'Comparing on {len(rows)} embeddings with {len(sample)} queries (recall@{args.k}).')
+    
+    # ---- Benchmark ---- #
+    # Baseline results
+    baseline, _ = search(embeddings, ids, queries, query_ids, *COMBINATIONS[0], args.k)
+    
+    # Report each combination
+    print(f'\n{"storage":<8} {"index":<6} {"DB B/file":>10} {"index B/file":>13} {"total MB / 1M files":>20} {"recall@" + str(args.k):>10}')
+    for storage_dtype, index_type in COMBINATIONS: 
+        
+        # Search
+        results, index_bytes = search(embeddings, ids, queries, query_ids, storage_dtype, index_type, args.k)
+        
+        # Recall of the baseline's neighbours
+        recall:float = np.mean([len(set(r) & set(b)) / args.k for r, b in zip(results, baseline)])
+        
+        # Memory per file
+        db_bytes:int = EMBEDDING_DIM * np.dtype(EMBEDDING_DTYPES[storage_dtype]).itemsize
+        index_bytes_per_file:float = index_bytes / len(rows)
+        total_mb:float = (db_bytes + index_bytes_per_file) * 1e6 / 2**20
+        
+        print(f'{storage_dtype:<8} {index_type:<6} {db_bytes:>10} {index_bytes_per_file:>13.1f} {total_mb:>20.1f} {recall:>10.4f}')
@@ -0,0 +1,127 @@
+"""
+benchmark_ollama_ttft.py
+
+DESC: measures the time to first token (TTFT) of the get_confidence() requests to the Ollama model as reported by the server (model
+load + prompt evaluation). It compares a cold start (the model is unloaded first) with a warmed up model (see
+OllamaQueryHandler.warm_up()), and the prompt layout with the query first (as it was) with the static instructions first (as it is),
+over a few different queries: with the instructions first, the server reuses their evaluation from the previous request (prompt
+prefix cache), so fewer prompt tokens are evaluated. Run from the flask/ dir (with the Ollama server running):
+
+    python scripts/benchmark_ollama_ttft.py [<dir with documents>] [--files 3] [--queries 5]
+
+The first files in the given dir (defaults to ../test_pdfs) are used as the documents. Set "[ollama] KEEP_ALIVE" and
+"[ollama] KEEP_WARM_SECONDS" in config/config.conf to keep the model loaded.
+"""
+
+# Modify sys path for util and obj imports
+import sys
+import os
+
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import argparse
+from configparser import ConfigParser
+from ollama import Client as OllamaClient
+from objects import OllamaQueryHandler
+from utils import print_log, read_file, SUPPORTED_EXTENSIONS
+
+
+# Queries the documents are ranked for (they differ from the start, like real queries)
+QUERIES:list[str] = [
+    'invoice from the electricity company',
+    'notes about the project meeting',
+    'a recipe that uses chocolate',
+    'tax return for last year',
+    'the lease agreement for the apartment',
+    'research paper about neural networks',
+    'travel itinerary with flight times'
+]
+
+
+def load_documents(directory:str, count:int) -> dict[str, str]:
+    """Reads the first [count] supported files under the given dir, as { filename : text }."""
+    documents:dict[str, str] = {}
+    for root, _, files in os.walk(directory):
+        for file in sorted(files):
+            if len(documents) == count: return documents
+            if not file.endswith(SUPPORTED_EXTENSIONS): continue
+            try: documents[file] = read_file(os.path.join(root, file))
+            except Exception as e: print_log('WARN', 'load_documents()', f'Could not read "{file}": {e}')
+    return documents
+
+
+def query_first_prompt(handler:OllamaQueryHandler, query:str, documents:dict[str, str], output:str) -> str:
+    """Returns the get_confidence() prompt with the query before the instructions (the layout before the instructions were moved
+    first), with the same documents."""
+    prompt, _ = handler.build_confidence_prompt(query, documents, output=output)
+    query_section:str = f'\n            \nHere is the query: "{query}"\n'
+    return query_section + prompt.replace(query_section, '', 1)
+
+
+def run_queries(handler:OllamaQueryHandler, documents:dict[str, str], queries:list[str], query_first:bool) -> list[dict]:
+    """Ranks the documents for each query (in the given layout) and returns the timings of each request."""
+    timings:list[dict] = []
+    output:str = handler.confidence_output
+    for query in queries:
+        prompt:str = query_first_prompt(handler, query, documents, output) if query_first else handler.build_confidence_prompt(query, documents, output=output)[0]
+        handler.generate(prompt, format=OllamaQueryHandler.confidence_schema(len(documents), output), max_tokens=OllamaQueryHandler.RESPONSE_TOKENS_PER_DOCUMENT[output] * len(documents) + 16)
+        timings.append(handler.timings[-1])
+    return timings
+
+
+def mean(timings:list[dict], key:str) -> float:
+    """Returns the mean of the given timing (0 where it wasn't reported)."""
+    return sum(timing[key] or 0 for timing in timings) / len(timings) if timings else 0.0
+
+
+if __name__ == '__main__':
+
+    # ---- Args ---- #
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description='Measure the time to first token of the Ollama model.')
+    parser.add_argument('directory', nargs='?', default='../test_pdfs', help='dir with the documents to rank')
+    parser.add_argument('--files', type=int, default=3, help='documents per request')
+    parser.add_argument('--queries', type=int, default=5, help=f'queries per layout (at most {len(QUERIES)})')
+    args:argparse.Namespace = parser.parse_args()
+
+    # ---- Config ---- #
+    config:ConfigParser = ConfigParser()
+    config.read('config/config.conf')
+    client:OllamaClient = OllamaClient(host=config['ollama']['OLLAMA_URL'])
+    handler:OllamaQueryHandler = OllamaQueryHandler(
+        client,
+        config['ollama']['OLLAMA_MODEL'],
+        context_tokens=int(config['ollama']['CONTEXT_TOKENS']),
+        confidence_output=config['ollama']['CONFIDENCE_OUTPUT'].strip(),
+        keep_alive=config['ollama']['KEEP_ALIVE'].strip()
+    )
+
+    # ---- Documents ---- #
+    documents:dict[str, str] = load_documents(args.directory, args.files)
+    if not documents:
+        print_log('ERROR', 'benchmark_ollama_ttft.py', f'No readable documents found in "{args.directory}".')
+        quit()
+    queries:list[str] = QUERIES[:max(1, args.queries)]
+    print_log('INFO', 'benchmark_ollama_ttft.py', f'Measuring with {len(documents)} document(s) and {len(queries)} queries per layout.')
+
+    # ---- Cold vs warm ---- #
+    # Unload the model, then time a request (cold start)
+    client.generate(model=handler.model, prompt='', keep_alive=0)
+    cold:list[dict] = run_queries(handler, documents, queries[:1], query_first=False)
+
+    # Warm up, then time the same request (with a different query, so its evaluation isn't reused)
+    handler.warm_up()
+    warm:list[dict] = run_queries(handler, documents, queries[1:2] or queries, query_first=False)
+
+    # ---- Prompt layout ---- #
+    # The layouts are run one after another on the loaded model, so each request can reuse the previous one's prefix
+    query_first:list[dict] = run_queries(handler, documents, queries, query_first=True)
+    instructions_first:list[dict] = run_queries(handler, documents, queries, query_first=False)
+
+    # ---- Report ---- #
+    print(f'\n{"run":<22} {"requests":>8} {"load ms":>9} {"prompt toks":>11} {"prompt ms":>10} {"TTFT ms":>9}')
+    for name, timings in [('cold start', cold), ('warmed up', warm), ('query first', query_first), ('instructions first', instructions_first)]:
+        print(f'{name:<22} {len(timings):>8} {mean(timings, "load_ms"):>9.1f} {mean(timings, "prompt_eval_tokens"):>11.1f} {mean(timings, "prompt_eval_ms"):>10.1f} {mean(timings, "ttft_ms"):>9.1f}')
+    print()
+    print_log('SUCCESS', 'benchmark_ollama_ttft.py', f'Warming up saved {mean(cold, "ttft_ms") - mean(warm, "ttft_ms"):.0f} ms; the instructions first saved {mean(query_first, "ttft_ms") - mean(instructions_first, "ttft_ms"):.0f} ms per request.')
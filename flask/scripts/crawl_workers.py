@@ -0,0 +1,110 @@
+"""
+crawl_workers.py
+
+DESC: indexes the given root dirs with several worker processes that share a work queue in the metadata DB (see the "work_queue" 
+table). Run from the flask/ dir: 
+
+    python scripts/crawl_workers.py <root> [<root> ...] [--workers N]
+
+Seeds the queue with the roots, starts N worker processes (defaults to "[work_queue] WORKERS" in config/config.conf, or the number 
+of CPUs if that is 0), waits for the queue to drain and then publishes the Faiss index from the embeddings in the DB. More workers 
+(e.g. on another machine with access to the same DB) can join an existing crawl with: 
+
+    python scripts/crawl_workers.py --join [--workers N]
+
+Workers that crash lose their leases after "[work_queue] LEASE_SECONDS" and their tasks are claimed by the other workers.
+"""
+
+# Modify sys path for util and obj imports 
+import sys
+import os
+
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import argparse
+import multiprocessing as mp
+from configparser import ConfigParser
+from objects import FilesystemIndexer, CrawlScheduler, CrawlWorker, WorkQueue, EmbeddingModelRegistry
+from utils import print_log
+
+
+# ---- Config ---- #
+# Load config
+config:ConfigParser = ConfigParser() 
+config.read('config/config.conf')
+
+# Extract required vars
+INDEX_BIN_PATH:str = config['paths']['INDEX_BIN_PATH']
+METADATA_DB_PATH:str = config['paths']['METADATA_DB_PATH']
+STORAGE_DTYPE:str = config['index']['STORAGE_DTYPE']
+INDEX_TYPE:str = config['index']['INDEX_TYPE']
+LEASE_SECONDS:float = float(config['work_queue']['LEASE_SECONDS'])
+MAX_ATTEMPTS:int = int(config['work_queue']['MAX_ATTEMPTS'])
+WORKERS:int = int(config['work_queue']['WORKERS']) or os.cpu_count()
+USE_EMBEDDING_SERVICE:bool = config.getboolean('embedding', 'USE_SERVICE')
+
+
+def load_models(num_threads:int|None=None) -> EmbeddingModelRegistry: 
+    """Returns the embedding models, used through the shared embedding service if it is enabled (so the processes don't each load 
+    a copy of the model), else loaded in this process."""
+    return EmbeddingModelRegistry.from_config(config, num_threads=num_threads)
+
+
+def run_worker(num_threads:int, verbose:bool) -> None: 
+    """Entry point of each worker process: claims and processes tasks until the queue is drained."""
+    
+    # Create the indexer (connects to the embedding service or loads the model) and the queue in this process
+    indexer:FilesystemIndexer = FilesystemIndexer(None, METADATA_DB_PATH, INDEX_BIN_PATH, load_models(num_threads), STORAGE_DTYPE, INDEX_TYPE)
+    work_queue:WorkQueue = WorkQueue(METADATA_DB_PATH, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS)
+    
+    # Work
+    CrawlWorker(work_queue, indexer).run(verbose=verbose)
+    
+
+if __name__ == '__main__': 
+    
+    # ---- Args ---- #
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description='Index the given roots with several worker processes.')
+    parser.add_argument('roots', nargs='*', help='dirs to index (recursively)')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='number of worker processes')
+    parser.add_argument('--join', action='store_true', help='join an existing crawl instead of seeding a new one')
+    parser.add_argument('--verbose', action='store_true', help='print debug info')
+    args:argparse.Namespace = parser.parse_args()
+    
+    # Check that roots are given (unless joining)
+    if not args.roots and not args.join: 
+        parser.error('give at least one root (or --join an existing crawl)')
+    
+    # ---- Seed ---- #
+    # Queue the roots (scored like any other dir)
+    indexer:FilesystemIndexer = FilesystemIndexer(None, METADATA_DB_PATH, INDEX_BIN_PATH, load_models(), STORAGE_DTYPE, INDEX_TYPE)
+    if args.roots: 
+        scheduler:CrawlScheduler = CrawlScheduler(None, indexer.file_metadata_db)
+        WorkQueue(METADATA_DB_PATH, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS).enqueue([
+            ('directory', root, scheduler.score(root, os.path.getmtime(root))) for root in args.roots
+        ])
+        
+    # ---- Work ---- #
+    # Split the CPUs between the workers unless a thread count is configured (each worker running on every core oversubscribes the CPU)
+    num_threads:int = int(config['embedding']['NUM_THREADS']) or max(1, os.cpu_count() // args.workers)
+    
+    # Start the workers (spawned rather than forked so each gets a clean copy of torch)
+    if USE_EMBEDDING_SERVICE: print_log('INFO', 'crawl_workers.py', f'Starting {args.workers} worker(s) using the embedding service at "{config["embedding"]["SERVICE_SOCKET"]}".')
+    else: print_log('INFO', 'crawl_workers.py', f'Starting {args.workers} worker(s) with {num_threads} thread(s) each.')
+    ctx = mp.get_context('spawn')
+    workers:list[mp.Process] = [ctx.Process(target=run_worker, args=(num_threads, args.verbose)) for _ in range(args.workers)]
+    for worker in workers: worker.start()
+    for worker in workers: worker.join()
+    
+    # ---- Publish ---- #
+    # Rebuild the index from the embeddings the workers wrote to the DB and save it (with the model that is active now), holding 
+    # the index lock so a watcher or indexing job that loaded the index before can't overwrite it with its older copy
+    with indexer.index_lock(): 
+        indexer.refresh_model()
+        indexer.save_index(indexer.rebuild_index())
+    
+    # Info print
+    counts:dict[str, int] = WorkQueue(METADATA_DB_PATH).counts()
+    print_log('SUCCESS', 'crawl_workers.py', f'FAISS index saved to "{indexer.index_bin_path}". Tasks: {counts}')
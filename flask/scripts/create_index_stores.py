@@ -29,7 +29,6 @@ config.read('config/config.conf')
 # Extract required vars
 INDEX_BIN_PATH:str = config['paths']['INDEX_BIN_PATH']
 METADATA_DB_PATH:str = config['paths']['METADATA_DB_PATH']
-EMBEDDING_DIM:int = int(config['index']['EMBEDDING_DIM'])
 
 # Create the output directories if they don't exist
 os.makedirs(os.path.dirname(INDEX_BIN_PATH), exist_ok=True)
@@ -77,6 +76,7 @@ if os.path.exists(METADATA_DB_PATH):
 # ---- Setup ---- #
 # Create model
 model:SentenceTransformer = SentenceTransformer('all-MiniLM-L6-v2')  
+EMBEDDING_DIM:int = model.get_sentence_embedding_dimension()
 
 # Create index 
 index:faiss.IndexFlatL2 = faiss.IndexFlatL2(EMBEDDING_DIM)
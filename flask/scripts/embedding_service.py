@@ -0,0 +1,54 @@
+"""
+embedding_service.py
+
+DESC: runs the shared embedding service. It serves the sentence transformers registered in "[models]" (config/config.conf), 
+loading each one once on first use, and embeds texts for every client (the flask server, the watcher and the crawl workers) over the Unix socket at 
+"[embedding] SERVICE_SOCKET". Requests that arrive within "[embedding] MAX_WAIT_MS" of each other are embedded together in one 
+batch of up to "[embedding] MAX_BATCH_SIZE" texts. Run from the flask/ dir (before the other processes): 
+
+    python scripts/embedding_service.py
+
+Clients use the service when "[embedding] USE_SERVICE" is true. It is off by default (each process loads its own copy of the model),
+since clients fail if the service isn't running.
+"""
+
+# Modify sys path for util and obj imports 
+import sys
+import os
+
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import signal
+import threading
+from configparser import ConfigParser
+from objects import EmbeddingService
+from utils import print_log
+
+
+# ---- Config ---- #
+# Load config
+config:ConfigParser = ConfigParser() 
+config.read('config/config.conf')
+
+
+# ---- Serve ---- #
+if __name__ == '__main__': 
+    
+    # Bind the socket and load the default model up front (other models are loaded when first requested, e.g. by a migration)
+    service:EmbeddingService = EmbeddingService.from_config(config)
+    service.model_registry.get(service.model_registry.default_model_id)
+    
+    # Shut down cleanly on SIGTERM / Ctrl+C (shutdown() must be called from another thread than serve_forever())
+    def stop(signum, frame) -> None: 
+        threading.Thread(target=service.shutdown).start()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    
+    # Serve until stopped
+    print_log('SUCCESS', 'embedding_service.py', f'Serving {tuple(service.model_registry.models)} at "{service.socket_path}".')
+    service.serve_forever()
+    
+    # Report the batching stats
+    print_log('INFO', 'embedding_service.py', f'Stopped. Stats: {service.stats()}')
@@ -0,0 +1,63 @@
+"""
+migrate_embeddings.py
+
+DESC: moves the corpus to another embedding model from the "[models]" registry in config/config.conf. Every file is re-embedded 
+with the new model in batches while the current model and index keep serving searches, then the new model's index is built and 
+the DB cuts over to it atomically (the flask server, watcher and crawl workers switch to the new model on their own). Run from 
+the flask/ dir: 
+
+    python scripts/migrate_embeddings.py [<model id>] [--batch-size N]
+
+The model id defaults to "[embedding] MODEL". Ctrl+C stops the migration between batches; running it again resumes it.
+"""
+
+# Modify sys path for util and obj imports 
+import sys
+import os
+
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+import signal
+import argparse
+import threading
+from configparser import ConfigParser
+from objects import EmbeddingMigration, EmbeddingModelRegistry
+
+
+# ---- Config ---- #
+# Load config
+config:ConfigParser = ConfigParser() 
+config.read('config/config.conf')
+
+# Extract required vars
+INDEX_BIN_PATH:str = config['paths']['INDEX_BIN_PATH']
+METADATA_DB_PATH:str = config['paths']['METADATA_DB_PATH']
+STORAGE_DTYPE:str = config['index']['STORAGE_DTYPE']
+INDEX_TYPE:str = config['index']['INDEX_TYPE']
+
+
+if __name__ == '__main__': 
+    
+    # ---- Args ---- #
+    parser:argparse.ArgumentParser = argparse.ArgumentParser(description='Re-embed the corpus with another model and cut over to it.')
+    parser.add_argument('model_id', nargs='?', default=None, help='id of the model to migrate to (defaults to "[embedding] MODEL")')
+    parser.add_argument('--batch-size', type=int, default=32, help='files re-embedded per batch')
+    args:argparse.Namespace = parser.parse_args()
+    
+    # ---- Migrate ---- #
+    # Stop between batches on Ctrl+C
+    stop_event:threading.Event = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    
+    # Run the migration
+    EmbeddingMigration(
+        METADATA_DB_PATH, 
+        INDEX_BIN_PATH, 
+        EmbeddingModelRegistry.from_config(config), 
+        target_model_id=args.model_id.lower() if args.model_id else None, 
+        batch_size=args.batch_size, 
+        storage_dtype=STORAGE_DTYPE, 
+        index_type=INDEX_TYPE
+    ).run(stop_event=stop_event, verbose=True)
@@ -0,0 +1,58 @@
+"""
+watch_filesystem.py
+
+DESC: watches the configured roots (see "[watcher]" in config/config.conf) and keeps the index and metadata DB up to date as 
+files are created, modified, moved and deleted. Run from the flask/ dir: "python scripts/watch_filesystem.py". 
+
+Pass "--catch-up" to first index any changes made while the watcher was not running (this walks the roots once).
+"""
+
+# Modify sys path for util and obj imports 
+import sys
+import os
+
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from configparser import ConfigParser
+from objects import FilesystemIndexer, FilesystemWatcher, EmbeddingModelRegistry
+
+
+# ---- Config ---- #
+# Load config
+config:ConfigParser = ConfigParser() 
+config.read('config/config.conf')
+
+# Extract required vars
+INDEX_BIN_PATH:str = config['paths']['INDEX_BIN_PATH']
+METADATA_DB_PATH:str = config['paths']['METADATA_DB_PATH']
+STORAGE_DTYPE:str = config['index']['STORAGE_DTYPE']
+INDEX_TYPE:str = config['index']['INDEX_TYPE']
+WATCH_ROOTS:list[str] = [r.strip() for r in config['watcher']['ROOTS'].split(',') if r.strip()]
+DEBOUNCE_MS:int = int(config['watcher']['DEBOUNCE_MS'])
+STEP_MS:int = int(config['watcher']['STEP_MS'])
+
+
+# ---- Setup ---- #
+# The embedding models (used through the shared embedding service if it is enabled, else loaded in this process)
+model_registry:EmbeddingModelRegistry = EmbeddingModelRegistry.from_config(config)
+
+# Create the indexer (one indexer is shared by all the roots since they use the same index and DB). It embeds with the DB's active 
+# model and follows it when a migration cuts over to a new one
+indexer:FilesystemIndexer = FilesystemIndexer(WATCH_ROOTS[0], METADATA_DB_PATH, INDEX_BIN_PATH, model_registry, STORAGE_DTYPE, INDEX_TYPE)
+
+# Optionally bring the index up to date with any changes made while nothing was watching
+if '--catch-up' in sys.argv: 
+    for root in WATCH_ROOTS:
+        indexer.start_dir = root
+        indexer.index_filesystem(verbose=True)
+
+
+# ---- Watch ---- #
+FilesystemWatcher(
+    WATCH_ROOTS, 
+    indexer, 
+    debounce_ms=DEBOUNCE_MS, 
+    step_ms=STEP_MS
+).watch(verbose=True)
@@ -1,5 +1,7 @@
 
-/** file_metadata - table that contains the embeddings for each unique file path, along with other metadata. */ 
+/** file_metadata - table that contains the embeddings for each unique file path, along with other metadata. "embedding_model" is
+ * the id of the model that made the embedding (see embedding_models). "file_ext" (lowercase, no dot) and "file_mtime" (seconds since 
+ * the epoch) are what search filters are evaluated on; they are indexed by FileMetadataDatabase. */ 
 CREATE TABLE IF NOT EXISTS file_metadata (
     id INTEGER PRIMARY KEY,
     file_path TEXT UNIQUE,
@@ -8,9 +10,54 @@ CREATE TABLE IF NOT EXISTS file_metadata (
     file_sha256 TEXT,
     created TEXT,
     modified TEXT,
-    embedding BLOB
+    embedding BLOB,
+    embedding_model TEXT,
+    file_ext TEXT,
+    file_mtime REAL
 );
 
+/** file_text - full text (FTS5) index of the name and extracted text of each file, searched alongside the embeddings so that 
+ * exact part numbers, file names and rare terms are found. The rowid is the id of the file's file_metadata row. */
+CREATE VIRTUAL TABLE IF NOT EXISTS file_text USING fts5(file_name, content, tokenize = 'unicode61 remove_diacritics 2');
+
+/** Remove a file's text with its file_metadata row */
+CREATE TRIGGER IF NOT EXISTS file_metadata_delete_text AFTER DELETE ON file_metadata BEGIN 
+    DELETE FROM file_text WHERE rowid = old.id;
+END;
+
+/** file_digests - a compact digest of each file's text (its lead, cut to a token budget; see utils.file_digest()) and its token 
+ * count, computed at index time so that searches send it to the LLM without reading or tokenizing the file. */
+CREATE TABLE IF NOT EXISTS file_digests (
+    file_id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL,
+    token_count INTEGER NOT NULL
+);
+
+/** Remove a file's digest with its file_metadata row */
+CREATE TRIGGER IF NOT EXISTS file_metadata_delete_digest AFTER DELETE ON file_metadata BEGIN 
+    DELETE FROM file_digests WHERE file_id = old.id;
+END;
+
+/** file_passages - overlapping passages of each file's text (see utils.split_passages()), each embedded on its own since a file's 
+ * embedding only covers the start of its text. The offsets are character offsets into the file's text in file_text, and 
+ * "embedding_model" is the id of the model that made the embedding. "content_hash" (see utils.passage_hash()) identifies the 
+ * passage's text, so that a changed file only has its new passages embedded. Passages are searched in their own Faiss index. */
+CREATE TABLE IF NOT EXISTS file_passages (
+    file_id INTEGER NOT NULL,
+    passage_no INTEGER NOT NULL,
+    start_offset INTEGER NOT NULL,
+    end_offset INTEGER NOT NULL,
+    embedding BLOB NOT NULL,
+    embedding_model TEXT,
+    content_hash TEXT,
+    PRIMARY KEY (file_id, passage_no)
+);
+
+/** Remove a file's passages with its file_metadata row */
+CREATE TRIGGER IF NOT EXISTS file_metadata_delete_passages AFTER DELETE ON file_metadata BEGIN 
+    DELETE FROM file_passages WHERE file_id = old.id;
+END;
+
 /** ignore_paths - table that defines which paths can be ignored when indexing. The "type" must be either "file" or "directory",
  * and wildcards are supported in the "path" */
 CREATE TABLE IF NOT EXISTS ignore_paths (
@@ -20,4 +67,96 @@ CREATE TABLE IF NOT EXISTS ignore_paths (
 
 
 /** Insert default values into ignore_paths table */
-INSERT INTO ignore_paths (path, type) VALUES ('*/.*', 'directory')  -- Ignore hidden directories 
+INSERT OR IGNORE INTO ignore_paths (path, type) VALUES ('*/.*', 'directory');  -- Ignore hidden directories 
+
+
+/** pinned_paths - directories pinned by the user; the crawler indexes these (and the dirs leading to them) first. */
+CREATE TABLE IF NOT EXISTS pinned_paths (
+    path TEXT PRIMARY KEY
+);
+
+/** search_hits - how often files in each directory (or its subdirectories) were returned by a search; used to prioritize crawling. */
+CREATE TABLE IF NOT EXISTS search_hits (
+    dir_path TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    last_hit TEXT
+);
+
+/** file_opens - how often each file was opened (summarized) through the app; used to pick the documents whose summaries are 
+ * precomputed. */
+CREATE TABLE IF NOT EXISTS file_opens (
+    file_path TEXT PRIMARY KEY,
+    opens INTEGER NOT NULL DEFAULT 0,
+    last_opened TEXT
+);
+
+/** summaries - persisted document summaries, keyed by the SHA-256 of the file and the settings they were made with, so a file 
+ * is only summarized again once it changes. */
+CREATE TABLE IF NOT EXISTS summaries (
+    file_sha256 TEXT NOT NULL,
+    model TEXT NOT NULL,
+    max_length INTEGER NOT NULL,
+    overlap INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    created TEXT NOT NULL,
+    PRIMARY KEY (file_sha256, model, max_length, overlap)
+);
+
+/** crawl_frontier - directories that a budgeted crawl did not get to (or stopped part way through), so the next run of the crawl 
+ * can resume from them. files_done is the number of the directory's files (newest first) that were already crawled. */
+CREATE TABLE IF NOT EXISTS crawl_frontier (
+    root TEXT NOT NULL,
+    dir_path TEXT NOT NULL,
+    score REAL NOT NULL,
+    files_done INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (root, dir_path)
+);
+
+/** work_queue - directory and file tasks shared by the crawl worker processes. A worker claims a task by taking a lease on it, 
+ * extends the lease with heartbeats while working, and marks it done; tasks whose lease expired (crashed worker) are claimed again. */
+CREATE TABLE IF NOT EXISTS work_queue (
+    id INTEGER PRIMARY KEY,
+    task_type TEXT CHECK(task_type IN ('directory', 'file')) NOT NULL,
+    path TEXT NOT NULL,
+    priority REAL NOT NULL DEFAULT 0,
+    status TEXT CHECK(status IN ('pending', 'leased', 'done', 'failed')) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    UNIQUE (task_type, path)
+);
+
+CREATE INDEX IF NOT EXISTS idx_work_queue_claim ON work_queue (status, priority DESC);
+
+
+/** embedding_models - the embedding models that the DB has held vectors for. Exactly one model is "active" (its vectors are in 
+ * file_metadata.embedding and its index is searched); a "migrating" model is having the corpus re-embedded into model_embeddings, 
+ * and becomes active once every file has been re-embedded. Model ids are "<name>@<version>" (see "[models]" in config.conf). */
+CREATE TABLE IF NOT EXISTS embedding_models (
+    model_id TEXT PRIMARY KEY,
+    model_name TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    status TEXT CHECK(status IN ('active', 'migrating', 'retired')) NOT NULL,
+    created TEXT NOT NULL,
+    activated TEXT
+);
+
+/** model_embeddings - vectors made by a migrating model, staged here while the active model's vectors keep serving. The embedding 
+ * is NULL if the file could not be read. Rows for files that changed since (new file_metadata ids) are ignored. */
+CREATE TABLE IF NOT EXISTS model_embeddings (
+    file_id INTEGER NOT NULL,
+    model_id TEXT NOT NULL,
+    embedding BLOB,
+    PRIMARY KEY (model_id, file_id)
+);
+
+/** model_passage_embeddings - passage vectors made by a migrating model (see file_passages), staged with the file's vector in 
+ * model_embeddings. Rows for passages that are no longer in file_passages are ignored. */
+CREATE TABLE IF NOT EXISTS model_passage_embeddings (
+    file_id INTEGER NOT NULL,
+    passage_no INTEGER NOT NULL,
+    model_id TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    PRIMARY KEY (model_id, file_id, passage_no)
+);
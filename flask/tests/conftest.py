@@ -0,0 +1,121 @@
+
+import pytest
+import sys
+import os
+import time
+import faiss
+import threading
+import numpy as np
+
+from types import SimpleNamespace
+from typing import Callable
+
+# Modify sys path for util and obj imports
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+# Finish imports
+from objects import FileMetadataDatabase, EmbeddingModelRegistry
+from utils import hash_file_sha256, new_faiss_index, passage_hash, passage_id
+
+
+# ---- Config ---- #
+CREATE_TABLES_SCRIPT:str = os.path.join(parent_dir, 'sql', 'metadata_db_tables.sql')
+SUMMARY:str = 'a summary'
+
+
+# ---- Fakes ---- #
+class FakeBackend:
+    """Stands in for EmbeddingBackend: embeds each text with [embed] (as [len(text)] * [dim] if not given), fails on the text 
+    "fail", and records the texts and the size of each batch it embeds."""
+
+    name:str = 'fake-model/torch'
+
+    def __init__(self, dim:int=4, embed:Callable[[str], list[float]]|None=None):
+        self.dim = dim
+        self.embed = embed or (lambda text: [len(text)] * dim)
+        self.texts:list[str] = []
+        self.batch_sizes:list[int] = []
+
+    def encode(self, sentences:str|list[str], batch_size:int=32, **kwargs) -> np.ndarray:
+        texts:list[str] = [sentences] if isinstance(sentences, str) else list(sentences)
+        self.texts.extend(texts)
+        self.batch_sizes.append(len(texts))
+        if 'fail' in texts: raise ValueError('cannot embed "fail"')
+        embeddings:np.ndarray = np.array([self.embed(text) for text in texts], dtype=np.float32).reshape(len(texts), self.dim)
+        return embeddings[0] if isinstance(sentences, str) else embeddings
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+
+class FakeRegistry(EmbeddingModelRegistry):
+    """Registry of fake models with the given dims (the first one is the default), so the tests don't load real models."""
+
+    def __init__(self, dims:dict[str, int]):
+        super().__init__({model_id: f'fake-model-{model_id}' for model_id in dims}, default_model_id=next(iter(dims)))
+        self.dims = dims
+
+    def get(self, model_id:str) -> FakeBackend:
+        if model_id not in self.models: raise KeyError(f'Embedding model "{model_id}" is not in the "[models]" registry {tuple(self.models)}.')
+        return self._loaded.setdefault(model_id, FakeBackend(self.dims[model_id]))
+
+
+class FakeOllamaClient:
+    """Stands in for ollama.Client: answers every prompt with [SUMMARY] (or the prompt's text if [echo], or [response] if given) 
+    after a short delay, and records the prompts, the other arguments of the last request and the most requests it had at once."""
+
+    def __init__(self, echo:bool=False, response:str|None=None):
+        self.echo = echo
+        self.response = response
+        self.kwargs:dict = {}
+        self.prompts:list[str] = []
+        self.active:int = 0
+        self.max_active:int = 0
+        self.lock:threading.Lock = threading.Lock()
+
+    def generate(self, model:str, prompt:str, **kwargs) -> SimpleNamespace:
+        with self.lock:
+            self.prompts.append(prompt)
+            self.kwargs = kwargs
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self.lock: self.active -= 1
+        response:str = self.response if self.response is not None else prompt.split('\n')[-2] if self.echo else SUMMARY
+        return SimpleNamespace(response=response)
+
+
+# ---- Fixtures ---- #
+@pytest.fixture
+def file_db(tmp_path):
+    """An empty DB."""
+    return FileMetadataDatabase(str(tmp_path / 'file_metadata.db'), create_tables_script=CREATE_TABLES_SCRIPT)
+
+
+@pytest.fixture
+def corpus(file_db, tmp_path, request):
+    """The test module's FILES, (path, text, embedding, metadata, passages) with each passage as ((start, end), embedding), 
+    indexed under [tmp_path] by the model "m@1": the DB, and flat indexes (of the embeddings' dim) of the files and the passages."""
+    dim:int = len(request.module.FILES[0][2])
+    index:faiss.IndexIDMap = new_faiss_index(dim)
+    passage_index:faiss.IndexIDMap = new_faiss_index(dim)
+    for path, text, embedding, metadata, passages in request.module.FILES:
+        row_id:int = file_db.new_file_entry(
+            str(tmp_path / path), os.path.basename(path), metadata, path, np.array(embedding, dtype=np.float32), 'm@1', file_text=text
+        )
+        index.add_with_ids(np.array([embedding], dtype=np.float32), np.array([row_id], dtype=np.int64))
+
+        # The passages (if any), under their passage ids
+        spans:list[tuple[int, int]] = [span for span, _ in passages]
+        embeddings:np.ndarray = np.array([e for _, e in passages], dtype=np.float32).reshape(-1, dim)
+        file_db.set_file_passages(row_id, spans, [passage_hash(text[start:end]) for start, end in spans], embeddings, 'm@1')
+        passage_index.add_with_ids(embeddings, np.array([passage_id(row_id, i) for i in range(len(passages))], dtype=np.int64))
+    return file_db, index, passage_index
+
+
+def add_file(file_db:FileMetadataDatabase, path:str, text:str, stored_text:str|None=None) -> int:
+    """Writes a file with the given text and indexes it (with the given stored text, if not the same)."""
+    with open(path, 'w') as file: file.write(text)
+    return file_db.new_file_entry(path, os.path.basename(path), {}, hash_file_sha256(path), np.zeros(2, dtype=np.float32), file_text=stored_text or text)
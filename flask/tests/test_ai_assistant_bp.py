@@ -0,0 +1,75 @@
+
+import pytest
+import sys
+import os
+
+from flask import Flask
+
+# Modify sys path for util and obj imports
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+# Finish imports
+from objects import OllamaQueryHandler, FileMetadataDatabase
+from blueprints import ai_bp
+from blueprints.ai_assistant_bp import rank_hits
+from conftest import FakeOllamaClient
+
+
+# ---- Config ---- #
+CREATE_TABLES_SCRIPT:str = os.path.join(parent_dir, 'sql', 'metadata_db_tables.sql')
+
+
+# ---- Setup ---- #
+def make_app(tmp_path, response:str, rerank_mode:str='llm', context_tokens:int=4096) -> Flask:
+    """Returns an app with the AI blueprint and what rank_hits() uses from it (Ollama answers with the given response)."""
+    app:Flask = Flask(__name__)
+    app.register_blueprint(ai_bp)
+    app.RERANK_MODE = rerank_mode
+    app.SKIP_RERANK_MARGIN = 0
+    app.reranker = None
+    app.file_metadata_db = FileMetadataDatabase(str(tmp_path / 'file_metadata.db'), create_tables_script=CREATE_TABLES_SCRIPT)
+    app.ollama_query_handler = OllamaQueryHandler(FakeOllamaClient(response=response), 'm', context_tokens=context_tokens)
+    app.SUMMARY_MAX_LENGTH = 500
+    app.SUMMARY_OVERLAP = 100
+    return app
+
+
+def make_hits(count:int) -> list[dict]:
+    """Returns [count] search hits (best first), each with a passage."""
+    return [{'id': i, 'path': f'/docs/{i}.txt', 'distance': 0.1 * i, 'passages': [{'text': f'text of file {i}'}]} for i in range(count)]
+
+
+# ---- Tests ---- #
+def test_llm_ranks_the_hits(tmp_path):
+    with make_app(tmp_path, '{"documents": [10, 90, 50]}').app_context():
+        response:dict = rank_hits('query', make_hits(3))
+    assert response['ranked_by'] == 'llm' and response['ranking_error'] is None
+    assert response['top_match'] == {'file_path': '/docs/1.txt', 'confidence': 90, 'context': None}
+
+
+@pytest.mark.parametrize("ollama_response", ['{"documents": [10, 9', 'not json', '{"documents": []}', '{"scores": [1, 2, 3]}'])
+def test_unusable_llm_response_keeps_retrieval_order(tmp_path, ollama_response):
+    with make_app(tmp_path, ollama_response).app_context():
+        response:dict = rank_hits('query', make_hits(3))
+    assert response['ranked_by'] == 'retrieval' and response['ranking_error']
+    assert response['top_match']['file_path'] == '/docs/0.txt' and response['faiss_top_files'] == ['/docs/0.txt', '/docs/1.txt', '/docs/2.txt']
+
+
+def test_prompt_that_cannot_fit_keeps_retrieval_order(tmp_path):
+    app:Flask = make_app(tmp_path, '{"documents": [10, 90, 50]}', context_tokens=100)
+    with app.app_context():
+        response:dict = rank_hits('query', make_hits(3))
+    assert response['ranked_by'] == 'retrieval' and 'budget' in response['ranking_error']
+    assert not app.ollama_query_handler.ollama_client.prompts
+
+
+@pytest.mark.parametrize("settings", [{'max_length': 'long'}, {'max_length': 0}, {'overlap': -1}, {'overlap': 5000}, {'overlap': None}])
+def test_invalid_summary_settings_are_rejected(tmp_path, settings):
+    path = tmp_path / 'report.txt'
+    path.write_text('some text')
+    app:Flask = make_app(tmp_path, 'a summary')
+    response = app.test_client().post('/summarize-document', json={'filepath': str(path), **settings})
+    assert response.status_code == 400 and next(iter(settings)) in response.get_json()['error']
+    assert not app.ollama_query_handler.ollama_client.prompts
@@ -0,0 +1,113 @@
+
+import pytest
+import sys
+import os
+import time
+
+# Modify sys path for util and obj imports 
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+    
+# Finish imports 
+from objects import FileMetadataDatabase, CrawlScheduler 
+
+
+# ---- Config ---- # 
+# Path to the create tables script (tests are run from "flask/tests")
+CREATE_TABLES_SCRIPT:str = os.path.join(parent_dir, 'sql', 'metadata_db_tables.sql')
+
+
+# ---- Setup ---- # 
+# Fixture for tests: a fresh DB and a tree with an old dir, a recently modified dir and a (pinned) old dir
+@pytest.fixture
+def tree(tmp_path):
+    file_db:FileMetadataDatabase = FileMetadataDatabase(str(tmp_path / 'db' / 'file_metadata.db'), create_tables_script=CREATE_TABLES_SCRIPT)
+    
+    root = tmp_path / 'root'
+    for name in ['old', 'recent', 'pinned']: 
+        (root / name).mkdir(parents=True)
+        (root / name / f'{name}.txt').write_text(name)
+        
+    # Age the "old" and "pinned" dirs by a year
+    year_ago:float = time.time() - 365 * 86400
+    os.utime(root / 'old', (year_ago, year_ago))
+    os.utime(root / 'pinned', (year_ago, year_ago))
+    
+    return file_db, root
+
+
+# ---- Tests ---- #
+def test_recent_dir_is_crawled_before_old_dir(tree):
+    file_db, root = tree
+    order:list[str] = [os.path.basename(p) for p in CrawlScheduler(str(root), file_db).crawl()]
+    assert order.index('recent.txt') < order.index('old.txt')
+
+
+def test_pinned_dir_is_crawled_first(tree):
+    file_db, root = tree
+    file_db.pin_path(str(root / 'pinned'))
+    order:list[str] = [os.path.basename(p) for p in CrawlScheduler(str(root), file_db).crawl()]
+    assert order[0] == 'pinned.txt'
+
+
+def test_searched_dir_beats_old_dir(tree):
+    file_db, root = tree
+    file_db.record_search_hits([str(root / 'old' / 'old.txt')] * 3)
+    order:list[str] = [os.path.basename(p) for p in CrawlScheduler(str(root), file_db, search_weight=5.0).crawl()]
+    assert order.index('old.txt') < order.index('pinned.txt')
+
+
+def test_budget_resumes_on_next_run(tree):
+    file_db, root = tree
+    
+    # First run: 1 file budget
+    first:CrawlScheduler = CrawlScheduler(str(root), file_db, max_files=1)
+    first_files:list[str] = list(first.crawl())
+    first.save()
+    assert len(first_files) == 1
+    
+    # Second run: resumes with the rest
+    second:CrawlScheduler = CrawlScheduler(str(root), file_db)
+    second_files:list[str] = list(second.crawl())
+    second.save()
+    assert sorted(first_files + second_files) == sorted(str(root / n / f'{n}.txt') for n in ['old', 'recent', 'pinned'])
+    assert file_db.load_crawl_frontier(str(root)) == []
+
+
+def test_no_dirs_are_listed_once_out_of_budget(tree, monkeypatch):
+    file_db, root = tree
+    year_ago:float = time.time() - 365 * 86400
+    for i in range(5): 
+        (root / f'empty{i}').mkdir()
+        os.utime(root / f'empty{i}', (year_ago, year_ago))
+    listed:list[str] = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir', lambda path: listed.append(os.path.basename(path)) or scandir(path))
+    
+    # Only the root and the dir of the one file crawled are listed (not the old dirs without files), and the rest are left for the next run
+    scheduler:CrawlScheduler = CrawlScheduler(str(root), file_db, max_files=1)
+    assert len(list(scheduler.crawl())) == 1
+    assert len(listed) == 2 and len(scheduler.frontier) == 7
+
+
+def test_children_of_a_resumed_dir_are_crawled_once(tmp_path):
+    file_db:FileMetadataDatabase = FileMetadataDatabase(str(tmp_path / 'db' / 'file_metadata.db'), create_tables_script=CREATE_TABLES_SCRIPT)
+    root = tmp_path / 'root'
+    (root / 'sub' / 'deeper').mkdir(parents=True)
+    for path in ['a.txt', 'b.txt', 'sub/s.txt', 'sub/deeper/d.txt']: (root / path).write_text(path)
+    
+    # The root (2 files) is older than its sub dirs, so a run of 1 file stops part way through it
+    year_ago:float = time.time() - 365 * 86400
+    os.utime(root, (year_ago, year_ago))
+    
+    # Crawl 1 file per run until done
+    crawled:list[str] = []
+    for _ in range(10):
+        scheduler:CrawlScheduler = CrawlScheduler(str(root), file_db, max_files=1)
+        crawled += [os.path.relpath(p, root) for p in scheduler.crawl()]
+        scheduler.save()
+        if not file_db.load_crawl_frontier(str(root)): break
+    
+    # Every file is crawled once: the resumed root carries on after its files done, and queues its sub dirs only when finished
+    assert sorted(crawled) == sorted(['a.txt', 'b.txt', os.path.join('sub', 's.txt'), os.path.join('sub', 'deeper', 'd.txt')])
@@ -0,0 +1,53 @@
+
+import pytest
+import sys
+import os
+
+# Modify sys path for util and obj imports
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+# Finish imports
+from objects import CrossEncoderReranker
+
+
+# ---- Setup ---- #
+class FakeCrossEncoder:
+    """Stands in for sentence_transformers.CrossEncoder: scores a (query, passage) pair by the number of query words in the
+    passage, and records the batches it is given."""
+
+    def __init__(self):
+        self.batches:list[list[tuple[str, str]]] = []
+
+    def predict(self, pairs:list[tuple[str, str]], **kwargs) -> list[float]:
+        self.batches.append(pairs)
+        return [float(sum(word in passage.split() for word in query.split())) for query, passage in pairs]
+
+
+# Fixture for tests: a reranker with the fake model (so no model is loaded)
+@pytest.fixture
+def reranker():
+    reranker:CrossEncoderReranker = CrossEncoderReranker.__new__(CrossEncoderReranker)
+    reranker.model_name, reranker.max_chars, reranker.batch_size, reranker.model = 'fake', 20, 32, FakeCrossEncoder()
+    return reranker
+
+
+# ---- Tests ---- #
+def test_documents_scored_by_best_passage_in_one_batch(reranker):
+    scores:list[float] = reranker.score('reset the router', [['the cat', 'reset the router now'], ['router'], []])
+
+    assert scores == [3.0, 1.0, float('-inf')]
+    assert len(reranker.model.batches) == 1 and len(reranker.model.batches[0]) == 3
+
+
+def test_passages_trimmed_to_max_chars(reranker):
+    assert reranker.score('router', [['x' * 30 + ' router']]) == [0.0]
+
+
+def test_rerank_sorts_hits(reranker):
+    hits:list[dict] = [{'path': 'a.txt'}, {'path': 'b.txt'}, {'path': 'c.txt'}, {'path': 'd.txt'}]
+    ranked:list[dict] = reranker.rerank('reset the router', hits, [['the cat'], ['reset the router'], [''], ['the dog']])
+
+    assert [hit['path'] for hit in ranked] == ['b.txt', 'a.txt', 'd.txt', 'c.txt']
+    assert [hit['rerank_score'] for hit in ranked] == [3.0, 1.0, 1.0, None]
@@ -0,0 +1,110 @@
+
+import pytest
+import sys
+import os
+import faiss
+import threading
+import numpy as np
+
+# Modify sys path for util and obj imports
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+# Finish imports
+from objects import EmbeddingMigration, EmbeddingModelRegistry, FileMetadataDatabase
+from utils import passage_index_path, passage_id, blob_to_embedding
+from conftest import FakeRegistry
+
+
+# ---- Setup ---- #
+# Fixture for tests: a DB with 5 files (of 2 passages each) embedded by the old model (run from another dir, so the default create 
+# tables script must be found relative to the module)
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    registry:FakeRegistry = FakeRegistry({'old@1': 4, 'new@1': 6})
+    db_path:str = str(tmp_path / 'file_metadata.db')
+    file_db:FileMetadataDatabase = FileMetadataDatabase(db_path)
+
+    model_id, model = registry.active(file_db)
+    for i in range(5):
+        path = tmp_path / f'file{i}.txt'
+        path.write_text('x' * (i + 1))
+        text:str = f'{"a" * (i + 1)} {"b" * (i + 2)}'
+        file_id:int = file_db.new_file_entry(str(path), path.name, {'file_size': i + 1}, f'hash{i}', model.encode(path.read_text()), embedding_model=model_id, file_text=text)
+        passages:list[tuple[int, int]] = [(0, i + 1), (i + 2, len(text))]
+        file_db.set_file_passages(file_id, passages, [f'p{i}-0', f'p{i}-1'], model.encode([text[start:end] for start, end in passages]), embedding_model=model_id)
+
+    return registry, db_path, str(tmp_path / 'faiss_index.bin')
+
+
+# ---- Tests ---- #
+def test_new_db_activates_default_model(corpus):
+    registry, db_path, _ = corpus
+    models:list[dict] = FileMetadataDatabase(db_path).get_embedding_models()
+    assert [(m['model_id'], m['status'], m['dim'], m['files']) for m in models] == [('old@1', 'active', 4, 5)]
+
+
+def test_migration_cuts_over(corpus):
+    registry, db_path, index_bin_path = corpus
+    assert EmbeddingMigration(db_path, index_bin_path, registry, target_model_id='new@1', batch_size=2).run()
+
+    # The new model is active and every vector is tagged with it
+    file_db:FileMetadataDatabase = FileMetadataDatabase(db_path)
+    statuses:dict[str, tuple] = {m['model_id']: (m['status'], m['files']) for m in file_db.get_embedding_models()}
+    assert statuses == {'old@1': ('retired', 0), 'new@1': ('active', 5)}
+    assert registry.active(file_db)[0] == 'new@1'
+
+    # The new model's index has every file, at the new dim
+    index:faiss.Index = faiss.read_index(EmbeddingModelRegistry.index_path(index_bin_path, 'new@1'))
+    assert (index.ntotal, index.d) == (5, 6)
+
+
+def test_passages_survive_cut_over(corpus):
+    registry, db_path, index_bin_path = corpus
+    assert EmbeddingMigration(db_path, index_bin_path, registry, target_model_id='new@1', batch_size=2).run()
+
+    # Every passage was re-embedded by the new model (from its text), keeping its offsets
+    file_db:FileMetadataDatabase = FileMetadataDatabase(db_path)
+    passages:dict[int, bytes] = dict(file_db.get_all_passage_embeddings('new@1'))
+    assert len(passages) == 10 and not file_db.get_all_passage_embeddings('old@1')
+    file_id:int = file_db.get_all_embeddings('new@1')[0][0]
+    assert blob_to_embedding(passages[passage_id(file_id, 1)], 6).tolist() == [2.0] * 6
+
+    # The new model's passage index was published with its file index
+    index:faiss.Index = faiss.read_index(passage_index_path(EmbeddingModelRegistry.index_path(index_bin_path, 'new@1')))
+    assert (index.ntotal, index.d) == (10, 6)
+
+
+def test_unreadable_files_are_kept_for_reindexing(corpus, tmp_path):
+    registry, db_path, index_bin_path = corpus
+    file_db:FileMetadataDatabase = FileMetadataDatabase(db_path)
+
+    # A deleted file with stored text is embedded from it; one without stored text (indexed before the full text index) can't be
+    os.remove(tmp_path / 'file0.txt')
+    missing_id:int = file_db.new_file_entry(str(tmp_path / 'missing.txt'), 'missing.txt', {'file_size': 1}, 'hash5', np.zeros(4, dtype=np.float32), embedding_model='old@1')
+    assert EmbeddingMigration(db_path, index_bin_path, registry, target_model_id='new@1', batch_size=2).run()
+
+    # The file that couldn't be embedded stays on the old model (so indexing it again re-embeds it), the others are in the new index
+    rows:dict[int, str] = dict(file_db.cursor.execute('SELECT id, embedding_model FROM file_metadata').fetchall())
+    assert rows.pop(missing_id) == 'old@1' and set(rows.values()) == {'new@1'}
+    index:faiss.Index = faiss.read_index(EmbeddingModelRegistry.index_path(index_bin_path, 'new@1'))
+    assert index.ntotal == 5
+
+
+def test_stopped_migration_keeps_old_model_active(corpus):
+    registry, db_path, index_bin_path = corpus
+    stop_event:threading.Event = threading.Event()
+    stop_event.set()
+    assert not EmbeddingMigration(db_path, index_bin_path, registry, target_model_id='new@1', batch_size=2).run(stop_event)
+
+    file_db:FileMetadataDatabase = FileMetadataDatabase(db_path)
+    assert file_db.get_active_model()['model_id'] == 'old@1'
+    assert not os.path.exists(EmbeddingModelRegistry.index_path(index_bin_path, 'new@1'))
+
+
+def test_unregistered_target_is_an_error(corpus):
+    registry, db_path, index_bin_path = corpus
+    with pytest.raises(KeyError):
+        EmbeddingMigration(db_path, index_bin_path, registry, target_model_id='missing@1').run()
@@ -0,0 +1,83 @@
+
+import pytest
+import sys
+import os
+import threading
+import numpy as np
+
+# Modify sys path for util and obj imports 
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+    
+# Finish imports 
+from objects import EmbeddingService, EmbeddingClient
+from conftest import FakeRegistry
+
+
+# ---- Setup ---- # 
+# Fixture for tests: a running service (with a long batching window so concurrent requests are batched together)
+@pytest.fixture
+def service(tmp_path):
+    embedding_service:EmbeddingService = EmbeddingService(FakeRegistry({'fake@1': 4}), str(tmp_path / 'embedding.sock'), max_batch_size=8, max_wait_ms=200)
+    thread:threading.Thread = threading.Thread(target=embedding_service.serve_forever, daemon=True)
+    thread.start()
+    yield embedding_service
+    embedding_service.shutdown()
+    thread.join()
+    
+
+# ---- Tests ---- # 
+def test_encode_matches_backend_shapes(service):
+    client:EmbeddingClient = EmbeddingClient(service.socket_path, 'fake@1')
+    
+    # A single string gives a 1D array, a list gives one row per string
+    assert client.encode('abc').tolist() == [3, 3, 3, 3]
+    assert client.encode(['a', 'abcd']).tolist() == [[1, 1, 1, 1], [4, 4, 4, 4]]
+    assert client.get_sentence_embedding_dimension() == 4
+    assert client.name == 'fake-model/torch'
+    
+    
+def test_concurrent_requests_are_batched(service):
+    results:dict[int, np.ndarray] = {}
+    
+    # Several clients (each on its own thread and connection) send at once
+    def send(i:int) -> None: 
+        results[i] = EmbeddingClient(service.socket_path, 'fake@1').encode('x' * i)
+    threads:list[threading.Thread] = [threading.Thread(target=send, args=(i,)) for i in range(1, 5)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    
+    # Each client gets its own row back, from fewer model calls than requests
+    assert {i: int(v[0]) for i, v in results.items()} == {1: 1, 2: 2, 3: 3, 4: 4}
+    assert len(service.model_registry.get('fake@1').batch_sizes) < 4
+    assert service.stats()['texts_embedded'] == 4
+    
+    
+def test_batch_size_is_capped(service):
+    client:EmbeddingClient = EmbeddingClient(service.socket_path, 'fake@1')
+    
+    # A request larger than the max batch size is still embedded (in one call), but nothing else joins it
+    assert client.encode(['a'] * 10).shape == (10, 4)
+    assert service.model_registry.get('fake@1').batch_sizes == [10]
+    
+    
+def test_errors_are_returned_and_connection_kept(service):
+    client:EmbeddingClient = EmbeddingClient(service.socket_path, 'fake@1')
+    
+    # The model's error is raised in the client
+    with pytest.raises(RuntimeError, match='cannot embed'):
+        client.encode(['fail'])
+        
+    # The same connection still works
+    assert client.encode('ok').tolist() == [2, 2, 2, 2]
+    
+    
+def test_unknown_model_is_an_error(service):
+    with pytest.raises(RuntimeError, match='not in the'):
+        EmbeddingClient(service.socket_path, 'other@1').encode('abc')
+    
+    
+def test_client_errors_when_service_not_running(tmp_path):
+    with pytest.raises(ConnectionError):
+        EmbeddingClient(str(tmp_path / 'missing.sock'), 'fake@1').encode('abc')
@@ -0,0 +1,98 @@
+
+import pytest
+import sys
+import os
+import time
+import threading
+
+# Modify sys path for util and obj imports 
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+    
+# Finish imports 
+from watchfiles import Change
+from filelock import FileLock
+from objects import FilesystemWatcher 
+
+
+# ---- Setup ---- # 
+# Fixture for tests (coalescing does not touch the indexer)
+@pytest.fixture
+def watcher(tmp_path):
+    return FilesystemWatcher([str(tmp_path)], None)
+
+
+class FakeIndexer:
+    """Stands in for FilesystemIndexer: the "index" is the set of indexed paths, saved to and loaded from [self.disk] (which other 
+    writers can publish to as well), under a real lock file."""
+
+    def __init__(self, lock_path:str):
+        self.lock_path = lock_path
+        self.disk:set[str] = set()
+
+    def index_lock(self) -> FileLock: return FileLock(self.lock_path)
+    def refresh_model(self) -> bool: return False
+    def load_index(self, verbose:bool=False) -> set[str]: return set(self.disk)
+    def index_file(self, path:str, index:set[str], verbose:bool=False): index.add(path)
+    def remove_path(self, path:str, index:set[str], verbose:bool=False): index.discard(path)
+    def save_index(self, index:set[str]): self.disk = set(index)
+
+
+# ---- Tests ---- #
+def test_coalesce_created_then_deleted_file_is_removed(watcher, tmp_path):
+    path:str = str(tmp_path / 'gone.txt')
+    changes = {(Change.added, path), (Change.modified, path), (Change.deleted, path)}
+    assert watcher.coalesce(changes) == {path: 'remove'}
+
+
+def test_coalesce_repeated_modifications_index_once(watcher, tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_text('hello')
+    changes = {(Change.added, str(path)), (Change.modified, str(path))}
+    assert watcher.coalesce(changes) == {str(path): 'index'}
+
+
+def test_coalesce_ignores_unsupported_files(watcher, tmp_path):
+    path = tmp_path / 'image.png'
+    path.write_bytes(b'')
+    assert watcher.coalesce({(Change.added, str(path))}) == {}
+
+
+def test_coalesce_moved_dir_is_indexed(watcher, tmp_path):
+    old_dir:str = str(tmp_path / 'old')
+    new_dir = tmp_path / 'new'
+    new_dir.mkdir()
+    changes = {(Change.deleted, old_dir), (Change.added, str(new_dir))}
+    assert watcher.coalesce(changes) == {old_dir: 'remove', str(new_dir): 'index'}
+
+
+def test_apply_changes_keeps_indexes_published_in_between(tmp_path):
+    indexer:FakeIndexer = FakeIndexer(str(tmp_path / 'index.bin.lock'))
+    watcher:FilesystemWatcher = FilesystemWatcher([str(tmp_path)], indexer)
+    watcher.apply_changes({'a.txt': 'index'})
+    
+    # Another writer (e.g. an indexing job) publishes between two batches
+    indexer.disk.add('job.txt')
+    watcher.apply_changes({'b.txt': 'index', 'a.txt': 'remove'})
+    assert indexer.disk == {'job.txt', 'b.txt'}
+
+
+def test_apply_changes_waits_for_the_index_lock(tmp_path):
+    indexer:FakeIndexer = FakeIndexer(str(tmp_path / 'index.bin.lock'))
+    watcher:FilesystemWatcher = FilesystemWatcher([str(tmp_path)], indexer)
+    
+    # Another writer holds the lock while it updates the index
+    locked:threading.Event = threading.Event()
+    def other_writer():
+        with FileLock(indexer.lock_path):
+            locked.set()
+            time.sleep(0.3)
+            indexer.disk.add('job.txt')
+    writer:threading.Thread = threading.Thread(target=other_writer)
+    writer.start()
+    locked.wait()
+    
+    watcher.apply_changes({'a.txt': 'index'})
+    writer.join()
+    assert indexer.disk == {'job.txt', 'a.txt'}
@@ -0,0 +1,178 @@
+
+import pytest
+import sys
+import os
+import numpy as np
+
+# Modify sys path for util and obj imports
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+# Finish imports
+from utils import search_files, search_files_batch, lexical_search, reciprocal_rank_fusion, parse_search_filters, select_hits, top_hit_dominates, hydrate_hits
+from conftest import FakeBackend
+
+
+# ---- Config ---- #
+# Files: (path, text, embedding, metadata, passages). The query embedding is [1, 0], so "notes.txt" is the nearest by vector but 
+# only the datasheet mentions the part number
+FILES:list[tuple[str, str, list[float], dict, list]] = [
+    ('notes.txt', 'meeting notes about the microcontroller order', [1.0, 0.0], {'file_size': 100, 'file_mtime': 1_700_000_000}, []),
+    ('projects/datasheet.pdf', 'STM32F413RH reference manual and pinout', [0.0, 1.0], {'file_size': 2_000_000, 'file_mtime': 1_750_000_000}, []),
+    ('projects/recipe.txt', 'banana bread with walnuts', [-1.0, 0.0], {'file_size': 300, 'file_mtime': 1_750_000_000}, []),
+]
+
+
+# ---- Setup ---- #
+def query_model() -> FakeBackend:
+    """Returns a model that embeds every query as [1, 0], except "recipes", embedded as [-1, 0]."""
+    return FakeBackend(2, embed=lambda query: [-1.0, 0.0] if query == 'recipes' else [1.0, 0.0])
+
+
+# ---- Tests ---- #
+def test_lexical_search_finds_exact_terms(corpus):
+    file_db, _, _ = corpus
+    ids:list[int] = lexical_search(file_db.cursor, 'stm32f413rh pinout', 10)
+    assert ids == [2]
+
+
+def test_lexical_search_ignores_query_syntax(corpus):
+    file_db, _, _ = corpus
+    assert lexical_search(file_db.cursor, 'banana NOT ("*', 10) == [3]
+    assert lexical_search(file_db.cursor, '???', 10) == []
+
+
+def test_deleted_file_leaves_text_index(corpus, tmp_path):
+    file_db, _, _ = corpus
+    file_db.delete_file_entry(str(tmp_path / 'projects' / 'datasheet.pdf'))
+    assert lexical_search(file_db.cursor, 'stm32f413rh', 10) == []
+
+
+def test_reciprocal_rank_fusion():
+    fused:list[tuple[int, float]] = reciprocal_rank_fusion([[1, 2, 3], [3, 4]], k=60)
+    assert [item_id for item_id, _ in fused] == [3, 1, 2, 4]
+    assert fused[0][1] == pytest.approx(1 / 63 + 1 / 61)
+
+
+def test_vector_only_search_misses_part_number(corpus):
+    file_db, index, _ = corpus
+    hits:list[dict] = search_files('STM32F413RH', query_model(), 2, index, file_db.cursor, top_k=1)
+    assert [hit['name'] for hit in hits] == ['notes.txt']
+
+
+def test_hybrid_search_finds_part_number(corpus):
+    file_db, index, _ = corpus
+    hits:list[dict] = search_files('STM32F413RH', query_model(), 2, index, file_db.cursor, top_k=2, lexical_candidates=10)
+    assert {hit['name'] for hit in hits} == {'notes.txt', 'datasheet.pdf'}
+    assert all('score' in hit and hit['distance'] is not None for hit in hits)
+
+
+def test_prefilter_only_ranks_lexical_candidates(corpus):
+    file_db, index, _ = corpus
+    hits:list[dict] = search_files('STM32F413RH', query_model(), 2, index, file_db.cursor, top_k=3, lexical_candidates=10, prefilter_min_files=1)
+    assert [hit['name'] for hit in hits] == ['datasheet.pdf']
+
+
+@pytest.mark.parametrize("filters,expected", [
+    ({'path_prefix': 'projects'}, ['datasheet.pdf', 'recipe.txt']),
+    ({'extensions': ['.PDF']}, ['datasheet.pdf']),
+    ({'min_size': 200, 'max_size': 1000}, ['recipe.txt']),
+    ({'modified_after': '2025-01-01'}, ['datasheet.pdf', 'recipe.txt']),
+    ({'modified_before': 1_720_000_000, 'extensions': 'txt'}, ['notes.txt']),
+    ({'path_prefix': 'projects', 'extensions': ['docx']}, []),
+])
+def test_filters(corpus, tmp_path, filters, expected):
+    file_db, index, _ = corpus
+    if 'path_prefix' in filters: filters['path_prefix'] = str(tmp_path / filters['path_prefix'])
+    hits:list[dict] = search_files('query', query_model(), 2, index, file_db.cursor, top_k=3, filters=parse_search_filters(filters))
+    assert [hit['name'] for hit in hits] == expected
+
+
+def test_filters_apply_to_lexical_search(corpus, tmp_path):
+    file_db, index, _ = corpus
+    filters:dict = parse_search_filters({'extensions': ['txt']})
+    hits:list[dict] = search_files('STM32F413RH', query_model(), 2, index, file_db.cursor, top_k=3, lexical_candidates=10, filters=filters)
+    assert 'datasheet.pdf' not in [hit['name'] for hit in hits]
+
+
+@pytest.mark.parametrize("filters", [{'color': 'red'}, {'min_size': 'big'}, {'modified_after': 'yesterday'}])
+def test_invalid_filters(filters):
+    with pytest.raises(ValueError):
+        parse_search_filters(filters)
+
+
+def test_batch_search_matches_single_searches(corpus, tmp_path):
+    file_db, index, _ = corpus
+    filters:dict = parse_search_filters({'path_prefix': str(tmp_path / 'projects')})
+    results:list[list[dict]] = search_files_batch(['query', 'recipes'], query_model(), 2, index, file_db.cursor, top_k=1, filters=filters)
+
+    assert [[hit['name'] for hit in hits] for hits in results] == [['datasheet.pdf'], ['recipe.txt']]
+    assert results == [search_files(q, query_model(), 2, index, file_db.cursor, top_k=1, filters=filters) for q in ('query', 'recipes')]
+
+
+# Keys of each search hit (see hydrate_hits())
+HIT_KEYS:set[str] = {'id', 'path', 'name', 'size', 'sha256', 'distance'}
+
+
+def test_hydrate_hits_keeps_result_order_and_skips_missing_ids(corpus, tmp_path):
+    file_db, _, _ = corpus
+    hits:list[list[dict]] = hydrate_hits(file_db.cursor, np.array([[3, -1, 1, 99], [2, 2, -1, -1]]), np.array([[0.5, 0.0, 1.5, 2.0], [0.25, 0.25, 0.0, 0.0]], dtype=np.float32))
+
+    # One list per query, in the order of the results, without -1 (no result) and ids that aren't in the DB
+    assert [[hit['id'] for hit in query_hits] for query_hits in hits] == [[3, 1], [2, 2]]
+    assert all(set(hit) == HIT_KEYS for query_hits in hits for hit in query_hits)
+    assert hits[0][0] == {'id': 3, 'path': str(tmp_path / 'projects/recipe.txt'), 'name': 'recipe.txt', 'size': 300, 'sha256': 'projects/recipe.txt', 'distance': 0.5}
+    assert type(hits[0][1]['distance']) is float
+
+
+def test_search_files_hits_nearest_first(corpus):
+    file_db, index, _ = corpus
+    hits:list[dict] = search_files('query', query_model(), 2, index, file_db.cursor, top_k=3)
+    assert [hit['name'] for hit in hits] == ['notes.txt', 'datasheet.pdf', 'recipe.txt']
+    assert [hit['distance'] for hit in hits] == [0.0, 2.0, 4.0]
+    assert all(set(hit) == HIT_KEYS for hit in hits)
+
+
+def test_search_files_skips_rows_deleted_since_the_index_was_saved(corpus, tmp_path):
+    file_db, index, _ = corpus
+    file_db.delete_file_entry(str(tmp_path / 'notes.txt'))
+    assert [hit['name'] for hit in search_files('query', query_model(), 2, index, file_db.cursor, top_k=3)] == ['datasheet.pdf', 'recipe.txt']
+
+
+def hits_at(*distances:float|None) -> list[dict]:
+    """Returns hits (best first) at the given distances from the query."""
+    return [{'id': i, 'distance': distance} for i, distance in enumerate(distances)]
+
+
+@pytest.mark.parametrize("distances,kwargs,expected", [
+    ((0.5, 0.6, 0.7, 0.8), {}, [0, 1]),                                         # Top K
+    ((0.5, 0.6, 0.7, 0.8), {'max_distance': 0.55}, [0]),                        # Absolute threshold
+    ((0.5, 1.2, None, 1.3), {'relative_margin': 0.3}, [0, 2]),                  # Relative margin (unknown distances are kept)
+    ((0.5, 0.6, 0.62, 0.64, 0.9), {'expand_margin': 0.05}, [0, 1, 2, 3]),       # K grows while the scores are close
+    ((0.5, 0.6, None, 0.61), {'expand_margin': 0.05}, [0, 1]),                  # ...but not past an unknown distance
+])
+def test_select_hits(distances, kwargs, expected):
+    assert [hit['id'] for hit in select_hits(hits_at(*distances), 2, **kwargs)] == expected
+
+
+def test_select_hits_in_fused_rank_order():
+    # Fused (RRF) order: the 2nd nearest hit is ranked 3rd, so K grows to it from the 2nd nearest distance (0.6), not from 
+    # the 2nd hit's (0.9), and the selected hits keep the fused order
+    hits:list[dict] = hits_at(0.5, 0.9, 0.6, 0.62, 1.0)
+    assert [hit['id'] for hit in select_hits(hits, 2, expand_margin=0.05)] == [0, 1, 2, 3]
+    assert [hit['id'] for hit in select_hits(hits, 2, relative_margin=0.15)] == [0, 2]
+
+
+@pytest.mark.parametrize("distances,margin,expected", [
+    ((0.2, 0.8), 0.25, True),
+    ((0.5, 0.6), 0.25, False),
+    ((0.2,), 0.25, True),
+    ((0.2, 0.8), 0, False),
+    ((None, 0.8), 0.25, False),
+    ((0.2, None), 0.25, False),
+    ((0.2, 0.8, 0.3), 0.25, False),     # Fused rank order: a later hit is nearly as near as the top one
+    ((0.2, 0.8, None), 0.25, True),
+])
+def test_top_hit_dominates(distances, margin, expected):
+    assert top_hit_dominates(hits_at(*distances), margin) is expected
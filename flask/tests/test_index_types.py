@@ -0,0 +1,81 @@
+
+import pytest
+import sys
+import os
+import faiss
+import numpy as np
+
+# Modify sys path for util and obj imports
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+# Finish imports
+from objects import FilesystemIndexer
+from utils import new_faiss_index, faiss_index_type, embedding_to_blob, blob_to_embedding, vector_search, EMBEDDING_DTYPES, INDEX_TYPES
+from conftest import FakeRegistry
+
+
+# ---- Config ---- #
+DIM:int = 8
+
+
+# ---- Setup ---- #
+def embeddings(count:int) -> np.ndarray:
+    """Returns [count] distinct embeddings (in the float16 range)."""
+    return np.random.default_rng(0).uniform(-1, 1, (count, DIM)).astype(np.float32)
+
+
+# ---- Tests ---- #
+@pytest.mark.parametrize("storage_dtype", list(EMBEDDING_DTYPES))
+def test_blob_round_trip(storage_dtype):
+    embedding:np.ndarray = embeddings(1)[0]
+    blob:bytes = embedding_to_blob(embedding, storage_dtype)
+    assert len(blob) == DIM * np.dtype(EMBEDDING_DTYPES[storage_dtype]).itemsize
+
+    # Read back as float32, exactly or to float16 precision
+    restored:np.ndarray = blob_to_embedding(blob, DIM)
+    assert restored.dtype == np.float32
+    assert np.allclose(restored, embedding, atol=1e-3 if storage_dtype == 'float16' else 0)
+
+
+def test_blob_of_other_dim_is_an_error():
+    with pytest.raises(ValueError):
+        blob_to_embedding(embedding_to_blob(embeddings(1)[0], 'float16'), DIM * 3)
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_index_type_round_trip(index_type, tmp_path):
+    index:faiss.IndexIDMap = new_faiss_index(DIM, index_type)
+    assert faiss_index_type(index) == index_type
+
+    # Train (if needed) on float16 blobs read back from the DB format, and add them under their row ids
+    vectors:np.ndarray = np.vstack([blob_to_embedding(embedding_to_blob(e, 'float16'), DIM) for e in embeddings(50)])
+    if not index.is_trained: index.train(vectors)
+    index.add_with_ids(vectors, np.arange(100, 150, dtype=np.int64))
+
+    # The type survives a save and load, and the nearest vector is found by its id
+    faiss.write_index(index, str(tmp_path / 'index.bin'))
+    loaded:faiss.Index = faiss.read_index(str(tmp_path / 'index.bin'))
+    assert faiss_index_type(loaded) == index_type and loaded.ntotal == 50
+    assert loaded.search(vectors[7:8], 1)[1][0][0] == 107
+
+
+def test_plain_index_has_no_type():
+    assert faiss_index_type(faiss.IndexFlatL2(DIM)) is None
+
+
+@pytest.mark.parametrize("index_type", ['sq8', 'sq4'])
+def test_untrained_index_can_not_be_searched(index_type, file_db):
+    with pytest.raises(ValueError, match='not trained'):
+        vector_search(embeddings(1), 3, new_faiss_index(DIM, index_type), file_db.cursor)
+
+
+@pytest.mark.parametrize("index_type", ['sq8', 'sq4'])
+def test_untrained_index_can_not_be_saved(index_type, tmp_path):
+    indexer:FilesystemIndexer = FilesystemIndexer(
+        str(tmp_path), str(tmp_path / 'file_metadata.db'), str(tmp_path / 'index' / 'faiss_index.bin'), model_registry=FakeRegistry({'fake@1': DIM}), index_type=index_type
+    )
+    with pytest.raises(ValueError, match='must be trained'):
+        indexer.save_index(new_faiss_index(DIM, index_type))
+    assert not os.path.exists(indexer.index_bin_path)
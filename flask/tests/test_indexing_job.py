@@ -0,0 +1,96 @@
+
+import pytest
+import sys
+import os
+
+from types import SimpleNamespace
+from flask import Flask
+
+# Modify sys path for util and obj imports 
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+    
+# Finish imports 
+from objects import IndexingJob 
+from blueprints import idx_bp
+
+
+# ---- Setup ---- # 
+# Fixture for tests: a small dir tree with 2 supported files and 1 unsupported file
+@pytest.fixture
+def job(tmp_path):
+    (tmp_path / 'a.txt').write_text('a' * 10)
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'b.txt').write_text('b' * 30)
+    (tmp_path / 'sub' / 'c.png').write_bytes(b'c' * 100)
+    return IndexingJob(str(tmp_path))
+
+
+def make_app() -> Flask:
+    """Returns an app with the indexing blueprint, whose job manager records the arguments of the jobs it is asked to start."""
+    app:Flask = Flask(__name__)
+    app.register_blueprint(idx_bp)
+    app.started = []
+    app.indexing_job_manager = SimpleNamespace(
+        start_job=lambda root, **kwargs: app.started.append(kwargs) or SimpleNamespace(to_dict=lambda: {'root': root})
+    )
+    return app
+
+
+# ---- Tests ---- #
+def test_discover_counts_supported_files(job):
+    job.discover()
+    assert job.files_total == 2
+    assert job.bytes_total == 40
+    assert job.to_dict()['queue_depths'] == {'dirs': 0, 'files': 2}
+
+
+def test_progress_and_eta(job, tmp_path):
+    job.set_status('running')
+    job.discover()
+    job.file_done(str(tmp_path / 'a.txt'))
+    progress:dict = job.to_dict()
+    assert progress['files_done'] == 1
+    assert progress['bytes_done'] == 10
+    assert progress['queue_depths']['files'] == 1
+    assert progress['eta_seconds'] is not None
+
+
+def test_pause_resume(job):
+    job.set_status('running')
+    job.pause()
+    assert job.status == 'paused'
+    
+    # The worker keeps reporting "paused" until resumed
+    job.set_status('running')
+    assert job.status == 'paused'
+    
+    job.resume()
+    assert job.status == 'running'
+    assert job.checkpoint()
+
+
+def test_cancel_wakes_paused_job(job):
+    job.set_status('running')
+    job.pause()
+    job.cancel()
+    assert not job.checkpoint()
+
+
+def test_job_settings_are_passed_on(tmp_path):
+    app:Flask = make_app()
+    response = app.test_client().post('/indexing-jobs', json={'root': str(tmp_path), 'overwrite': True, 'max_files': 5, 'max_seconds': 1.5})
+    assert response.status_code == 202
+    assert app.started == [{'overwrite': True, 'max_files': 5, 'max_seconds': 1.5}]
+
+
+@pytest.mark.parametrize("settings", [
+    {'overwrite': 'false'}, {'overwrite': 1}, {'max_files': 'abc'}, {'max_files': None}, {'max_files': -1}, {'max_files': 2.5}, 
+    {'max_seconds': 'abc'}, {'max_seconds': None}, {'max_seconds': -1}, {'max_seconds': True},
+])
+def test_invalid_job_settings_are_rejected(tmp_path, settings):
+    app:Flask = make_app()
+    response = app.test_client().post('/indexing-jobs', json={'root': str(tmp_path), **settings})
+    assert response.status_code == 400 and next(iter(settings)) in response.get_json()['error']
+    assert not app.started
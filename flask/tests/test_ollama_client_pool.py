@@ -0,0 +1,169 @@
+
+import pytest
+import sys
+import os
+import json
+import time
+import threading
+import gevent
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from ollama import ResponseError as OllamaResponseError
+
+# Modify sys path for util and obj imports
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+# Finish imports
+from objects import OllamaClientPool
+
+
+# ---- Setup ---- #
+class FakeOllamaServer(ThreadingHTTPServer):
+    """In-process stand-in for the Ollama server: answers POST /api/generate with "echo: <prompt>" after [delay] seconds, or 
+    with the next of [fail_statuses] while there are any. Records the prompts, the connections and the most requests at once."""
+
+    daemon_threads = True
+
+    def __init__(self, delay:float=0.0, fail_statuses:list[int]|None=None):
+        super().__init__(('127.0.0.1', 0), FakeOllamaRequestHandler)
+        self.delay = delay
+        self.fail_statuses = list(fail_statuses or [])
+        self.prompts:list[str] = []
+        self.connections:set[int] = set()
+        self.active:int = 0
+        self.max_active:int = 0
+        self.lock:threading.Lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class FakeOllamaRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'   # Keep-alive connections
+
+    def do_POST(self):
+        server:FakeOllamaServer = self.server
+        body:dict = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.prompts.append(body['prompt'])
+            server.connections.add(self.client_address[1])
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            status:int = server.fail_statuses.pop(0) if server.fail_statuses else 200
+        time.sleep(server.delay)
+        with server.lock: server.active -= 1
+
+        payload:dict = {'model': body['model'], 'response': f'echo: {body["prompt"]}', 'done': True} if status == 200 else {'error': 'busy'}
+        data:bytes = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+# Fixture for tests: starts a fake server (with the params given by the test) and shuts it down after the test
+@pytest.fixture
+def fake_server():
+    servers:list[FakeOllamaServer] = []
+    def start(**kwargs) -> FakeOllamaServer:
+        server:FakeOllamaServer = FakeOllamaServer(**kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers: server.shutdown()
+
+
+def generate_concurrently(pool:OllamaClientPool, prompts:list[str], **kwargs) -> list[str]:
+    """Sends the given prompts at once (one thread each) and returns the responses in order."""
+    responses:list[str|None] = [None] * len(prompts)
+    def send(i:int): responses[i] = pool.generate(model='m', prompt=prompts[i], **kwargs)['response']
+    threads:list[threading.Thread] = [threading.Thread(target=send, args=(i,)) for i in range(len(prompts))]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return responses
+
+
+# ---- Tests ---- #
+def test_requests_share_a_connection(fake_server):
+    server:FakeOllamaServer = fake_server()
+    pool:OllamaClientPool = OllamaClientPool(server.url)
+    assert [pool.generate(model='m', prompt=f'p{i}')['response'] for i in range(3)] == ['echo: p0', 'echo: p1', 'echo: p2']
+    assert len(server.connections) == 1
+
+
+def test_concurrency_is_limited_per_model(fake_server):
+    server:FakeOllamaServer = fake_server(delay=0.1)
+    pool:OllamaClientPool = OllamaClientPool(server.url, max_concurrency=2)
+    assert generate_concurrently(pool, [f'p{i}' for i in range(6)]) == [f'echo: p{i}' for i in range(6)]
+    assert server.max_active == 2
+
+
+def test_identical_calls_are_coalesced(fake_server):
+    server:FakeOllamaServer = fake_server(delay=0.2)
+    pool:OllamaClientPool = OllamaClientPool(server.url)
+    assert generate_concurrently(pool, ['same'] * 5) == ['echo: same'] * 5
+    assert server.prompts == ['same'] and pool.stats()['coalesced'] == 4
+
+    # Once done, the call is sent again
+    pool.generate(model='m', prompt='same')
+    assert server.prompts == ['same', 'same']
+
+
+def test_calls_with_other_timeouts_are_not_coalesced(fake_server):
+    server:FakeOllamaServer = fake_server(delay=0.2)
+    pool:OllamaClientPool = OllamaClientPool(server.url)
+    threads:list[threading.Thread] = [threading.Thread(target=pool.generate, kwargs={'model': 'm', 'prompt': 'same', 'timeout_seconds': t}) for t in (5, 10)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert server.prompts == ['same', 'same'] and pool.stats()['coalesced'] == 0
+
+
+def test_busy_server_is_retried(fake_server):
+    server:FakeOllamaServer = fake_server(fail_statuses=[503, 503])
+    pool:OllamaClientPool = OllamaClientPool(server.url, max_retries=2, backoff_seconds=0.01)
+    assert pool.generate(model='m', prompt='p')['response'] == 'echo: p'
+    assert len(server.prompts) == 3 and pool.stats()['retries'] == 2
+
+
+@pytest.mark.parametrize("fail_statuses,max_retries,requests", [([404], 2, 1), ([503, 503], 1, 2)])
+def test_errors_are_raised(fake_server, fail_statuses, max_retries, requests):
+    server:FakeOllamaServer = fake_server(fail_statuses=fail_statuses)
+    pool:OllamaClientPool = OllamaClientPool(server.url, max_retries=max_retries, backoff_seconds=0.01)
+    with pytest.raises(OllamaResponseError):
+        pool.generate(model='m', prompt='p')
+    assert len(server.prompts) == requests
+
+
+def test_unreachable_server():
+    pool:OllamaClientPool = OllamaClientPool('http://127.0.0.1:9', max_retries=1, backoff_seconds=0.01)
+    with pytest.raises(ConnectionError):
+        pool.generate(model='m', prompt='p')
+
+
+def test_deadline(fake_server):
+    server:FakeOllamaServer = fake_server(delay=1.0)
+    pool:OllamaClientPool = OllamaClientPool(server.url)
+    start:float = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pool.generate(model='m', prompt='p', timeout_seconds=0.2)
+    assert time.monotonic() - start < 0.5 and pool.stats()['timeouts'] == 1
+
+
+def test_waiting_greenlets_do_not_block_each_other(fake_server):
+    server:FakeOllamaServer = fake_server(delay=0.2)
+    pool:OllamaClientPool = OllamaClientPool(server.url, max_concurrency=4)
+    start:float = time.monotonic()
+    greenlets:list[gevent.Greenlet] = [gevent.spawn(pool.generate, model='m', prompt=f'p{i}') for i in range(4)]
+    gevent.joinall(greenlets, raise_error=True)
+
+    assert [greenlet.value['response'] for greenlet in greenlets] == [f'echo: p{i}' for i in range(4)]
+    assert time.monotonic() - start < 0.6
@@ -0,0 +1,225 @@
+
+import pytest
+import sys
+import os
+import time
+
+from types import SimpleNamespace
+
+# Modify sys path for util and obj imports
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+# Finish imports
+from objects import OllamaQueryHandler
+from utils import allocate_tokens
+from conftest import FakeOllamaClient, SUMMARY, add_file
+
+
+# ---- Setup ---- #
+def tree_calls(leaves:int, fan_in:int) -> int:
+    """Returns the number of summaries made by a map-reduce tree with the given number of chunks and fan in."""
+    calls:int = leaves
+    while leaves > 1:
+        leaves = -(-leaves // fan_in)
+        calls += leaves
+    return calls
+
+
+# ---- Tests ---- #
+def test_short_text_is_not_summarized():
+    client:FakeOllamaClient = FakeOllamaClient()
+    assert OllamaQueryHandler(client, 'm').recursive_summarize_text('short text') == 'short text'
+    assert client.prompts == []
+
+
+def test_chunks_summarized_concurrently_and_reduced_as_tree():
+    client:FakeOllamaClient = FakeOllamaClient()
+    handler:OllamaQueryHandler = OllamaQueryHandler(client, 'm', summary_workers=4, summary_fan_in=3)
+    text:str = ' '.join(f'word{i}' for i in range(2000))
+    chunks:list[str] = handler.chunk_text(text, chunk_size=200, overlap=20)
+
+    summary:str = handler.recursive_summarize_text(text, chunk_size=200, max_summary_len=len(OllamaQueryHandler.tokenize(SUMMARY)), overlap=20)
+
+    assert summary == SUMMARY
+    assert len(chunks) > 9 and len(client.prompts) == tree_calls(len(chunks), 3)
+    assert 1 < client.max_active <= 4
+    assert all(prompt.count(SUMMARY) <= 3 for prompt in client.prompts)
+
+
+def test_stops_when_summaries_stop_shrinking():
+    client:FakeOllamaClient = FakeOllamaClient(echo=True)
+    text:str = ' '.join(f'word{i}' for i in range(100))
+    assert OllamaQueryHandler(client, 'm').recursive_summarize_text(text, max_summary_len=10) == text
+    assert len(client.prompts) == 1
+
+
+def test_summaries_are_stored(file_db, tmp_path):
+    client:FakeOllamaClient = FakeOllamaClient()
+    handler:OllamaQueryHandler = OllamaQueryHandler(client, 'm')
+    path:str = str(tmp_path / 'report.txt')
+    with open(path, 'w') as file: file.write('word ' * 100)
+
+    assert handler.summarize_file(path, file_db, max_length=10) == (SUMMARY, False)
+    assert handler.summarize_file(path, file_db, max_length=10) == (SUMMARY, True)
+    assert len(client.prompts) == 1
+
+    # Other settings and changed files are summarized again
+    assert handler.summarize_file(path, file_db, max_length=20) == (SUMMARY, False)
+    with open(path, 'a') as file: file.write('more words')
+    assert handler.summarize_file(path, file_db, max_length=10) == (SUMMARY, False)
+    assert len(client.prompts) == 3
+
+
+def test_indexed_text_is_summarized(file_db, tmp_path):
+    path:str = str(tmp_path / 'report.txt')
+    add_file(file_db, path, 'text on disk', stored_text='stored text')
+    assert OllamaQueryHandler(FakeOllamaClient(), 'm').summarize_file(path, file_db) == ('stored text', False)
+
+
+@pytest.mark.parametrize("lengths,weights,budget,expected", [
+    ([100, 100], [1, 1], 1000, [100, 100]),                 # Everything fits
+    ([100, 1000, 1000], [1, 1, 1], 900, [100, 400, 400]),   # The short piece's unused share goes to the others
+    ([1000, 1000], [3, 1], 400, [300, 100]),                # Shares follow the weights
+    ([1000, 1000], [0, 0], 400, [200, 200]),                # ...equal without weights
+    ([0, 1000], [1, 1], 400, [0, 400]),
+    ([1000], [1], -5, [0]),
+])
+def test_allocate_tokens(lengths, weights, budget, expected):
+    assert allocate_tokens(lengths, weights, budget) == expected
+
+
+def test_confidence_prompt_fits_budget():
+    handler:OllamaQueryHandler = OllamaQueryHandler(FakeOllamaClient(), 'm', context_tokens=4000)
+    documents:dict[str, str] = {'a.txt': 'alpha ' * 5000, 'b.txt': 'beta ' * 5000, 'c.txt': 'short gamma'}
+    prompt, usage = handler.build_confidence_prompt('query', documents, first_n_toks=10000, relevance={'a.txt': 2, 'b.txt': 1})
+
+    assert usage['budget'] == 4000 - 3 * OllamaQueryHandler.RESPONSE_TOKENS_PER_DOCUMENT['scores']
+    assert usage['used'] == len(OllamaQueryHandler.tokenize(prompt)) <= usage['budget']
+    assert usage['used'] > usage['budget'] - 20
+    assert usage['documents']['a.txt'] > usage['documents']['b.txt'] > 0
+    assert 'FILE 3: c.txt\nshort gamma' in prompt
+
+
+def test_known_short_documents_are_not_tokenized(monkeypatch):
+    handler:OllamaQueryHandler = OllamaQueryHandler(FakeOllamaClient(), 'm')
+    tokenized:list[str] = []
+    tokenize = OllamaQueryHandler.tokenize
+    monkeypatch.setattr(OllamaQueryHandler, 'tokenize', classmethod(lambda cls, text: tokenized.append(text) or tokenize(text)))
+
+    prompt, usage = handler.build_confidence_prompt('query {with braces}', {'a.txt': 'digest text'}, token_counts={'a.txt': 2})
+    assert 'digest text' not in tokenized
+    assert '"query {with braces}"' in prompt and usage['documents'] == {'a.txt': 2}
+
+
+def test_prompt_overflow_raises():
+    handler:OllamaQueryHandler = OllamaQueryHandler(FakeOllamaClient(), 'm', context_tokens=100)
+    with pytest.raises(ValueError):
+        handler.build_confidence_prompt('query', {'a.txt': 'text'})
+
+
+def test_least_relevant_documents_left_out_when_prompt_overflows():
+    documents:dict[str, str] = {f'/some/long/directory/name/file_{i}.txt': f'text {i}' for i in range(60)}
+    relevance:dict[str, float] = {name: 1 / (rank + 1) for rank, name in enumerate(documents)}
+    handler:OllamaQueryHandler = OllamaQueryHandler(FakeOllamaClient(), 'm', context_tokens=2000)
+    prompt, usage = handler.build_confidence_prompt('query', documents, relevance=relevance)
+    
+    # The most relevant documents are kept (in order) and the prompt fits with their share of the response
+    kept:list[str] = list(usage['documents'])
+    assert usage['dropped'] and kept + usage['dropped'][::-1] == list(documents)
+    assert usage['used'] <= usage['budget'] == 2000 - len(kept) * OllamaQueryHandler.RESPONSE_TOKENS_PER_DOCUMENT['scores']
+    
+    # Only the kept documents are scored
+    handler.ollama_client.response = '{"documents": [%s]}' % ', '.join(['50'] * len(kept))
+    assert list(handler.get_confidence('query', documents, relevance=relevance)) == kept
+
+
+@pytest.mark.parametrize("output,response,expected", [
+    ('scores', '{"documents": [87, 150]}', {'a.txt': {'confidence': 87, 'context': None}, 'b.txt': {'confidence': 100, 'context': None}}),
+    ('explained', '{"documents": [{"confidence": 12, "context": "why a"}, {"confidence": 3, "context": "why b"}]}', 
+     {'a.txt': {'confidence': 12, 'context': 'why a'}, 'b.txt': {'confidence': 3, 'context': 'why b'}}),
+])
+def test_confidence_is_schema_constrained(output, response, expected):
+    client:FakeOllamaClient = FakeOllamaClient(response=response)
+    handler:OllamaQueryHandler = OllamaQueryHandler(client, 'm', confidence_output=output)
+    assert handler.get_confidence('query', {'a.txt': 'alpha', 'b.txt': 'beta'}) == expected
+    
+    # The response must be a list with a result per document, and its length is capped
+    schema:dict = client.kwargs['format']['properties']['documents']
+    assert schema['minItems'] == schema['maxItems'] == 2
+    assert (schema['items']['type'] == 'integer') == (output == 'scores')
+    assert client.kwargs['options']['num_predict'] == 2 * OllamaQueryHandler.RESPONSE_TOKENS_PER_DOCUMENT[output] + 16
+
+
+def test_scores_leave_more_context_for_documents():
+    handler:OllamaQueryHandler = OllamaQueryHandler(FakeOllamaClient(), 'm', context_tokens=4000)
+    documents:dict[str, str] = {'a.txt': 'alpha ' * 5000, 'b.txt': 'beta ' * 5000}
+    _, scores_usage = handler.build_confidence_prompt('query', documents, first_n_toks=10000, output='scores')
+    _, explained_usage = handler.build_confidence_prompt('query', documents, first_n_toks=10000, output='explained')
+    assert scores_usage['budget'] > explained_usage['budget']
+
+
+def test_invalid_confidence_response_raises():
+    handler:OllamaQueryHandler = OllamaQueryHandler(FakeOllamaClient(response='{"documents": [87'), 'm')
+    with pytest.raises(ValueError):
+        handler.get_confidence('query', {'a.txt': 'alpha'})
+
+
+def test_explain_match():
+    client:FakeOllamaClient = FakeOllamaClient(response=' It matches. ')
+    handler:OllamaQueryHandler = OllamaQueryHandler(client, 'm')
+    assert handler.explain_match('query', 'a.txt', 'alpha ' * 1000, first_n_toks=50) == 'It matches.'
+    assert 'alpha ' * 1000 not in client.prompts[0]
+    assert client.kwargs['format'] == '' and client.kwargs['options']['num_predict'] == OllamaQueryHandler.EXPLANATION_TOKENS
+
+
+def test_requests_keep_the_model_loaded():
+    client:FakeOllamaClient = FakeOllamaClient()
+    handler:OllamaQueryHandler = OllamaQueryHandler(client, 'm', context_tokens=2048, keep_alive='1h')
+    
+    # Every request (summaries too) is sent with the keep alive and the same context window, so the model isn't reloaded
+    for request in [lambda: handler.generate('prompt'), lambda: handler.summarize_text('text'), handler.warm_up]:
+        request()
+        assert client.kwargs['keep_alive'] == '1h' and client.kwargs['options']['num_ctx'] == 2048
+    assert client.prompts[-1] == ''
+
+
+@pytest.mark.parametrize("keep_alive,expected", [('30m', '30m'), (' -1m ', '-1m'), ('-1', -1), ('300', 300), (0, 0)])
+def test_numeric_keep_alive_is_sent_as_seconds(keep_alive, expected):
+    assert OllamaQueryHandler(FakeOllamaClient(), 'm', keep_alive=keep_alive).keep_alive == expected
+
+
+def test_confidence_prompts_start_with_the_instructions():
+    handler:OllamaQueryHandler = OllamaQueryHandler(FakeOllamaClient(), 'm')
+    for output in OllamaQueryHandler.CONFIDENCE_OUTPUTS:
+        first, _ = handler.build_confidence_prompt('tax return', {'a.txt': 'alpha'}, output=output)
+        second, _ = handler.build_confidence_prompt('invoice', {'b.txt': 'beta', 'c.txt': 'gamma'}, output=output)
+        assert os.path.commonprefix([first, second]).startswith(OllamaQueryHandler.CONFIDENCE_INSTRUCTIONS[output])
+
+
+def test_request_timings_and_stats():
+    handler:OllamaQueryHandler = OllamaQueryHandler(FakeOllamaClient(), 'm')
+    cold:dict = OllamaQueryHandler.request_timings(SimpleNamespace(load_duration=2e9, prompt_eval_duration=1e8, prompt_eval_count=300, total_duration=3e9))
+    assert cold == {'load_ms': 2000, 'prompt_eval_ms': 100, 'prompt_eval_tokens': 300, 'ttft_ms': 2100, 'total_ms': 3000}
+    
+    # Only requests with timings are counted
+    handler.timings.extend([cold, OllamaQueryHandler.request_timings(SimpleNamespace(load_duration=1e7, prompt_eval_duration=9e7, prompt_eval_count=100))])
+    handler.generate('prompt')
+    stats:dict = handler.stats()
+    assert stats['requests'] == 2 and stats['cold_starts'] == 1
+    assert stats['mean_ttft_ms'] == 1100 and stats['max_ttft_ms'] == 2100 and stats['mean_prompt_eval_tokens'] == 200
+
+
+def test_keep_warm():
+    client:FakeOllamaClient = FakeOllamaClient()
+    handler:OllamaQueryHandler = OllamaQueryHandler(client, 'm')
+    handler.start_keep_warm(0.1)
+    time.sleep(0.35)
+    handler.stop_keep_warm()
+    
+    # Warmed up right away and then every interval, until stopped
+    warm_ups:int = len(client.prompts)
+    assert 3 <= warm_ups <= 5 and set(client.prompts) == {''}
+    time.sleep(0.2)
+    assert len(client.prompts) == warm_ups
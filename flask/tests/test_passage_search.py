@@ -0,0 +1,139 @@
+
+import pytest
+import sys
+import os
+import numpy as np
+
+# Modify sys path for util and obj imports
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+# Finish imports
+from utils import search_files, search_files_batch, split_passages, passage_hash, passage_id_range, parse_search_filters
+from utils import file_digest, DIGEST_ENCODING
+from conftest import FakeBackend
+
+
+# ---- Config ---- #
+# Files: (path, text, whole-text embedding, metadata, passages). The query embedding is [1, 0]: "manual.txt" is far from it as a
+# whole, but its second passage (the end of its text) is the nearest vector of all
+MANUAL:str = 'installation steps. ' * 10 + 'resetting the router to factory defaults'
+FILES:list[tuple[str, str, list[float], dict, list[tuple[tuple[int, int], list[float]]]]] = [
+    ('intro.txt', 'a short introduction', [0.6, 0.8], {}, [((0, 20), [0.6, 0.8])]),
+    ('manual.txt', MANUAL, [-1.0, 0.0], {}, [((0, 20), [-1.0, 0.0]), ((len(MANUAL) - 40, len(MANUAL)), [0.99, 0.1])]),
+    ('notes.txt', 'unrelated notes', [0.0, -1.0], {}, []),
+]
+
+
+# ---- Setup ---- #
+def query_model() -> FakeBackend:
+    """Returns a model that embeds every query as [1, 0]."""
+    return FakeBackend(2, embed=lambda query: [1.0, 0.0])
+
+
+# ---- Tests ---- #
+def test_split_passages_overlap_and_cover_text():
+    text:str = ' '.join(f'word{i}' for i in range(500))
+    passages:list[tuple[int, int]] = split_passages(text, passage_chars=100, overlap_chars=20)
+
+    assert all(end - start <= 100 for start, end in passages)
+    assert all(text[start - 1:start].strip() == '' and text[end:end + 1].strip() == '' for start, end in passages)
+    assert all(start < prev_end for (_, prev_end), (start, _) in zip(passages, passages[1:]))
+    assert (passages[0][0], passages[-1][1]) == (0, len(text))
+
+
+def test_edit_only_changes_nearby_passages():
+    words:list[str] = [f'w{i * 7919 % 10007}' for i in range(20000)]
+    text:str = ' '.join(words)
+    hashes:set[str] = {passage_hash(text[start:end]) for start, end in split_passages(text)}
+
+    # Change a word and insert a few in the middle of the text
+    words[9000] = 'edited'
+    words.insert(12000, 'a few new words')
+    edited:str = ' '.join(words)
+    new_hashes:list[str] = [passage_hash(edited[start:end]) for start, end in split_passages(edited)]
+
+    assert len(new_hashes) > 100
+    assert sum(h not in hashes for h in new_hashes) <= 4
+
+
+@pytest.mark.parametrize("text", ['', '   \n '])
+def test_split_passages_blank_text(text):
+    assert split_passages(text) == []
+
+
+def test_file_matches_on_its_passages(corpus):
+    file_db, index, passage_index = corpus
+    assert [hit['name'] for hit in search_files('query', query_model(), 2, index, file_db.cursor, top_k=1)] == ['intro.txt']
+
+    hits:list[dict] = search_files('query', query_model(), 2, index, file_db.cursor, top_k=2, passage_index=passage_index, passages_per_file=1)
+    assert [hit['name'] for hit in hits] == ['manual.txt', 'intro.txt']
+    assert hits[0]['distance'] == pytest.approx(0.0101, abs=1e-4)
+    assert hits[0]['passages'] == [{
+        'start': 200, 'end': 240, 'distance': pytest.approx(0.0101, abs=1e-4), 'text': 'resetting the router to factory defaults'
+    }]
+
+
+def test_files_without_passages_still_match(corpus):
+    file_db, index, passage_index = corpus
+    hits:list[dict] = search_files('query', query_model(), 2, index, file_db.cursor, top_k=3, passage_index=passage_index)
+    assert [hit['name'] for hit in hits] == ['manual.txt', 'intro.txt', 'notes.txt']
+    assert hits[2]['passages'] == []
+
+
+def test_passage_search_respects_filters(corpus, tmp_path):
+    file_db, index, passage_index = corpus
+    filters:dict = parse_search_filters({'path_prefix': str(tmp_path), 'extensions': ['txt']})
+    hits:list[dict] = search_files('query', query_model(), 2, index, file_db.cursor, top_k=1, passage_index=passage_index, filters=filters)
+    assert hits[0]['name'] == 'manual.txt'
+
+    file_db.cursor.execute("UPDATE file_metadata SET file_ext = 'pdf' WHERE file_name = 'manual.txt'")
+    hits = search_files('query', query_model(), 2, index, file_db.cursor, top_k=1, passage_index=passage_index, filters=filters)
+    assert hits[0]['name'] == 'intro.txt'
+
+
+def test_batch_search_matches_on_passages(corpus):
+    file_db, index, passage_index = corpus
+    results:list[list[dict]] = search_files_batch(['a', 'b'], query_model(), 2, index, file_db.cursor, top_k=1, passage_index=passage_index)
+    assert [[(hit['name'], len(hit['passages'])) for hit in hits] for hits in results] == [[('manual.txt', 2)], [('manual.txt', 2)]]
+
+
+def test_passage_embeddings_by_hash(corpus, tmp_path):
+    file_db, _, _ = corpus
+    manual_id:int = file_db.check_file_exists(str(tmp_path / 'manual.txt'))['id']
+    embeddings:dict[str, bytes] = file_db.get_passage_embeddings(manual_id, 'm@1')
+
+    assert embeddings[passage_hash('resetting the router to factory defaults')] == np.array([0.99, 0.1], dtype=np.float32).tobytes()
+    assert file_db.get_passage_embeddings(manual_id, 'm@2') == {}
+
+
+def test_deleted_file_leaves_passages(corpus, tmp_path):
+    file_db, _, passage_index = corpus
+    manual_id:int = file_db.check_file_exists(str(tmp_path / 'manual.txt'))['id']
+    file_db.delete_file_entry(str(tmp_path / 'manual.txt'))
+    assert not file_db.has_file_passages(manual_id, 'm@1')
+
+    passage_index.remove_ids(passage_id_range(manual_id))
+    assert passage_index.ntotal == 1
+
+
+def test_file_digest_is_lead_of_text():
+    text:str = 'first   line\n\n' + 'word ' * 1000
+    digest, token_count = file_digest(text, max_tokens=50)
+
+    assert token_count == 50 and len(DIGEST_ENCODING.encode(digest)) <= 50
+    assert ('first line ' + 'word ' * 1000).startswith(digest)
+    assert file_digest(' short \n text ') == ('short text', len(DIGEST_ENCODING.encode('short text')))
+
+
+def test_digests_stored_with_text(corpus, tmp_path):
+    file_db, _, _ = corpus
+    ids:list[int] = [file_db.check_file_exists(str(tmp_path / path))['id'] for path, *_ in FILES]
+    digests:dict[int, tuple[str, int]] = file_db.get_file_digests(ids)
+
+    assert digests[ids[0]] == file_digest('a short introduction')
+    assert digests[ids[2]][0] == 'unrelated notes'
+
+    file_db.delete_file_entry(str(tmp_path / 'notes.txt'))
+    assert list(file_db.get_file_digests(ids)) == ids[:2]
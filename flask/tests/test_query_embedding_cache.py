@@ -0,0 +1,84 @@
+
+import pytest
+import sys
+import os
+import numpy as np
+
+from types import SimpleNamespace
+
+# Modify sys path for util and obj imports
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+# Finish imports
+from objects import QueryEmbeddingCache
+from conftest import FakeBackend
+
+
+# ---- Setup ---- #
+# Fixture for tests: a model that embeds a query as [len(query), 1]
+@pytest.fixture
+def model():
+    return FakeBackend(2, embed=lambda query: [len(query), 1])
+
+
+# ---- Tests ---- #
+def test_repeated_query_skips_model(model):
+    cache:QueryEmbeddingCache = QueryEmbeddingCache(max_size=8)
+    first:np.ndarray = cache.encode('Tax return', 'm@1', model)
+    second:np.ndarray = cache.encode('  tax   RETURN ', 'm@1', model)
+
+    assert model.texts == ['tax return']
+    assert np.array_equal(first, second)
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+
+
+def test_models_are_cached_separately(model):
+    cache:QueryEmbeddingCache = QueryEmbeddingCache(max_size=8)
+    cache.encode('query', 'm@1', model)
+    cache.encode('query', 'm@2', model)
+    assert len(model.texts) == 2
+
+
+def test_least_recently_used_is_evicted(model):
+    cache:QueryEmbeddingCache = QueryEmbeddingCache(max_size=2)
+    cache.encode('a', 'm@1', model)
+    cache.encode('b', 'm@1', model)
+    cache.encode('a', 'm@1', model)     # "a" is now the most recently used
+    cache.encode('c', 'm@1', model)     # Evicts "b"
+
+    assert cache.get(('a', 'm@1')) is not None
+    assert cache.get(('b', 'm@1')) is None
+    assert cache.stats()['size'] == 2
+
+
+def test_expired_entries_are_recomputed(model, monkeypatch):
+    cache:QueryEmbeddingCache = QueryEmbeddingCache(max_size=8, ttl_seconds=10)
+    now:list[float] = [100.0]
+    monkeypatch.setattr(sys.modules['objects.QueryEmbeddingCache'], 'time', SimpleNamespace(monotonic=lambda: now[0]))
+
+    cache.encode('query', 'm@1', model)
+    now[0] += 5
+    cache.encode('query', 'm@1', model)
+    now[0] += 20
+    cache.encode('query', 'm@1', model)
+    assert len(model.texts) == 2
+
+
+def test_zero_size_disables_cache(model):
+    cache:QueryEmbeddingCache = QueryEmbeddingCache(max_size=0)
+    cache.encode('query', 'm@1', model)
+    cache.encode('query', 'm@1', model)
+    assert len(model.texts) == 2
+    assert cache.stats()['size'] == 0
+
+
+def test_encode_many_embeds_misses_in_one_batch(model):
+    cache:QueryEmbeddingCache = QueryEmbeddingCache(max_size=8)
+    cache.encode('cached', 'm@1', model)
+    embeddings:np.ndarray = cache.encode_many(['a', 'cached', 'bb', 'A '], 'm@1', model)
+
+    assert len(model.batch_sizes) == 2
+    assert model.texts == ['cached', 'a', 'bb']
+    assert embeddings[:, 0].tolist() == [1, 6, 2, 1]
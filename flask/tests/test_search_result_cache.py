@@ -0,0 +1,90 @@
+
+import pytest
+import sys
+import os
+import numpy as np
+
+# Modify sys path for util and obj imports
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+# Finish imports
+from objects import SearchResultCache, FileMetadataDatabase
+from utils import normalize_path
+
+
+# ---- Config ---- #
+CREATE_TABLES_SCRIPT:str = os.path.join(parent_dir, 'sql', 'metadata_db_tables.sql')
+
+
+# ---- Setup ---- #
+# Fixture for tests: a DB with two indexed files
+@pytest.fixture
+def file_db(tmp_path):
+    file_metadata_db:FileMetadataDatabase = FileMetadataDatabase(str(tmp_path / 'file_metadata.db'), create_tables_script=CREATE_TABLES_SCRIPT)
+    for name in ('a.txt', 'b.txt'):
+        file_metadata_db.new_file_entry(str(tmp_path / name), name, {}, f'hash-{name}', np.zeros(4, dtype=np.float32))
+    return file_metadata_db
+
+
+def cache_result(cache:SearchResultCache, file_db:FileMetadataDatabase, key:tuple, paths:list[str]) -> dict:
+    """Caches a result made from the given files (as the /search-files endpoint does)."""
+    result:dict = {'faiss_top_files': paths}
+    cache.put(key, result, file_db.get_file_hashes(paths))
+    return result
+
+
+# ---- Tests ---- #
+def test_same_query_hits(file_db, tmp_path):
+    cache:SearchResultCache = SearchResultCache(max_size=8)
+    result:dict = cache_result(cache, file_db, SearchResultCache.key('Tax Return', 3, 'v1', 'm@1'), [str(tmp_path / 'a.txt')])
+
+    assert cache.get(SearchResultCache.key('  tax return ', 3, 'v1', 'm@1'), file_db) == result
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 0)
+
+
+@pytest.mark.parametrize("key", [
+    ('tax return', 5, 'v1', 'm@1'),     # Different K
+    ('tax return', 3, 'v2', 'm@1'),     # New index version
+    ('tax return', 3, 'v1', 'm@2'),     # Different model
+])
+def test_different_key_misses(file_db, tmp_path, key):
+    cache:SearchResultCache = SearchResultCache(max_size=8)
+    cache_result(cache, file_db, SearchResultCache.key('tax return', 3, 'v1', 'm@1'), [str(tmp_path / 'a.txt')])
+    assert cache.get(SearchResultCache.key(*key), file_db) is None
+
+
+def test_changed_file_invalidates(file_db, tmp_path):
+    cache:SearchResultCache = SearchResultCache(max_size=8)
+    key:tuple = SearchResultCache.key('tax return', 3, 'v1', 'm@1')
+    cache_result(cache, file_db, key, [str(tmp_path / 'a.txt'), str(tmp_path / 'b.txt')])
+
+    # Re-index "b.txt" with a new hash
+    file_db.cursor.execute('UPDATE file_metadata SET file_sha256 = ? WHERE file_path = ?', ('new-hash', normalize_path(str(tmp_path / 'b.txt'))))
+    file_db.cxn.commit()
+
+    assert cache.get(key, file_db) is None
+    assert cache.stats()['invalidations'] == 1
+    assert cache.stats()['size'] == 0
+
+
+def test_deleted_file_invalidates(file_db, tmp_path):
+    cache:SearchResultCache = SearchResultCache(max_size=8)
+    key:tuple = SearchResultCache.key('tax return', 3, 'v1', 'm@1')
+    cache_result(cache, file_db, key, [str(tmp_path / 'a.txt')])
+
+    file_db.delete_file_entry(str(tmp_path / 'a.txt'))
+    assert cache.get(key, file_db) is None
+
+
+def test_least_recently_used_is_evicted(file_db, tmp_path):
+    cache:SearchResultCache = SearchResultCache(max_size=2)
+    keys:list[tuple] = [SearchResultCache.key(q, 3, 'v1', 'm@1') for q in ('a', 'b', 'c')]
+    cache_result(cache, file_db, keys[0], [])
+    cache_result(cache, file_db, keys[1], [])
+    cache.get(keys[0], file_db)                     # "a" is now the most recently used
+    cache_result(cache, file_db, keys[2], [])       # Evicts "b"
+
+    assert cache.get(keys[0], file_db) is not None
+    assert cache.get(keys[1], file_db) is None
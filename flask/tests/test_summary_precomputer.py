@@ -0,0 +1,76 @@
+
+import pytest
+import sys
+import os
+
+# Modify sys path for util and obj imports
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+# Finish imports
+from objects import OllamaQueryHandler, SummaryPrecomputer
+from utils import hash_file_sha256
+from conftest import FakeOllamaClient, add_file
+
+
+# ---- Setup ---- #
+def make_precomputer(file_db, client:FakeOllamaClient|None=None, **kwargs) -> SummaryPrecomputer:
+    """Returns a precomputer for the given DB that is always idle (unless overridden)."""
+    return SummaryPrecomputer(OllamaQueryHandler(client or FakeOllamaClient(), 'm'), file_db.db_path, **{'idle_seconds': 0, 'max_load': 0, **kwargs})
+
+
+# ---- Tests ---- #
+def test_precompute_opened_then_newest_files(file_db, tmp_path):
+    ids:list[int] = [add_file(file_db, str(tmp_path / f'{i}.txt'), f'text {i}') for i in range(4)]
+    file_db.record_file_open(str(tmp_path / '1.txt'))
+    assert [row[0] for row in file_db.get_unsummarized_files('m', 500, 100, 2)] == [ids[1], ids[3], ids[2]]
+
+    precomputer:SummaryPrecomputer = make_precomputer(file_db)
+    assert precomputer.precompute(file_db) == 4
+    assert file_db.get_summary(hash_file_sha256(str(tmp_path / '2.txt')), 'm', 500, 100) == 'text 2'
+    assert file_db.get_unsummarized_files('m', 500, 100, 10) == []
+
+
+def test_summaries_of_files_no_longer_indexed_are_pruned(file_db, tmp_path):
+    path:str = str(tmp_path / 'report.txt')
+    add_file(file_db, path, 'text')
+    file_db.set_summary(hash_file_sha256(path), 'm', 500, 100, 'indexed')
+    file_db.set_summary('old hash', 'm', 500, 100, 'stale')
+    file_db.set_summary('new hash', 'm', 500, 100, 'recent')
+    file_db.record_file_open(str(tmp_path / 'deleted.txt'))
+    file_db.cursor.execute("UPDATE summaries SET created = datetime('now', '-40 days') WHERE file_sha256 != 'new hash'")
+    file_db.cursor.execute("UPDATE file_opens SET last_opened = datetime('now', '-40 days')")
+
+    # Only the old summary of a file that isn't indexed is deleted (with the old open count)
+    assert file_db.prune_summaries(30) == 1
+    assert file_db.get_summary('old hash', 'm', 500, 100) is None and file_db.get_summary('new hash', 'm', 500, 100) == 'recent'
+    assert file_db.get_summary(hash_file_sha256(path), 'm', 500, 100) == 'indexed'
+    assert file_db.table_as_df('file_opens').empty
+
+
+def test_no_precompute_while_busy(file_db, tmp_path):
+    add_file(file_db, str(tmp_path / 'report.txt'), 'text')
+    precomputer:SummaryPrecomputer = make_precomputer(file_db, idle_seconds=60)
+    precomputer.touch()
+    assert not precomputer.is_idle()
+    assert precomputer.precompute(file_db) == 0
+
+
+def test_skipped_files_do_not_block_the_others(file_db, tmp_path, monkeypatch):
+    ids:list[int] = [add_file(file_db, str(tmp_path / f'{i}.txt'), f'text {i}') for i in range(6)]
+    os.remove(tmp_path / '5.txt')
+    with open(tmp_path / '4.txt', 'a') as file: file.write(' changed')
+    precomputer:SummaryPrecomputer = make_precomputer(file_db, batch_size=2)
+    
+    # 3.txt fails to summarize
+    summarize_file = precomputer.ollama_query_handler.summarize_file
+    def failing_summarize_file(path:str, *args, **kwargs):
+        if path.endswith('3.txt'): raise ValueError('unreadable')
+        return summarize_file(path, *args, **kwargs)
+    monkeypatch.setattr(precomputer.ollama_query_handler, 'summarize_file', failing_summarize_file)
+    
+    # The missing, changed (summarized under its new hash) and failed files are skipped, so the next batches get to the older files
+    assert [precomputer.precompute(file_db) for _ in range(4)] == [1, 1, 2, 0]
+    assert [row[0] for row in file_db.get_unsummarized_files('m', 500, 100, 10)] == ids[:2:-1]
+    assert file_db.get_summary(hash_file_sha256(str(tmp_path / '4.txt')), 'm', 500, 100) == 'text 4 changed'
@@ -0,0 +1,70 @@
+
+import pytest
+import sys
+import os
+import time
+
+# Modify sys path for util and obj imports 
+parent_dir:str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+    
+# Finish imports 
+from objects import WorkQueue 
+
+
+# ---- Config ---- # 
+# Path to the create tables script (tests are run from "flask/tests")
+CREATE_TABLES_SCRIPT:str = os.path.join(parent_dir, 'sql', 'metadata_db_tables.sql')
+
+# Short lease so that expiry can be tested
+LEASE_SECONDS:float = 0.2
+
+
+# ---- Setup ---- # 
+# Fixture for tests: a fresh queue with a dir task and a (higher priority) file task
+@pytest.fixture
+def queue(tmp_path):
+    work_queue:WorkQueue = WorkQueue(str(tmp_path / 'queue.db'), lease_seconds=LEASE_SECONDS, max_attempts=2, create_tables_script=CREATE_TABLES_SCRIPT)
+    work_queue.enqueue([('directory', '/docs', 1.0), ('file', '/docs/a.txt', 5.0)])
+    return work_queue
+
+
+# ---- Tests ---- #
+def test_claims_are_exclusive_and_prioritized(queue):
+    first = queue.claim('w1')
+    second = queue.claim('w2', limit=5)
+    assert [t[1] for t in first] == ['file']
+    assert [t[1] for t in second] == ['directory']
+    assert queue.claim('w3') == []
+
+
+def test_expired_lease_is_reclaimed(queue):
+    task_id, _, _ = queue.claim('crashed')[0]
+    time.sleep(LEASE_SECONDS * 1.5)
+    assert queue.claim('w2')[0][0] == task_id
+    
+    # The crashed worker no longer holds the lease
+    assert not queue.complete(task_id, 'crashed')
+    assert queue.complete(task_id, 'w2')
+
+
+def test_heartbeat_keeps_lease(queue):
+    task_id, _, _ = queue.claim('w1')[0]
+    for _ in range(3): 
+        time.sleep(LEASE_SECONDS / 2)
+        queue.heartbeat('w1')
+    assert all(t[0] != task_id for t in queue.claim('w2', limit=5))
+
+
+def test_failed_task_is_retried_then_given_up(queue):
+    task_id, _, _ = queue.claim('w1')[0]
+    queue.fail(task_id, 'w1', 'boom')
+    assert queue.claim('w2')[0][0] == task_id
+    queue.fail(task_id, 'w2', 'boom')
+    assert queue.counts()['failed'] == 1
+
+
+def test_drained(queue):
+    for task_id, _, _ in queue.claim('w1', limit=5): queue.complete(task_id, 'w1')
+    assert queue.is_drained()
@@ -4,4 +4,5 @@ from .metadata_extraction_utils import *
 from .model_utils import *
 from .nlp_utils import *
 from .text_extraction_utils import *
-from .logging import * 
\ No newline at end of file
+from .logging import * 
+from .ipc_utils import *
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 import json
+import unicodedata
 from hashlib import sha256
 import platform 
 import datetime as dt 
@@ -15,6 +16,17 @@ def normalize_path(path: str) -> str:
     return os.path.abspath(path).replace('\\', '/').rstrip('/')
 
 
+def normalize_query(query:str) -> str: 
+    """Normalizes the given search query so that queries that only differ in case, unicode form or whitespace are the same 
+    (e.g. "  Tax  Return 2023" -> "tax return 2023")."""
+    return ' '.join(unicodedata.normalize('NFKC', query).casefold().split())
+
+
+def file_extension(path:str) -> str: 
+    """Returns the lowercase extension of the given path, without the dot (e.g. "Report.PDF" -> "pdf"), or "" if it has none."""
+    return os.path.splitext(path)[1].lstrip('.').lower()
+
+
 def hash_file_sha256(path:str, chunk_size:int=8192) -> str:
     """Hashes the file at the given path"""
 
@@ -1,13 +1,17 @@
 from tqdm import tqdm 
 import os 
+import re
+import zlib
+import bisect
 import numpy as np 
 import faiss
 import sqlite3 as sql
 import datetime as dt
+from hashlib import sha256
 
 from .metadata_extraction_utils import extract_metadata
 from .text_extraction_utils import read_file
-from .general import now, hash_file_sha256
+from .general import now, hash_file_sha256, normalize_path
 
 
 def index_filesystem(start:str, model:object, cxn:sql.Connection, cursor:sql.Cursor, embedding_dim:int, index_path:str, index:faiss.IndexFlatL2, verbose:bool=False): 
@@ -171,36 +175,526 @@ def index_directory(directory_path:str, model:object, cxn:sql.Connection, cursor
                 print(f"Error processing {file_path}: {e}")
 
 
-def search_files(query:str, model, embedding_dim:int, index:faiss.IndexFlatL2, cursor:sql.Cursor, top_k:int=5):
+def search_files(query:str, model, embedding_dim:int, index:faiss.IndexFlatL2, cursor:sql.Cursor, top_k:int=5, query_cache=None, model_id:str|None=None, 
+                 lexical_candidates:int=0, rrf_k:int=60, prefilter_min_files:int=0, filters:dict|None=None, passage_index:faiss.IndexIDMap|None=None, 
+                 passage_candidates:int=100, passages_per_file:int=2) -> list[dict]:
     """Searches the given index for the given query, using the given model to create an embedding for the query, and returns 
-    the top_k matched filenames."""
+    the top_k hits (see hydrate_hits()), best first. If a query cache (objects.QueryEmbeddingCache) is given, the query embedding 
+    is looked up in it under the given model id first, so repeated queries don't run the model.
+    
+    If [lexical_candidates] is set, the search is hybrid: the full text index is searched for that many candidates as well (see 
+    lexical_search()), and the two rankings are combined with reciprocal rank fusion (each hit also gets the fused "score"). 
+    Once the index holds at least [prefilter_min_files] files (0 means never), the lexical candidates also prefilter the vector 
+    search, which then only ranks those candidates (falling back to the whole index if there are none).
+    
+    If [filters] are given (see parse_search_filters()), they are evaluated in the DB (on indexed columns) and only the matching 
+    files are searched: the vector search gets them as an ID selector and the full text search as a subquery.
+    
+    If a [passage_index] is given, files are also matched on their passages (see vector_search()), and each hit gets its best 
+    [passages_per_file] "passages" (see attach_passages())."""
 
-    # Encode the query into an embedding and convert to a np array
-    query_embedding:np.ndarray = np.array(model.encode(query), dtype=np.float32).reshape(1, -1)
+    # Encode the query into an embedding (or get it from the cache) and convert to a np array
+    if query_cache is not None: query_embedding:np.ndarray = query_cache.encode(query, model_id, model).reshape(1, -1)
+    else: query_embedding:np.ndarray = np.array(model.encode(query), dtype=np.float32).reshape(1, -1)
 
     # Check shape of the query embedding 
     if query_embedding.shape[1] != embedding_dim:
         print("\033[91mERROR in search_files(): \033[0mQuery embedding has incorrect dimensions. Aborting search.")
         return []
 
-    # Search the index for the query embedding for the top_k documents 
-    _, indices = index.search(query_embedding, top_k)
+    # Get the ids of the files that match the filters (nothing to search if none do)
+    allowed_ids:list[int]|None = filtered_file_ids(cursor, filters) if filters else None
+    if allowed_ids == []: return []
+
+    # Vector search only: search the index (or the allowed files) for the query embedding for the top_k documents
+    passage_args:tuple = (passage_index, passage_candidates, passages_per_file)
+    if not lexical_candidates: 
+        vector_distances, passages = vector_search(query_embedding, top_k, index, cursor, allowed_ids, *passage_args)[0]
+        hits:list[dict] = hydrate_hits(cursor, [list(vector_distances)], [list(vector_distances.values())])[0]
+        return attach_passages(cursor, [hits], [passages])[0] if passage_index is not None else hits
+    
+    # Hybrid: get the lexical candidates (among the allowed files)
+    lexical_ids:list[int] = lexical_search(cursor, query, lexical_candidates, filters=filters)
+    
+    # Rank the embeddings, either only those of the lexical candidates (large corpus) or of the whole index (or allowed files)
+    if prefilter_min_files and index.ntotal >= prefilter_min_files and lexical_ids: 
+        vector_distances, passages = vector_search(query_embedding, len(lexical_ids), index, cursor, lexical_ids, *passage_args)[0]
+    else: 
+        vector_distances, passages = vector_search(query_embedding, max(top_k, lexical_candidates), index, cursor, allowed_ids, *passage_args)[0]
+    
+    # Fuse the rankings and keep the top_k
+    fused:list[tuple[int, float]] = reciprocal_rank_fusion([list(vector_distances), lexical_ids], k=rrf_k)[:top_k]
+    
+    # Return the hits (files only found by the lexical search have no distance)
+    hits:list[dict] = hydrate_hits(cursor, [[file_id for file_id, _ in fused]], [[vector_distances.get(file_id) for file_id, _ in fused]])[0]
+    scores:dict[int, float] = dict(fused)
+    for hit in hits: hit['score'] = scores[hit['id']]
+    return attach_passages(cursor, [hits], [passages])[0] if passage_index is not None else hits
+
+
+def search_files_batch(queries:list[str], model, embedding_dim:int, index:faiss.IndexFlatL2, cursor:sql.Cursor, top_k:int=5, query_cache=None, 
+                       model_id:str|None=None, filters:dict|None=None, passage_index:faiss.IndexIDMap|None=None, passage_candidates:int=100, 
+                       passages_per_file:int=2) -> list[list[dict]]: 
+    """Vector search for many queries at once: embeds the queries in one batch (the ones not in the query cache, if given), 
+    searches the index (and the passage index, if given) for all of them in one call and looks up all the hits in one DB query. 
+    Returns the top_k hits of each query (see hydrate_hits() and attach_passages()), in the order of the queries. The filters 
+    (see parse_search_filters()) apply to every query."""
+    
+    # Nothing to search
+    if not queries: return []
+    
+    # Embed the queries (one row per query)
+    if query_cache is not None: query_embeddings:np.ndarray = query_cache.encode_many(queries, model_id, model)
+    else: query_embeddings:np.ndarray = np.asarray(model.encode(list(queries)), dtype=np.float32).reshape(len(queries), -1)
+    
+    # Check shape of the query embeddings 
+    if query_embeddings.shape[1] != embedding_dim:
+        print("\033[91mERROR in search_files_batch(): \033[0mQuery embeddings have incorrect dimensions. Aborting search.")
+        return [[] for _ in queries]
+    
+    # Get the ids of the files that match the filters (nothing to search if none do)
+    allowed_ids:list[int]|None = filtered_file_ids(cursor, filters) if filters else None
+    if allowed_ids == []: return [[] for _ in queries]
+    
+    # Search the index for all the queries at once
+    results:list[tuple[dict[int, float], dict]] = vector_search(
+        np.ascontiguousarray(query_embeddings), top_k, index, cursor, allowed_ids, passage_index, passage_candidates, passages_per_file
+    )
+    
+    # Return the hits of each query
+    all_hits:list[list[dict]] = hydrate_hits(cursor, [list(distances) for distances, _ in results], [list(distances.values()) for distances, _ in results])
+    return attach_passages(cursor, all_hits, [passages for _, passages in results]) if passage_index is not None else all_hits
+
+
+def lexical_search(cursor:sql.Cursor, query:str, limit:int, filters:dict|None=None) -> list[int]: 
+    """Searches the full text index ("file_text" table) for files with any of the words of the given query (and that match 
+    the given filters, if any), and returns the ids of the best [limit] files, best first (ranked by BM25, with matches in the 
+    file name weighted double)."""
+    
+    # Quote each word so that the query can't use (or break) the FTS5 query syntax, and match any of them
+    words:list[str] = re.findall(r'\w+', query)
+    if not words: return []
+    match:str = ' OR '.join(f'"{word}"' for word in words)
+    
+    # Restrict the search to the files that match the filters
+    where, where_params = filter_clause(filters) if filters else ('1', [])
+    
+    # Execute query
+    cursor.execute(
+        f'''
+            SELECT rowid FROM file_text 
+            WHERE file_text MATCH ? AND rowid IN (SELECT id FROM file_metadata WHERE {where})
+            ORDER BY bm25(file_text, 2.0, 1.0) LIMIT ?
+        ''', 
+        (match, *where_params, limit)
+    )
+    
+    # Return results
+    return [row[0] for row in cursor.fetchall()]
+
+
+# Filters accepted by search_files(): 
+#   "path_prefix"     - only files under this dir
+#   "extensions"      - only files with one of these extensions (e.g. ["pdf", "docx"])
+#   "min_size"        - only files of at least this many bytes
+#   "max_size"        - only files of at most this many bytes
+#   "modified_after"  - only files modified at or after this time (ISO date/datetime, or seconds since the epoch)
+#   "modified_before" - only files modified before this time (ISO date/datetime, or seconds since the epoch)
+SEARCH_FILTERS:tuple[str, ...] = ('path_prefix', 'extensions', 'min_size', 'max_size', 'modified_after', 'modified_before')
+
+
+def parse_search_filters(filters:dict) -> dict: 
+    """Validates the given search filters (see SEARCH_FILTERS), e.g. from a request body, and returns them normalized: 
+    extensions as a list of lowercase extensions without dots, sizes as ints and times as seconds since the epoch. Filters that 
+    are not given (or None) are left out. Raises a ValueError if a filter is unknown or its value is invalid."""
+    
+    # Check the filters are known
+    if not isinstance(filters, dict): raise ValueError('Filters must be an object.')
+    unknown:set[str] = set(filters) - set(SEARCH_FILTERS)
+    if unknown: raise ValueError(f'Unknown filter(s) {sorted(unknown)}. Must be one of {SEARCH_FILTERS}.')
+    
+    # Normalize each given filter
+    parsed:dict = {}
+    for name, value in filters.items(): 
+        if value is None: continue
+        try: 
+            match name: 
+                case 'path_prefix': parsed[name] = normalize_path(str(value))
+                case 'extensions': parsed[name] = [str(ext).lstrip('.').lower() for ext in ([value] if isinstance(value, str) else value)]
+                case 'min_size' | 'max_size': parsed[name] = int(value)
+                case 'modified_after' | 'modified_before': 
+                    parsed[name] = float(value) if isinstance(value, (int, float)) else dt.datetime.fromisoformat(value).timestamp()
+        except (TypeError, ValueError) as e: 
+            raise ValueError(f'Invalid value for filter "{name}": {value!r}.') from e
+    
+    # Return the filters
+    return parsed
+
+
+def filter_clause(filters:dict) -> tuple[str, list]: 
+    """Returns the WHERE clause (and its params) that selects the rows of the "file_metadata" table that match the given 
+    (parsed) search filters. Every condition is on an indexed column (a path prefix is a range on the unique file_path). Files 
+    with an unknown modification time never match a time filter."""
+    
+    # Build the conditions
+    conditions:list[str] = []
+    params:list = []
+    if 'path_prefix' in filters: 
+        prefix:str = filters['path_prefix'].rstrip('/') + '/'
+        conditions.append('file_path >= ? AND file_path < ?')
+        params += [prefix, prefix[:-1] + chr(ord('/') + 1)]
+    if filters.get('extensions'): 
+        conditions.append(f'file_ext IN ({",".join("?" for _ in filters["extensions"])})')
+        params += filters['extensions']
+    if 'min_size' in filters: 
+        conditions.append('file_size >= ?')
+        params.append(filters['min_size'])
+    if 'max_size' in filters: 
+        conditions.append('file_size <= ?')
+        params.append(filters['max_size'])
+    if 'modified_after' in filters: 
+        conditions.append('file_mtime >= ?')
+        params.append(filters['modified_after'])
+    if 'modified_before' in filters: 
+        conditions.append('file_mtime < ?')
+        params.append(filters['modified_before'])
+    
+    # Return the clause 
+    return ' AND '.join(conditions) or '1', params
+
+
+def filtered_file_ids(cursor:sql.Cursor, filters:dict) -> list[int]: 
+    """Returns the ids of the files that match the given (parsed) search filters."""
+    where, where_params = filter_clause(filters)
+    cursor.execute(f'SELECT id FROM file_metadata WHERE {where}', where_params)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def id_selector(ids:list[int]|None) -> faiss.SearchParameters|None: 
+    """Returns Faiss search params that restrict a search of an id-mapped index to the given ids (None means no restriction)."""
+    if ids is None: return None
+    return faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.array(ids, dtype=np.int64)))
+
+
+def vector_search(query_embeddings:np.ndarray, k:int, index:faiss.IndexIDMap, cursor:sql.Cursor, allowed_ids:list[int]|None=None, 
+                  passage_index:faiss.IndexIDMap|None=None, passage_candidates:int=100, passages_per_file:int=2) -> list[tuple[dict[int, float], dict[int, list[tuple[int, float]]]]]: 
+    """Searches the index for the k files nearest to each of the given query embeddings (one row per query), only among the 
+    allowed files if given. Returns, per query, the distances of the files ({file id: distance}, nearest first) and the nearest 
+    passages of each file ({file id: [(passage id, distance), ...]}, nearest first).
+    
+    If a passage index is given, it is searched for the [passage_candidates] nearest passages as well, and a file's distance is 
+    that of its nearest vector: its whole-text embedding or any of its passages. So a file matches on any part of its text, and 
+    files whose passages aren't embedded (yet) still match on their whole-text embedding. Raises a ValueError if the index is 
+    an untrained (scalar quantized) index, which can't be searched."""
+    
+    # An untrained index can't be searched (see FilesystemIndexer.train_index())
+    if not index.is_trained: 
+        raise ValueError(f'The "{faiss_index_type(index)}" index is not trained yet, so it can\'t be searched. Index some files first.')
+    
+    # Search the files, and the passages (only those of the allowed files)
+    distances, indices = index.search(query_embeddings, k, params=id_selector(allowed_ids))
+    if passage_index is not None and passage_index.ntotal: 
+        selector:faiss.SearchParameters|None = id_selector(passage_ids_of_files(cursor, allowed_ids)) if allowed_ids is not None else None
+        passage_distances, passage_indices = passage_index.search(query_embeddings, max(passage_candidates, k), params=selector)
+    else: 
+        passage_distances, passage_indices = [[] for _ in indices], [[] for _ in indices]
+    
+    # Combine them for each query
+    results:list[tuple[dict[int, float], dict[int, list[tuple[int, float]]]]] = []
+    for query_indices, query_distances, query_passage_indices, query_passage_distances in zip(indices, distances, passage_indices, passage_distances): 
+        
+        # Group the passages by file (nearest first, as returned by the search)
+        passages:dict[int, list[tuple[int, float]]] = {}
+        for passage_id, distance in zip(query_passage_indices, query_passage_distances): 
+            if passage_id == -1: continue
+            file_passages:list[tuple[int, float]] = passages.setdefault(int(passage_id) >> PASSAGE_ID_BITS, [])
+            if len(file_passages) < passages_per_file: file_passages.append((int(passage_id), float(distance)))
+            
+        # Rank the files by their nearest vector and keep the k nearest
+        file_distances:dict[int, float] = {int(i): float(d) for i, d in zip(query_indices, query_distances) if i != -1}
+        for file_id, file_passages in passages.items(): 
+            file_distances[file_id] = min(file_distances.get(file_id, np.inf), file_passages[0][1])
+        nearest:dict[int, float] = dict(sorted(file_distances.items(), key=lambda item: item[1])[:k])
+        results.append((nearest, {file_id: passages[file_id] for file_id in nearest if file_id in passages}))
+        
+    # Return the results
+    return results
+
+
+def passage_ids_of_files(cursor:sql.Cursor, file_ids:list[int], batch_size:int=500) -> list[int]: 
+    """Returns the ids (see passage_id()) of the passages of the given files."""
+    passage_ids:list[int] = []
+    for i in range(0, len(file_ids), batch_size): 
+        batch:list[int] = file_ids[i:i + batch_size]
+        cursor.execute(
+            f'SELECT (file_id << {PASSAGE_ID_BITS}) | passage_no FROM file_passages WHERE file_id IN ({",".join("?" for _ in batch)})', 
+            batch
+        )
+        passage_ids += [row[0] for row in cursor.fetchall()]
+    return passage_ids
+
+
+def attach_passages(cursor:sql.Cursor, all_hits:list[list[dict]], all_passages:list[dict[int, list[tuple[int, float]]]]) -> list[list[dict]]: 
+    """Adds the given passages (per query, as returned by vector_search()) to the given hits (per query) as "passages": a list 
+    of dicts with the "start" and "end" (character offsets into the file's extracted text), "distance" and "text" of each 
+    passage, nearest first (empty if none of the file's passages matched). The passages are looked up in one query."""
+    
+    # Get all the passages of the hits at once (their text is sliced out of the file's text in the full text index)
+    passage_ids:list[int] = list({
+        passage_id 
+        for hits, passages in zip(all_hits, all_passages) for hit in hits 
+        for passage_id, _ in passages.get(hit['id'], [])
+    })
+    rows:dict[int, tuple] = {}
+    if passage_ids: 
+        file_ids:list[int] = list({passage_id >> PASSAGE_ID_BITS for passage_id in passage_ids})
+        cursor.execute(
+            f'''
+                SELECT (p.file_id << {PASSAGE_ID_BITS}) | p.passage_no, p.start_offset, p.end_offset, substr(t.content, p.start_offset + 1, p.end_offset - p.start_offset)
+                FROM file_passages p LEFT JOIN file_text t ON t.rowid = p.file_id
+                WHERE p.file_id IN ({','.join('?' for _ in file_ids)}) AND ((p.file_id << {PASSAGE_ID_BITS}) | p.passage_no) IN ({','.join('?' for _ in passage_ids)})
+            ''', 
+            [*file_ids, *passage_ids]
+        )
+        rows = {row[0]: row for row in cursor.fetchall()}
+        
+    # Add them to the hits
+    for hits, passages in zip(all_hits, all_passages): 
+        for hit in hits: 
+            hit['passages'] = [
+                {'start': row[1], 'end': row[2], 'distance': distance, 'text': row[3] or ''}
+                for passage_id, distance in passages.get(hit['id'], []) 
+                if (row := rows.get(passage_id)) is not None
+            ]
+            
+    # Return the hits
+    return all_hits
+
+
+def reciprocal_rank_fusion(rankings:list[list[int]], k:int=60) -> list[tuple[int, float]]: 
+    """Combines the given rankings (lists of ids, best first) into one: each id scores sum(1 / (k + rank)) over the rankings it 
+    is in (rank starting at 1). Returns the (id, score) pairs, best first."""
+    
+    # Sum the scores
+    scores:dict[int, float] = {}
+    for ranking in rankings: 
+        for rank, item_id in enumerate(ranking, start=1): 
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+            
+    # Return the ids, best first
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def hydrate_hits(cursor:sql.Cursor, indices:np.ndarray, distances:np.ndarray) -> list[list[dict]]: 
+    """Looks up the DB rows of the given Faiss results (one row of ids and distances per query, as returned by index.search()) 
+    in one query, and returns each query's hits as dicts with the file's "id", "path", "name", "size", "sha256" and the 
+    "distance" to the query (None if unknown), in the order of the results. Missing ids (-1, or rows deleted since the index 
+    was saved) are skipped."""
+
+    # Get the rows of all the hits at once (the index ids are the row ids in the DB)
+    ids:list[int] = list({int(i) for query_indices in indices for i in query_indices if i != -1})
+    rows:dict[int, tuple] = {}
+    if ids: 
+        cursor.execute(
+            f"SELECT id, file_path, file_name, file_size, file_sha256 FROM file_metadata WHERE id IN ({','.join('?' for _ in ids)})", 
+            ids
+        )
+        rows = {row[0]: row for row in cursor.fetchall()}
+
+    # Build each query's hits
+    return [
+        [
+            {'id': row[0], 'path': row[1], 'name': row[2], 'size': row[3], 'sha256': row[4], 'distance': None if distance is None else float(distance)}
+            for idx, distance in zip(query_indices, query_distances) 
+            if (row := rows.get(int(idx))) is not None
+        ]
+        for query_indices, query_distances in zip(indices, distances)
+    ]
+
+
+def select_hits(hits:list[dict], k:int, max_distance:float=0, relative_margin:float=0, expand_margin:float=0) -> list[dict]: 
+    """Picks the hits worth ranking from the given hits (best first; more than k of them, so that K can grow), so that fewer 
+    files are read and sent to the LLM. Each of these is disabled by 0: 
+        - [max_distance]: hits further than this from the query are dropped.
+        - [relative_margin]: hits further than this beyond the distance of the nearest hit are dropped.
+        - [expand_margin]: past the top k hits, the next hits are kept as long as they are within this of the distance of the 
+          k-th nearest hit (so K only grows when the scores are too close to call).
+    Hits with an unknown distance (only found by the full text search) are never dropped, but don't grow K either. The hits 
+    don't have to be in distance order (e.g. hybrid search returns them in fused rank order): the margins are measured on the 
+    distances, and the selected hits keep the given order."""
+    
+    # Drop the hits that are too far from the query (absolutely, or relative to the nearest hit)
+    distances:list[float] = [hit['distance'] for hit in hits if hit['distance'] is not None]
+    limit:float = min(
+        max_distance or np.inf, 
+        min(distances) + relative_margin if distances and relative_margin else np.inf
+    )
+    hits = [hit for hit in hits if hit['distance'] is None or hit['distance'] <= limit]
+    
+    # Keep the top k, and the hits after them while they are close to the k-th nearest
+    selected:list[dict] = hits[:k]
+    nearest:list[float] = sorted(hit['distance'] for hit in hits if hit['distance'] is not None)
+    if expand_margin and k and len(selected) == k and len(nearest) >= k: 
+        for hit in hits[k:]: 
+            if hit['distance'] is None or hit['distance'] > nearest[k - 1] + expand_margin: break
+            selected.append(hit)
+            
+    # Return the selected hits
+    return selected
+
+
+def top_hit_dominates(hits:list[dict], margin:float) -> bool: 
+    """Checks if the first of the given hits is nearer to the query than every other hit by at least [margin] (or is the only 
+    hit), i.e. if ranking the hits would not change the top match. The hits don't have to be in distance order (e.g. in fused 
+    rank order), so the margin is measured to the nearest of the others. Always False if the margin is 0 (disabled) or the 
+    distances of the first two hits aren't known."""
+    if not margin or not hits or hits[0]['distance'] is None: return False
+    if len(hits) == 1: return True
+    if hits[1]['distance'] is None: return False
+    return min(hit['distance'] for hit in hits[1:] if hit['distance'] is not None) - hits[0]['distance'] >= margin
+
+
+# ---- Embedding storage & index types ---- #
+# On-disk precisions of the embeddings in the DB ("embedding" BLOB column)
+EMBEDDING_DTYPES:dict[str, type] = {'float32': np.float32, 'float16': np.float16}
+
+# Faiss index types (bytes per vector for 384 dims): "flat" exact float32 (1536), "fp16" float16 (768), "sq8" 8 bit scalar 
+# quantized (384), "sq4" 4 bit scalar quantized (192). The scalar quantized types have to be trained on embeddings before use.
+INDEX_TYPES:tuple[str, ...] = ('flat', 'fp16', 'sq8', 'sq4')
+
+
+def embedding_to_blob(embedding:np.ndarray, storage_dtype:str='float32') -> bytes: 
+    """Converts the given embedding to bytes in the given precision (one of EMBEDDING_DTYPES) for storing in the DB."""
+    return np.asarray(embedding).astype(EMBEDDING_DTYPES[storage_dtype]).tobytes()
+
+
+def blob_to_embedding(blob:bytes, embedding_dim:int) -> np.ndarray: 
+    """Converts an embedding stored in the DB back to a float32 array. The precision is inferred from the size of the blob, so DBs
+    with a mix of precisions (e.g. after changing the storage precision) can be read."""
+    
+    # Find the stored precision
+    for dtype in EMBEDDING_DTYPES.values(): 
+        if len(blob) == embedding_dim * np.dtype(dtype).itemsize: 
+            return np.frombuffer(blob, dtype=dtype).astype(np.float32)
+        
+    # Unknown size (e.g. an embedding from a model with a different dim)
+    raise ValueError(f'Embedding blob of {len(blob)} bytes does not match an embedding dim of {embedding_dim}.')
+
+
+def new_faiss_index(embedding_dim:int, index_type:str='flat') -> faiss.IndexIDMap: 
+    """Creates an empty index of the given type (one of INDEX_TYPES) that maps each embedding to the id of its DB row."""
+    match index_type: 
+        case 'flat': index:faiss.Index = faiss.IndexFlatL2(embedding_dim)
+        case 'fp16': index:faiss.Index = faiss.IndexScalarQuantizer(embedding_dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+        case 'sq8': index:faiss.Index = faiss.IndexScalarQuantizer(embedding_dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+        case 'sq4': index:faiss.Index = faiss.IndexScalarQuantizer(embedding_dim, faiss.ScalarQuantizer.QT_4bit, faiss.METRIC_L2)
+        case _: raise AttributeError(f'Given index type "{index_type}" is not valid. Must be one of {INDEX_TYPES}.')
+    return faiss.IndexIDMap(index)
+
+
+def faiss_index_type(index:faiss.Index) -> str|None: 
+    """Returns the type (one of INDEX_TYPES) of the given id-mapped index, or None if it is not one of those types."""
+    
+    # Only id-mapped indexes are used
+    if not isinstance(index, faiss.IndexIDMap): return None
+    
+    # Check the type of the wrapped index
+    inner:faiss.Index = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexFlatL2): return 'flat'
+    if isinstance(inner, faiss.IndexScalarQuantizer): 
+        return {
+            faiss.ScalarQuantizer.QT_fp16: 'fp16', 
+            faiss.ScalarQuantizer.QT_8bit: 'sq8', 
+            faiss.ScalarQuantizer.QT_4bit: 'sq4'
+        }.get(inner.sq.qtype)
+    return None
+
+
+# ---- Passages ---- #
+# Passages are overlapping windows of a file's extracted text, embedded on their own (the model truncates long texts, so a file's 
+# embedding only covers the start of its text). Sizes are in characters (about 4 per token, so a passage fits MiniLM's 256 tokens)
+PASSAGE_CHARS:int = 1000
+PASSAGE_OVERLAP_CHARS:int = 200
+
+# The text is cut into passages where its content says so (content-defined chunking): after a word whose hash (with the two 
+# words before it) is divisible by PASSAGE_CUT_DIVISOR, once the passage is at least half its max length. An edit only moves 
+# the cuts around it, so the other passages (and their hashes, see passage_hash()) stay the same and their embeddings are kept
+PASSAGE_CUT_DIVISOR:int = 32
+
+# Passages are keyed in their Faiss index by passage_id(): the id of the file's row in the high bits and the number of the passage
+# in the low PASSAGE_ID_BITS, so a hit maps back to its file without a DB lookup and a file's passages are one range of ids
+PASSAGE_ID_BITS:int = 16
+MAX_PASSAGES_PER_FILE:int = 1 << PASSAGE_ID_BITS
+
+
+def split_passages(text:str, passage_chars:int=PASSAGE_CHARS, overlap_chars:int=PASSAGE_OVERLAP_CHARS) -> list[tuple[int, int]]: 
+    """Splits the given text into passages of at most [passage_chars] characters at content-defined cuts (see PASSAGE_CUT_DIVISOR), 
+    each also covering up to [overlap_chars] of the text before it. Passages start and end at whitespace (only a word longer than 
+    a passage is cut). Returns the (start, end) offsets of the passages (none for blank text), at most MAX_PASSAGES_PER_FILE of 
+    them (the rest of a huge text is left out)."""
+    
+    # Get the words of the text
+    words:list[tuple[int, int]] = [match.span() for match in re.finditer(r'\S+', text)]
+    max_chars:int = max(passage_chars - overlap_chars, 1)
+    
+    # Cut the text into chunks after the words with a hash divisible by the divisor
+    chunks:list[tuple[int, int]] = []
+    chunk_start:int|None = None
+    for i, (start, end) in enumerate(words): 
+        
+        # Start a chunk, or end the chunk before this word if it doesn't fit (cutting up a word longer than a chunk)
+        if chunk_start is not None and end - chunk_start > max_chars and start > chunk_start: 
+            chunks.append((chunk_start, words[i - 1][1]))
+            chunk_start = None
+        if chunk_start is None: chunk_start = start
+        while end - chunk_start > max_chars: 
+            chunks.append((chunk_start, chunk_start + max_chars))
+            chunk_start += max_chars
+            
+        # End the chunk after this word if it is a cut
+        if end - chunk_start >= max_chars // 2 and zlib.crc32(text[words[max(i - 2, 0)][0]:end].encode()) % PASSAGE_CUT_DIVISOR == 0: 
+            chunks.append((chunk_start, end))
+            chunk_start = None
+    if chunk_start is not None: chunks.append((chunk_start, words[-1][1]))
+    
+    # Extend each chunk back over the end of the one before it, to the first word in the overlap
+    word_starts:list[int] = [start for start, _ in words]
+    passages:list[tuple[int, int]] = []
+    for start, end in chunks[:MAX_PASSAGES_PER_FILE]: 
+        first_word:int = bisect.bisect_left(word_starts, start - overlap_chars)
+        passages.append((min(word_starts[first_word], start) if overlap_chars and first_word < len(word_starts) else start, end))
+        
+    # Return the passages
+    return passages
+
+
+def passage_hash(passage_text:str) -> str: 
+    """Returns the hash of the given passage's text, which identifies the passage across versions of its file."""
+    return sha256(passage_text.encode()).hexdigest()
+
+
+def passage_id(file_id:int, passage_no:int) -> int: 
+    """Returns the id of the given passage of the given file in the passage index."""
+    return (file_id << PASSAGE_ID_BITS) | passage_no
 
-    # Init an array of filenames to return
-    file_names:list[str] = []
 
-    # Iterate over the index matches and save the filenames
-    for idx in indices[0]:
+def passage_id_range(file_id:int) -> faiss.IDSelectorRange: 
+    """Returns a selector of all the passages of the given file (e.g. to remove them from the passage index)."""
+    return faiss.IDSelectorRange(file_id << PASSAGE_ID_BITS, (file_id + 1) << PASSAGE_ID_BITS)
 
-        # Check if valid index
-        if idx != -1:
 
-            # Get the filename for this index 
-            cursor.execute(f"SELECT file_name FROM file_metadata WHERE id = {idx + 1}")
-            result = cursor.fetchone()
+def passage_index_path(index_bin_path:str) -> str: 
+    """Returns the path of the passage index that goes with the given Faiss index, e.g. "index/faiss_index.all-minilm-l6-v2@1.bin" 
+    -> "index/faiss_index.all-minilm-l6-v2@1.passages.bin"."""
+    root, ext = os.path.splitext(index_bin_path)
+    return f'{root}.passages{ext}'
 
-            # Add result to the list of file names if it exists
-            if result: file_names.append(result[0])
 
-    # Return the populated list of filenames 
-    return file_names
\ No newline at end of file
+def index_version(index_bin_path:str) -> str|None: 
+    """Returns the version of the published index at the given path, or None if there is no index. Indexes are published by 
+    atomically replacing the file (see FilesystemIndexer.save_index()), so every publish gives a new version."""
+    try: 
+        stat:os.stat_result = os.stat(index_bin_path)
+    except FileNotFoundError: 
+        return None
+    return f'{stat.st_ino}-{stat.st_mtime_ns}-{stat.st_size}'
@@ -0,0 +1,54 @@
+import json
+import socket
+import struct
+
+
+# Every message is a 4 byte (big-endian) header length, a JSON header and an optional binary payload of header["payload_bytes"] bytes
+HEADER_LENGTH_FORMAT:str = '>I'
+HEADER_LENGTH_SIZE:int = struct.calcsize(HEADER_LENGTH_FORMAT)
+
+
+def send_message(sock:socket.socket, header:dict, payload:bytes=b'') -> None: 
+    """Sends the given JSON-serializable header and binary payload over the given socket as one message."""
+    
+    # Encode the header (incl. the payload size so the receiver knows how much to read)
+    header_bytes:bytes = json.dumps({**header, 'payload_bytes': len(payload)}).encode('utf-8')
+    
+    # Send it all at once
+    sock.sendall(struct.pack(HEADER_LENGTH_FORMAT, len(header_bytes)) + header_bytes + payload)
+    
+    
+def recv_exactly(sock:socket.socket, n_bytes:int) -> bytes: 
+    """Reads exactly [n_bytes] from the given socket. Raises a ConnectionError if the socket is closed before then."""
+    
+    # Read until there are enough bytes
+    chunks:list[bytes] = []
+    remaining:int = n_bytes
+    while remaining > 0: 
+        chunk:bytes = sock.recv(min(remaining, 1 << 20))
+        if not chunk: raise ConnectionError('Socket closed mid-message.')
+        chunks.append(chunk)
+        remaining -= len(chunk)
+        
+    # Return the bytes
+    return b''.join(chunks)
+
+
+def recv_message(sock:socket.socket) -> tuple[dict, bytes]|None: 
+    """Reads one message (see send_message()) from the given socket. 
+    
+        Returns: 
+            tuple[dict, bytes]|None: the header and payload, or None if the other end closed the connection between messages.
+    """
+    
+    # Read the header length (a clean close between messages is not an error)
+    first:bytes = sock.recv(HEADER_LENGTH_SIZE)
+    if not first: return None
+    length_bytes:bytes = first + recv_exactly(sock, HEADER_LENGTH_SIZE - len(first))
+    
+    # Read the header and the payload
+    header:dict = json.loads(recv_exactly(sock, struct.unpack(HEADER_LENGTH_FORMAT, length_bytes)[0]))
+    payload:bytes = recv_exactly(sock, header.get('payload_bytes', 0))
+    
+    # Return the message
+    return header, payload
@@ -1,7 +1,15 @@
+import re
 import nltk
+import tiktoken
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 
+# Tokenizer that prompt sizes are measured with (the same as OllamaQueryHandler's)
+DIGEST_ENCODING:tiktoken.Encoding = tiktoken.get_encoding('cl100k_base')
+
+# Max tokens of a file's digest (the excerpt of the file that is sent to the LLM when none of its passages matched a query)
+DIGEST_TOKENS:int = 600
+
 # Download nltk dependencies 
 # punkt_tab
 try: nltk.data.find('punkt_tab')
@@ -15,4 +23,38 @@ except LookupError: nltk.download('stopwords'.split('/')[-1])
 def tokenize_no_stopwords(text:str) -> list[str]: 
     """Takes in a text string, tokenizes the text, removes stopwords, and returns
     the list of tokens."""
-    return [word for word in word_tokenize(text) if word.lower() not in stopwords.words('english') and word.isalnum()]
\ No newline at end of file
+    return [word for word in word_tokenize(text) if word.lower() not in stopwords.words('english') and word.isalnum()]
+
+
+def file_digest(text:str, max_tokens:int=DIGEST_TOKENS) -> tuple[str, int]: 
+    """Returns the digest of the given file text, computed once at index time so that searches don't read or tokenize the file: 
+    its lead, with runs of whitespace collapsed, cut to the first [max_tokens] tokens. Returns the digest and its token count."""
+    tokens:list[int] = DIGEST_ENCODING.encode(re.sub(r'\s+', ' ', text).strip())[:max_tokens]
+    return DIGEST_ENCODING.decode(tokens), len(tokens)
+
+
+def allocate_tokens(lengths:list[int], weights:list[float], budget:int) -> list[int]: 
+    """Splits a token budget across pieces of text in proportion to their weights (e.g. their relevance; equal if none are 
+    positive): a piece never gets more than its length, and what it doesn't need is shared by the others. Returns the tokens 
+    allotted to each piece (at most [budget] in total)."""
+    
+    # Init vars 
+    allocation:list[int] = [0] * len(lengths)
+    remaining:set[int] = {i for i, length in enumerate(lengths) if length > 0}
+    weights = [max(weight, 0) for weight in weights]
+    if not any(weights[i] for i in remaining): weights = [1.0] * len(lengths)
+    budget = max(budget, 0)
+    
+    # Give the pieces that fit in their share all of their tokens, until the shares of the others stop growing
+    while remaining: 
+        total_weight:float = sum(weights[i] for i in remaining)
+        fitting:set[int] = {i for i in remaining if total_weight and lengths[i] * total_weight <= budget * weights[i]}
+        if not fitting: break
+        for i in fitting: allocation[i] = lengths[i]
+        budget -= sum(lengths[i] for i in fitting)
+        remaining -= fitting
+        
+    # The others get their (rounded down) share
+    total_weight = sum(weights[i] for i in remaining)
+    for i in remaining: allocation[i] = int(budget * weights[i] / total_weight) if total_weight else 0
+    return allocation
@@ -5,6 +5,10 @@ from pdf2image import convert_from_path
 from PIL import Image 
 
 
+# File extensions that can be read (and therefore indexed)
+SUPPORTED_EXTENSIONS:tuple[str, ...] = ('.pdf', '.docx', '.txt')
+
+
 def read_pdf(file_path:str) -> str:
     """Extracts the text from the given PDF."""
 